@@ -1,17 +1,34 @@
-from .base_provider import AIProvider
-from .ollama_provider import OllamaProvider
-from .gemini_provider import GeminiProvider
-from .openai_provider import OpenAIProvider
-from .anthropic_provider import AnthropicProvider
+from .base_provider import AIProvider, ProviderWrapper, InvalidChoiceError
+from .cache import ResponseCache, CachedProvider
+from .metrics import MetricsRecorder, MetricsProvider, call_context
+from .resilience import ResilientProvider
+from .ratelimit import RateLimiter, RateLimitedProvider
+from .session import ChatSession
+from .json_stream import JsonStreamParser, SchemaError, parse_json
+from .registry import available_providers, provider_class, register_provider
+from .pool import ProviderPool
 
-def get_ai_provider(provider_name: str, model_name: str) -> AIProvider:
-    if provider_name == "ollama":
-        return OllamaProvider(model_name)
-    elif provider_name == "gemini":
-        return GeminiProvider(model_name)
-    elif provider_name == "openai":
-        return OpenAIProvider(model_name)
-    elif provider_name == "anthropic":
-        return AnthropicProvider(model_name)
-    else:
-        raise ValueError(f"Unknown AI provider: {provider_name}")
+# Provider classes are exported lazily: importing the package must not import
+# every SDK, only the one a game actually uses.
+_LAZY_EXPORTS = {
+    "OllamaProvider": "ollama",
+    "GeminiProvider": "gemini",
+    "OpenAIProvider": "openai",
+    "AnthropicProvider": "anthropic",
+    "MockProvider": "mock",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_EXPORTS:
+        return provider_class(_LAZY_EXPORTS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_ai_provider(provider_name: str, model_name: str, **options) -> AIProvider:
+    """
+    Builds the provider registered as `provider_name`. Extra `options` are passed to the
+    provider constructor (e.g. `host`, `keep_alive` or `max_concurrency` for Ollama,
+    `latency` or `failure_rate` for the offline mock).
+    """
+    return provider_class(provider_name)(model_name, **options)
@@ -1,15 +1,68 @@
-import json
 import os
-from anthropic import AsyncAnthropic
-from typing import Dict, Any
-from ai_providers.base_provider import AIProvider
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+from typing import Dict, Any, AsyncIterator, List, Optional
+from ai_providers.base_provider import AIProvider, InvalidChoiceError, choice_schema, match_choice
+from ai_providers.json_stream import parse_json, validate
+from ai_providers.metrics import record_usage
+from ai_providers.pool import http_limits
+
+# The Messages API requires an explicit output limit on every request.
+DEFAULT_MAX_TOKENS = 4096
+JSON_INSTRUCTION = "\n\nResponde SOLAMENTE con un objeto JSON válido."
+# Enough for a forced tool call carrying a single short enum value.
+CHOICE_MAX_TOKENS = 64
+
+
+def _cached_system(system_prompt: str) -> List[Dict[str, Any]]:
+    return [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+
+
+def _cached_messages(messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    # A breakpoint on the last message caches the whole conversation so far;
+    # the next turn reads it back and only pays full price for the new message.
+    last = messages[-1]
+    return [*messages[:-1], {
+        "role": last["role"],
+        "content": [{"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}],
+    }]
+
+
+def _json_tool(schema: Dict[str, Any]) -> Dict[str, Any]:
+    # Forcing a tool call is Anthropic's structured output: the tool input follows the schema.
+    return {
+        "tools": [{"name": "respond", "description": "Records the response in the required format.", "input_schema": schema}],
+        "tool_choice": {"type": "tool", "name": "respond"},
+    }
+
+
+def _record_usage(usage):
+    # input_tokens excludes the tokens written to or read from the prompt cache.
+    cache_read = usage.cache_read_input_tokens or 0
+    record_usage(usage.input_tokens + (usage.cache_creation_input_tokens or 0) + cache_read, usage.output_tokens, cache_read)
+
 
 class AnthropicProvider(AIProvider):
-    def __init__(self, model_name: str):
+    provider_name = "anthropic"
+    api_key_env = "ANTHROPIC_API_KEY"
+    client_options = ("api_key",)
+    deterministic_choices = True
+
+    def __init__(self, model_name: str, api_key: Optional[str] = None, client: Optional[AsyncAnthropic] = None):
         super().__init__(model_name)
-        self.client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self._owns_client = client is None
+        self.client = client or AsyncAnthropic(api_key=api_key or os.getenv(self.api_key_env))
+
+    @classmethod
+    def create_client(cls, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float, api_key: Optional[str] = None) -> AsyncAnthropic:
+        limits = http_limits(DefaultAsyncHttpxClient, max_connections, max_keepalive_connections, keepalive_expiry)
+        return AsyncAnthropic(api_key=api_key or os.getenv(cls.api_key_env), http_client=DefaultAsyncHttpxClient(limits=limits))
+
+    async def aclose(self):
+        if self._owns_client:
+            await self.client.close()
 
     async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        kwargs.setdefault("max_tokens", DEFAULT_MAX_TOKENS)
         response = await self.client.messages.create(
             model=self.model_name,
             system=system_prompt,
@@ -18,25 +71,112 @@ class AnthropicProvider(AIProvider):
             ],
             **kwargs,
         )
+        _record_usage(response.usage)
         return response.content[0].text
 
-    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
-        # Anthropic does not have a direct JSON mode like OpenAI.
-        # We need to instruct the model to output JSON and then parse it.
-        user_prompt_with_json_instruction = f"{user_prompt}\n\nResponde SOLAMENTE con un objeto JSON válido."
+    async def generate_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        if schema is None:
+            # Without a schema there is no tool to force, so the prompt asks for JSON.
+            text = await self.generate_text(system_prompt, user_prompt + JSON_INSTRUCTION, **kwargs)
+            return parse_json(text, "Anthropic")
+        kwargs.setdefault("max_tokens", DEFAULT_MAX_TOKENS)
         response = await self.client.messages.create(
             model=self.model_name,
             system=system_prompt,
             messages=[
-                {"role": "user", "content": user_prompt_with_json_instruction},
+                {"role": "user", "content": user_prompt},
             ],
+            **_json_tool(schema),
             **kwargs,
         )
-        try:
-            return json.loads(response.content[0].text)
-        except json.JSONDecodeError:
-            import re
-            json_match = re.search(r'```json\n(.*)\n```', response.content[0].text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(1))
-            raise ValueError(f"Could not parse JSON from Anthropic response: {response.content[0].text}")
+        _record_usage(response.usage)
+        for block in response.content:
+            if block.type == "tool_use":
+                validate(block.input, schema)
+                return block.input
+        return parse_json("".join(getattr(block, "text", "") for block in response.content), "Anthropic", schema)
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        kwargs.setdefault("max_tokens", DEFAULT_MAX_TOKENS)
+        async with self.client.messages.stream(
+            model=self.model_name,
+            system=system_prompt,
+            messages=[
+                {"role": "user", "content": user_prompt},
+            ],
+            **kwargs,
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            _record_usage((await stream.get_final_message()).usage)
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        if schema is None:
+            async for chunk in self.stream_text(system_prompt, user_prompt + JSON_INSTRUCTION, **kwargs):
+                yield chunk
+            return
+        kwargs.setdefault("max_tokens", DEFAULT_MAX_TOKENS)
+        async with self.client.messages.stream(
+            model=self.model_name,
+            system=system_prompt,
+            messages=[
+                {"role": "user", "content": user_prompt},
+            ],
+            **_json_tool(schema),
+            **kwargs,
+        ) as stream:
+            # The tool input arrives as raw JSON text, chunk by chunk.
+            async for event in stream:
+                if event.type == "input_json" and event.partial_json:
+                    yield event.partial_json
+            _record_usage((await stream.get_final_message()).usage)
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        # Forcing a tool whose only argument is an enum is Anthropic's way of
+        # constraining the output to a closed set of answers.
+        kwargs.setdefault("max_tokens", CHOICE_MAX_TOKENS)
+        kwargs.setdefault("temperature", 0)
+        response = await self.client.messages.create(
+            model=self.model_name,
+            # The narrator asks many questions against the same system prompt,
+            # so it is worth caching even outside a session.
+            system=_cached_system(system_prompt),
+            messages=[
+                {"role": "user", "content": user_prompt},
+            ],
+            tools=[{
+                "name": "answer",
+                "description": "Records the answer, which must be one of the allowed options.",
+                "input_schema": choice_schema(choices),
+            }],
+            tool_choice={"type": "tool", "name": "answer"},
+            **kwargs,
+        )
+        _record_usage(response.usage)
+        for block in response.content:
+            if block.type == "tool_use":
+                return match_choice(str(block.input.get("answer", "")), choices)
+        raise InvalidChoiceError("".join(getattr(block, "text", "") for block in response.content), choices)
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        kwargs.setdefault("max_tokens", DEFAULT_MAX_TOKENS)
+        response = await self.client.messages.create(
+            model=self.model_name,
+            system=_cached_system(system_prompt),
+            messages=_cached_messages(messages),
+            **kwargs,
+        )
+        _record_usage(response.usage)
+        return response.content[0].text
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        kwargs.setdefault("max_tokens", DEFAULT_MAX_TOKENS)
+        async with self.client.messages.stream(
+            model=self.model_name,
+            system=_cached_system(system_prompt),
+            messages=_cached_messages(messages),
+            **kwargs,
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            _record_usage((await stream.get_final_message()).usage)
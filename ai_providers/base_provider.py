@@ -1,7 +1,33 @@
+import json
+import re
+import unicodedata
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from ai_providers.session import ChatSession
+
+
+class InvalidChoiceError(ValueError):
+    """Raised when a model answers something outside the allowed choices."""
+
+    def __init__(self, text: str, choices: List[str]):
+        super().__init__(f"Answer {text!r} is not one of {choices}")
+        self.text = text
+        self.choices = choices
+
 
 class AIProvider(ABC):
+    # Registry name of the provider ("ollama", "gemini", ...), used to tell
+    # providers apart in caches and logs.
+    provider_name: str = ""
+    # Environment variable holding the API key, and the constructor options that
+    # configure the SDK client. Providers whose credentials and client options
+    # match can share one client (see `ProviderPool`).
+    api_key_env: Optional[str] = None
+    client_options: Tuple[str, ...] = ()
+    # Whether `generate_choice` samples at temperature 0 when no temperature is
+    # passed, which makes its answers safe to cache as deterministic.
+    deterministic_choices: bool = False
+
     def __init__(self, model_name: str):
         self.model_name = model_name
 
@@ -13,8 +39,137 @@ class AIProvider(ABC):
         pass
 
     @abstractmethod
-    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+    async def generate_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Generates JSON output based on the given system and user prompts. With a
+        JSON `schema`, providers constrain the output with their native
+        structured output, and the result is validated against it.
+        """
+        pass
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        """
+        Yields the generated text in chunks as the model produces it.
+        Providers without native streaming yield the whole response at once.
+        """
+        yield await self.generate_text(system_prompt, user_prompt, **kwargs)
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        Yields the raw JSON text in chunks as the model produces it, constrained
+        to `schema` like `generate_json`. Feed the chunks to a `JsonStreamParser`.
+        """
+        yield json.dumps(await self.generate_json(system_prompt, user_prompt, schema=schema, **kwargs), ensure_ascii=False)
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        """
+        Returns exactly one of `choices`, spending as few output tokens as possible.
+        Providers constrain the output natively (enum schemas, tool use); this
+        fallback matches free text and raises InvalidChoiceError when it can't.
+        """
+        text = await self.generate_text(system_prompt, user_prompt, **kwargs)
+        return match_choice(text, choices)
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        """
+        Generates the next assistant message of a conversation (`role`/`content`
+        dicts, oldest first). Providers without native multi-turn support get
+        the history flattened into a single user prompt. `cache_key` identifies
+        the conversation for providers that route prompt caching by key.
+        """
+        return await self.generate_text(system_prompt, render_messages(messages), **kwargs)
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """Like `chat`, but yields the reply in chunks."""
+        async for chunk in self.stream_text(system_prompt, render_messages(messages), **kwargs):
+            yield chunk
+
+    def session(self, system_prompt: str, **kwargs) -> ChatSession:
+        """Starts a multi-turn conversation that only sends the new turn's tokens uncached."""
+        return ChatSession(self, system_prompt, **kwargs)
+
+    @classmethod
+    def create_client(cls, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float, **client_options) -> Any:
         """
-        Generates JSON output based on the given system and user prompts.
+        Builds an SDK client with the given connection limits, to be passed to
+        the constructor as `client=` by every provider that shares it. Returns
+        None when the provider has no client worth sharing.
         """
+        return None
+
+    async def aclose(self):
+        """Closes the connections of the client this provider created itself. Shared clients are closed by their pool."""
         pass
+
+
+class ProviderWrapper(AIProvider):
+    """
+    Base class for providers that add behaviour (caching, metrics, ...) around
+    another provider. Every call is delegated to `inner` unless overridden.
+    """
+
+    def __init__(self, inner: AIProvider):
+        super().__init__(inner.model_name)
+        self.inner = inner
+        self.provider_name = inner.provider_name
+        self.deterministic_choices = inner.deterministic_choices
+
+    async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        return await self.inner.generate_text(system_prompt, user_prompt, **kwargs)
+
+    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        return await self.inner.generate_json(system_prompt, user_prompt, **kwargs)
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.inner.stream_text(system_prompt, user_prompt, **kwargs):
+            yield chunk
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.inner.stream_json(system_prompt, user_prompt, **kwargs):
+            yield chunk
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        return await self.inner.generate_choice(system_prompt, user_prompt, choices, **kwargs)
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        return await self.inner.chat(system_prompt, messages, cache_key=cache_key, **kwargs)
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.inner.stream_chat(system_prompt, messages, cache_key=cache_key, **kwargs):
+            yield chunk
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def render_messages(messages: List[Dict[str, str]]) -> str:
+    """Flattens a conversation into a single prompt for providers without multi-turn support."""
+    return "\n\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+def _normalize_choice(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def match_choice(text: str, choices: List[str]) -> str:
+    """
+    Maps a model answer to one of `choices`, ignoring case, accents, quotes and
+    punctuation (so "Sí." matches "sí"). Raises InvalidChoiceError otherwise.
+    """
+    normalized = _normalize_choice(text)
+    for choice in choices:
+        if _normalize_choice(choice) == normalized:
+            return choice
+    raise InvalidChoiceError(text, choices)
+
+
+def choice_schema(choices: List[str]) -> Dict[str, Any]:
+    """JSON schema of an object whose only field, `answer`, is one of `choices`."""
+    return {
+        "type": "object",
+        "properties": {"answer": {"type": "string", "enum": list(choices)}},
+        "required": ["answer"],
+        "additionalProperties": False,
+    }
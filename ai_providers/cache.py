@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from typing import Dict, Any, AsyncIterator, List, Optional
+from ai_providers.base_provider import AIProvider, ProviderWrapper
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _temperature(kwargs: Dict[str, Any]) -> Optional[float]:
+    # Each SDK takes the temperature in a different place: top-level for OpenAI
+    # and Anthropic, `options` for Ollama and `generation_config` for Gemini.
+    for container in (kwargs, kwargs.get("options"), kwargs.get("generation_config")):
+        if isinstance(container, dict) and "temperature" in container:
+            return container["temperature"]
+        if container is not None and getattr(container, "temperature", None) is not None:
+            return container.temperature
+    return None
+
+
+class ResponseCache:
+    """
+    Content-addressed store of model responses in a SQLite file.
+
+    Entries are evicted least-recently-used first once the stored responses
+    exceed `max_bytes`. One cache can be shared by several providers, since the
+    provider and model are part of every key.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=repr)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, value, size, time.time()),
+        )
+        self._size += size - (old[0] if old else 0)
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            oldest = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if self._size <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+
+    def close(self):
+        self._db.close()
+
+
+class CachedProvider(ProviderWrapper):
+    """
+    Serves repeated calls from a `ResponseCache` instead of the wrapped provider.
+
+    The key covers the call type, provider, model, both prompts and the generation
+    kwargs. Only calls made with temperature 0 are cached unless `sampled` is
+    set; `generate_choice` counts as deterministic when no temperature is
+    passed and the provider samples choices at temperature 0 by default
+    (`deterministic_choices`).
+
+    Sampled calls also carry a sample index in their key: the n-th identical
+    call in a process gets the n-th stored sample. A batch then plays
+    different games instead of replaying the first one, and running the same
+    batch again replays them all.
+    Streams are replayed as a single chunk and stored only once complete.
+    """
+
+    def __init__(self, inner: AIProvider, cache: ResponseCache, sampled: bool = False):
+        super().__init__(inner)
+        self.cache = cache
+        self.sampled = sampled
+        self._samples: Counter = Counter()
+
+    def _key(self, method: str, system_prompt: str, user_prompt: str, kwargs: Dict[str, Any], default_temperature: Optional[float] = None) -> Optional[str]:
+        temperature = _temperature(kwargs)
+        deterministic = (default_temperature if temperature is None else temperature) == 0
+        if not deterministic and not self.sampled:
+            return None
+        key = ResponseCache.make_key(method, self.provider_name, self.model_name, system_prompt, user_prompt, kwargs)
+        if deterministic:
+            return key
+        sample = self._samples[key]
+        self._samples[key] += 1
+        return ResponseCache.make_key(key, sample)
+
+    async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        key = self._key("text", system_prompt, user_prompt, kwargs)
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            return cached
+        text = await self.inner.generate_text(system_prompt, user_prompt, **kwargs)
+        if key:
+            self.cache.put(key, text)
+        return text
+
+    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        key = self._key("json", system_prompt, user_prompt, kwargs)
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            return json.loads(cached)
+        result = await self.inner.generate_json(system_prompt, user_prompt, **kwargs)
+        if key:
+            self.cache.put(key, json.dumps(result, ensure_ascii=False))
+        return result
+
+    async def _cached_stream(self, stream: AsyncIterator[str], key: Optional[str]) -> AsyncIterator[str]:
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        if key:
+            self.cache.put(key, "".join(chunks))
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        # Streamed and non-streamed text share keys: both produce the same text.
+        key = self._key("text", system_prompt, user_prompt, kwargs)
+        async for chunk in self._cached_stream(self.inner.stream_text(system_prompt, user_prompt, **kwargs), key):
+            yield chunk
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        key = self._key("json_text", system_prompt, user_prompt, kwargs)
+        async for chunk in self._cached_stream(self.inner.stream_json(system_prompt, user_prompt, **kwargs), key):
+            yield chunk
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        default_temperature = 0 if self.deterministic_choices else None
+        key = self._key("choice", system_prompt, user_prompt, {**kwargs, "choices": choices}, default_temperature=default_temperature)
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            return cached
+        choice = await self.inner.generate_choice(system_prompt, user_prompt, choices, **kwargs)
+        if key:
+            self.cache.put(key, choice)
+        return choice
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        # The conversation key is only a routing hint, so it is left out of the cache key.
+        key = self._key("text", system_prompt, json.dumps(messages, ensure_ascii=False), kwargs)
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            return cached
+        text = await self.inner.chat(system_prompt, messages, cache_key=cache_key, **kwargs)
+        if key:
+            self.cache.put(key, text)
+        return text
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        key = self._key("text", system_prompt, json.dumps(messages, ensure_ascii=False), kwargs)
+        async for chunk in self._cached_stream(self.inner.stream_chat(system_prompt, messages, cache_key=cache_key, **kwargs), key):
+            yield chunk
@@ -1,13 +1,57 @@
-import json
 import google.generativeai as genai
 import os
-from typing import Dict, Any
-from ai_providers.base_provider import AIProvider
+from typing import Dict, Any, AsyncIterator, List, Optional
+from ai_providers.base_provider import AIProvider, match_choice
+from ai_providers.json_stream import parse_json
+from ai_providers.metrics import record_usage
+
+# genai.configure sets process-wide state, so it is only called again when the key changes.
+_configured_api_key: Optional[str] = None
+
+# Thinking models spend part of max_output_tokens before answering, so the cap
+# leaves room for that instead of fitting the enum value alone.
+CHOICE_MAX_TOKENS = 256
+
+
+def _contents(messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    return [
+        {"role": "model" if message["role"] == "assistant" else "user", "parts": [message["content"]]}
+        for message in messages
+    ]
+
+
+def _response_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    # Gemini takes an OpenAPI subset of JSON schema without `additionalProperties`.
+    if isinstance(schema, dict):
+        return {key: _response_schema(value) for key, value in schema.items() if key != "additionalProperties"}
+    return schema
+
+
+def _json_config(schema: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    generation_config = {**kwargs.get('generation_config', {}), "response_mime_type": "application/json"}
+    if schema is not None:
+        generation_config["response_schema"] = _response_schema(schema)
+    return generation_config
+
+
+def _record_usage(usage_metadata):
+    if usage_metadata:
+        record_usage(usage_metadata.prompt_token_count, usage_metadata.candidates_token_count, usage_metadata.cached_content_token_count)
+
 
 class GeminiProvider(AIProvider):
-    def __init__(self, model_name: str):
+    provider_name = "gemini"
+    api_key_env = "GOOGLE_API_KEY"
+    deterministic_choices = True
+
+    def __init__(self, model_name: str, api_key: Optional[str] = None):
+        global _configured_api_key
         super().__init__(model_name)
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        # The SDK keeps a single global client, which all models and games share anyway.
+        api_key = api_key or os.getenv(self.api_key_env)
+        if api_key != _configured_api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
         self.client = genai.GenerativeModel(model_name)
 
     async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
@@ -20,24 +64,83 @@ class GeminiProvider(AIProvider):
             generation_config=kwargs.get('generation_config', {}),
             safety_settings=kwargs.get('safety_settings', {}),
         )
+        _record_usage(response.usage_metadata)
         return response.text
 
-    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+    async def generate_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        full_prompt = f"{system_prompt}\n\n{user_prompt}"
+        response = await self.client.generate_content_async(
+            full_prompt,
+            generation_config=_json_config(schema, kwargs),
+            safety_settings=kwargs.get('safety_settings', {}),
+        )
+        _record_usage(response.usage_metadata)
+        return parse_json(response.text, "Gemini", schema)
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
         full_prompt = f"{system_prompt}\n\n{user_prompt}"
         response = await self.client.generate_content_async(
             full_prompt,
             generation_config=kwargs.get('generation_config', {}),
             safety_settings=kwargs.get('safety_settings', {}),
+            stream=True,
+        )
+        usage_metadata = None
+        async for chunk in response:
+            # The last chunk may only carry the finish reason and no text parts.
+            if chunk.parts:
+                yield chunk.text
+            # Every chunk carries the running totals, so the last one has the whole call.
+            usage_metadata = chunk.usage_metadata
+        _record_usage(usage_metadata)
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.stream_text(system_prompt, user_prompt, **{**kwargs, "generation_config": _json_config(schema, kwargs)}):
+            yield chunk
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        full_prompt = f"{system_prompt}\n\n{user_prompt}"
+        generation_config = {
+            "temperature": 0,
+            "max_output_tokens": CHOICE_MAX_TOKENS,
+            **kwargs.get('generation_config', {}),
+            # Enum mode makes the model answer with exactly one of the values.
+            "response_mime_type": "text/x.enum",
+            "response_schema": {"type": "string", "enum": list(choices)},
+        }
+        response = await self.client.generate_content_async(
+            full_prompt,
+            generation_config=generation_config,
+            safety_settings=kwargs.get('safety_settings', {}),
+        )
+        _record_usage(response.usage_metadata)
+        return match_choice(response.text, choices)
+
+    def _session_model(self, system_prompt: str) -> genai.GenerativeModel:
+        # In a conversation the system prompt goes in system_instruction, ahead of
+        # the history, so consecutive turns share a prefix that Gemini's implicit
+        # cache can reuse. Building the model is local and cheap.
+        return genai.GenerativeModel(self.model_name, system_instruction=system_prompt)
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        response = await self._session_model(system_prompt).generate_content_async(
+            _contents(messages),
+            generation_config=kwargs.get('generation_config', {}),
+            safety_settings=kwargs.get('safety_settings', {}),
+        )
+        _record_usage(response.usage_metadata)
+        return response.text
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        response = await self._session_model(system_prompt).generate_content_async(
+            _contents(messages),
+            generation_config=kwargs.get('generation_config', {}),
+            safety_settings=kwargs.get('safety_settings', {}),
+            stream=True,
         )
-        # Attempt to parse the response as JSON. Gemini might not strictly adhere to JSON format
-        # if not explicitly prompted for it, so robust parsing is needed.
-        try:
-            return json.loads(response.text)
-        except json.JSONDecodeError:
-            # If direct parsing fails, try to extract JSON from a larger text block
-            # This is a common workaround for models that don't strictly output JSON
-            import re
-            json_match = re.search(r'```json\n(.*)\n```', response.text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(1))
-            raise ValueError(f"Could not parse JSON from Gemini response: {response.text}")
+        usage_metadata = None
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+            usage_metadata = chunk.usage_metadata
+        _record_usage(usage_metadata)
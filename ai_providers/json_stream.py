@@ -0,0 +1,234 @@
+import json
+import re
+from typing import Dict, Any, List, Optional
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_WHITESPACE = " \t\r\n"
+
+
+class SchemaError(ValueError):
+    """Raised when a model's JSON is missing fields or has values of the wrong type."""
+
+
+def validate(value: Any, schema: Dict[str, Any], path: str = "$"):
+    """
+    Checks `value` against the subset of JSON schema the providers' structured
+    outputs share: `type`, `enum`, `properties`, `required` and `items`.
+    Extra object keys are tolerated; callers pick the fields they need.
+    """
+    expected = schema.get("type")
+    if expected in _TYPES and (not isinstance(value, _TYPES[expected]) or (isinstance(value, bool) and expected != "boolean")):
+        raise SchemaError(f"{path} should be of type {expected}, got {type(value).__name__}")
+    if "enum" in schema and value not in schema["enum"]:
+        raise SchemaError(f"{path} should be one of {schema['enum']}, got {value!r}")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                raise SchemaError(f"{path} is missing required field {key!r}")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                validate(value[key], subschema, f"{path}.{key}")
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            validate(item, schema["items"], f"{path}[{i}]")
+
+
+def _loads(text: str) -> Any:
+    # strict=False accepts raw newlines inside strings, a common slip in model output.
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text), strict=False)
+
+
+class JsonStreamParser:
+    """
+    Parses a JSON object from a model response as its chunks arrive.
+
+    Anything before the first `{` (prose, a ```json fence) and after the
+    object closes is ignored. Each top-level value is decoded as soon as it is
+    complete and checked against `schema`, so a response going wrong can be
+    abandoned before paying for the rest of it; `partial()` also shows the
+    string being received. The scanner tolerates trailing commas and raw
+    newlines in strings, and a response cut off mid-object still yields the
+    fields that did arrive. Each character is scanned once.
+    """
+
+    def __init__(self, schema: Optional[Dict[str, Any]] = None):
+        self.schema = schema
+        self.text = ""
+        self.values: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self._position = 0
+        self._start: Optional[int] = None
+        self._closed = False
+        # One [kind, state] per open container; state is what comes next:
+        # "key", "colon", "value" or "after" (a comma or the closing bracket).
+        self._stack: List[List[str]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._literal_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        return self._closed
+
+    def feed(self, chunk: str):
+        """Adds the next chunk. Raises SchemaError as soon as a complete value contradicts the schema."""
+        self.text += chunk
+        while self._position < len(self.text) and not self._closed and self.error is None:
+            self._step(self.text[self._position], self._position)
+            self._position += 1
+
+    def partial(self) -> Dict[str, Any]:
+        """The top-level fields received so far, including the string still arriving, if any."""
+        if not (self._in_string and not self._string_is_key and len(self._stack) == 1 and self._key is not None):
+            return dict(self.values)
+        text = self.text[self._string_start:]
+        # Drop an escape sequence cut in half by the chunk boundary.
+        for cut in range(min(6, len(text)) + 1):
+            try:
+                return {**self.values, self._key: json.loads(text[:len(text) - cut] + '"', strict=False)}
+            except json.JSONDecodeError:
+                continue
+        return dict(self.values)
+
+    def result(self) -> Dict[str, Any]:
+        """The parsed object. Raises ValueError if there is none and SchemaError if it doesn't match the schema."""
+        if self._start is None:
+            raise ValueError(f"No JSON object in model response: {self.text}")
+        if self._closed and self.error is None:
+            try:
+                value = _loads(self.text[self._start:self._position])
+            except json.JSONDecodeError:
+                value = dict(self.values)
+        else:
+            value = dict(self.values)
+        if self.schema is not None:
+            validate(value, self.schema)
+        return value
+
+    def _step(self, c: str, i: int):
+        if self._start is None:
+            if c == "{":
+                self._start = i
+                self._stack.append(["{", "key"])
+            return
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == "\\":
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                self._end_string(i + 1)
+            return
+        if self._literal_start is not None:
+            if c not in ",}]" + _WHITESPACE:
+                return
+            self._literal_start = None
+            self._end_value(i)
+        if c in _WHITESPACE:
+            return
+        top = self._stack[-1]
+        kind, state = top
+        if state == "key":
+            if c == '"':
+                self._begin_string(i, is_key=True)
+            elif c == "}":
+                self._close(i)
+            else:
+                self._fail(c, i)
+        elif state == "colon":
+            if c == ":":
+                top[1] = "value"
+            else:
+                self._fail(c, i)
+        elif state == "value":
+            if c == "]" and kind == "[":
+                self._close(i)
+                return
+            if len(self._stack) == 1:
+                self._value_start = i
+            if c == '"':
+                self._begin_string(i, is_key=False)
+            elif c in "{[":
+                top[1] = "after"
+                self._stack.append([c, "key" if c == "{" else "value"])
+            elif c in "-0123456789tfn":
+                self._literal_start = i
+            else:
+                self._fail(c, i)
+        elif c == ",":
+            top[1] = "key" if kind == "{" else "value"
+        elif c == ("}" if kind == "{" else "]"):
+            self._close(i)
+        else:
+            self._fail(c, i)
+
+    def _begin_string(self, i: int, is_key: bool):
+        self._in_string = True
+        self._string_start = i
+        self._string_is_key = is_key
+
+    def _end_string(self, end: int):
+        if self._string_is_key:
+            if len(self._stack) == 1:
+                self._key = json.loads(self.text[self._string_start:end], strict=False)
+            self._stack[-1][1] = "colon"
+        else:
+            self._end_value(end)
+
+    def _close(self, i: int):
+        self._stack.pop()
+        if not self._stack:
+            self._closed = True
+            return
+        self._end_value(i + 1)
+
+    def _end_value(self, end: int):
+        self._stack[-1][1] = "after"
+        if len(self._stack) != 1 or self._value_start is None:
+            return
+        start, self._value_start = self._value_start, None
+        try:
+            value = _loads(self.text[start:end])
+        except json.JSONDecodeError:
+            self.error = f"Invalid value for {self._key!r}: {self.text[start:end]}"
+            return
+        self.values[self._key] = value
+        subschema = (self.schema or {}).get("properties", {}).get(self._key)
+        if subschema is not None:
+            validate(value, subschema, f"$.{self._key}")
+
+    def _fail(self, c: str, i: int):
+        # Stop scanning; result() still returns the fields decoded so far.
+        self.error = f"Unexpected {c!r} at position {i - self._start} of the JSON object"
+
+
+def parse_json(text: str, source: str = "model", schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Parses and validates the JSON object in a complete model response, with the
+    same tolerance as `JsonStreamParser`: surrounding prose or code fences,
+    trailing commas, raw newlines and a truncated end.
+    """
+    parser = JsonStreamParser(schema)
+    parser.feed(text)
+    try:
+        return parser.result()
+    except SchemaError:
+        raise
+    except ValueError:
+        raise ValueError(f"Could not parse JSON from {source} response: {text}")
@@ -0,0 +1,271 @@
+import contextlib
+import contextvars
+import json
+import os
+import time
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Tuple
+from ai_providers.base_provider import AIProvider, ProviderWrapper
+
+# USD per million input and output tokens. Models are matched by the longest
+# prefix, so dated snapshots (e.g. "gpt-4o-2024-08-06") use their family price.
+# Models not listed here are recorded without a cost; local Ollama models and the
+# offline mock are free.
+PRICES: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ("openai", "gpt-4o-mini"): (0.15, 0.60),
+    ("openai", "gpt-4o"): (2.50, 10.00),
+    ("openai", "gpt-4.1-nano"): (0.10, 0.40),
+    ("openai", "gpt-4.1-mini"): (0.40, 1.60),
+    ("openai", "gpt-4.1"): (2.00, 8.00),
+    ("openai", "o4-mini"): (1.10, 4.40),
+    ("anthropic", "claude-3-haiku"): (0.25, 1.25),
+    ("anthropic", "claude-3-5-haiku"): (0.80, 4.00),
+    ("anthropic", "claude-3-5-sonnet"): (3.00, 15.00),
+    ("anthropic", "claude-3-7-sonnet"): (3.00, 15.00),
+    ("anthropic", "claude-sonnet-4"): (3.00, 15.00),
+    ("anthropic", "claude-opus-4"): (15.00, 75.00),
+    ("gemini", "gemini-1.5-flash"): (0.075, 0.30),
+    ("gemini", "gemini-1.5-pro"): (1.25, 5.00),
+    ("gemini", "gemini-2.0-flash"): (0.10, 0.40),
+    ("gemini", "gemini-2.5-flash"): (0.30, 2.50),
+    ("gemini", "gemini-2.5-pro"): (1.25, 10.00),
+}
+
+_labels: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("call_labels", default={})
+_current: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("current_call", default=None)
+_tracked: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar("tracked_usage", default=None)
+
+
+@contextlib.contextmanager
+def call_context(**labels) -> Iterator[None]:
+    """Labels every provider call made inside the block (e.g. role, phase, game)."""
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels() -> Dict[str, Any]:
+    """The labels of the active `call_context`."""
+    return _labels.get()
+
+
+@contextlib.contextmanager
+def track_usage(usage: Dict[str, int]) -> Iterator[Dict[str, int]]:
+    """
+    Also adds the tokens reported inside the block to `usage` (with
+    `input_tokens` and `output_tokens` keys). The innermost block wins, so a
+    backup provider's tokens are not counted against the primary's.
+    """
+    token = _tracked.set(usage)
+    try:
+        yield usage
+    finally:
+        _tracked.reset(token)
+
+
+def record_usage(input_tokens: Optional[int] = None, output_tokens: Optional[int] = None, cached_tokens: Optional[int] = None):
+    """Called by providers with the token counts reported by their API."""
+    tracked = _tracked.get()
+    if tracked is not None:
+        tracked["input_tokens"] += input_tokens or 0
+        tracked["output_tokens"] += output_tokens or 0
+    record = _current.get()
+    if record is None:
+        return
+    for field, value in (("input_tokens", input_tokens), ("output_tokens", output_tokens), ("cached_tokens", cached_tokens)):
+        if value:
+            record[field] += value
+
+
+def record_queue_time(seconds: float):
+    """Called by schedulers with the time the current call waited for its turn."""
+    record = _current.get()
+    if record is not None:
+        record["queue_time"] += seconds
+
+
+def record_retry():
+    """Called by retry layers each time the current call is attempted again."""
+    record = _current.get()
+    if record is not None:
+        record["retries"] += 1
+
+
+def price(provider_name: str, model_name: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    if provider_name in ("ollama", "mock"):
+        return 0.0
+    matches = [key for key in PRICES if key[0] == provider_name and model_name.startswith(key[1])]
+    if not matches:
+        return None
+    input_price, output_price = PRICES[max(matches, key=lambda key: len(key[1]))]
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class MetricsRecorder:
+    """
+    Collects one record per provider call and, with `path`, appends each of them
+    to a JSONL file as soon as the call ends.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.records: List[Dict[str, Any]] = []
+        self._file = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def add(self, record: Dict[str, Any]):
+        self.records.append(record)
+        if self._file is not None:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def for_game(self, game: str) -> List[Dict[str, Any]]:
+        return [record for record in self.records if record.get("game") == game]
+
+    def discard_game(self, game: str):
+        """Drops a finished game's records, so a long-running process doesn't keep every call in memory."""
+        self.records = [record for record in self.records if record.get("game") != game]
+
+    def summary(self, keys: Tuple[str, ...] = ("role", "phase", "provider", "model")) -> List[Dict[str, Any]]:
+        """Aggregates the records by `keys`, slowest group first."""
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for record in self.records:
+            groups.setdefault(tuple(record.get(key) for key in keys), []).append(record)
+        rows = []
+        for group_key, records in groups.items():
+            durations = [record["duration"] for record in records]
+            ttfts = [record["ttft"] for record in records if record["ttft"] is not None]
+            costs = [record["cost"] for record in records if record["cost"] is not None]
+            rows.append({
+                **dict(zip(keys, group_key)),
+                "calls": len(records),
+                # Cancelled calls (e.g. discarded speculative branches) are not failures.
+                "errors": sum(1 for record in records if record["error"] and record["error"] != "CancelledError"),
+                "cancelled": sum(1 for record in records if record["error"] == "CancelledError"),
+                "retries": sum(record["retries"] for record in records),
+                "queue_time": sum(record.get("queue_time", 0.0) for record in records),
+                "total_time": sum(durations),
+                "mean_time": sum(durations) / len(durations),
+                "p95_time": _percentile(durations, 0.95),
+                "mean_ttft": sum(ttfts) / len(ttfts) if ttfts else None,
+                "input_tokens": sum(record["input_tokens"] for record in records),
+                "output_tokens": sum(record["output_tokens"] for record in records),
+                "cached_tokens": sum(record["cached_tokens"] for record in records),
+                "cost": sum(costs) if costs else None,
+            })
+        return sorted(rows, key=lambda row: row["total_time"], reverse=True)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class MetricsProvider(ProviderWrapper):
+    """
+    Records wall time, time to first token, token usage, retries and cost of
+    every call to the wrapped provider, labelled with the active `call_context`.
+    Token counts come from the providers through `record_usage`, so calls
+    served from a cache record the time it took and no tokens.
+    """
+
+    def __init__(self, inner: AIProvider, recorder: MetricsRecorder):
+        super().__init__(inner)
+        self.recorder = recorder
+
+    def _start(self, method: str) -> Dict[str, Any]:
+        return {
+            **_labels.get(),
+            "method": method,
+            "provider": self.provider_name,
+            "model": self.model_name,
+            "start": time.time(),
+            "duration": 0.0,
+            "ttft": None,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cached_tokens": 0,
+            "retries": 0,
+            "queue_time": 0.0,
+            "cost": None,
+            "error": None,
+        }
+
+    def _finish(self, record: Dict[str, Any], started: float, error: Optional[BaseException] = None):
+        record["duration"] = time.perf_counter() - started
+        if error is not None:
+            record["error"] = type(error).__name__
+        record["cost"] = price(self.provider_name, self.model_name, record["input_tokens"], record["output_tokens"])
+        self.recorder.add(record)
+
+    async def _measure(self, method: str, call):
+        record = self._start(method)
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            result = await call()
+        except BaseException as e:
+            self._finish(record, started, e)
+            raise
+        finally:
+            _current.reset(token)
+        self._finish(record, started)
+        return result
+
+    async def _measure_stream(self, method: str, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        record = self._start(method)
+        started = time.perf_counter()
+        error = None
+        try:
+            while True:
+                # The inner stream runs between our yields, so the record is set
+                # around each step rather than for the whole generator.
+                previous = _current.get()
+                _current.set(record)
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    _current.set(previous)
+                if record["ttft"] is None:
+                    record["ttft"] = time.perf_counter() - started
+                yield chunk
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(record, started, error)
+
+    async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        return await self._measure("generate_text", lambda: self.inner.generate_text(system_prompt, user_prompt, **kwargs))
+
+    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        return await self._measure("generate_json", lambda: self.inner.generate_json(system_prompt, user_prompt, **kwargs))
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._measure_stream("stream_text", self.inner.stream_text(system_prompt, user_prompt, **kwargs)):
+            yield chunk
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._measure_stream("stream_json", self.inner.stream_json(system_prompt, user_prompt, **kwargs)):
+            yield chunk
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        return await self._measure("generate_choice", lambda: self.inner.generate_choice(system_prompt, user_prompt, choices, **kwargs))
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        return await self._measure("chat", lambda: self.inner.chat(system_prompt, messages, cache_key=cache_key, **kwargs))
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._measure_stream("stream_chat", self.inner.stream_chat(system_prompt, messages, cache_key=cache_key, **kwargs)):
+            yield chunk
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import random
+from typing import Dict, Any, AsyncIterator, List, Optional
+from ai_providers.base_provider import AIProvider, render_messages
+from ai_providers.metrics import record_usage
+from game_prompts import PREFIJO_SOLUCION
+
+WORDS = [
+    "hombre", "mujer", "faro", "barco", "nieve", "ascensor", "violín", "desierto", "isla", "llave",
+    "tren", "campo", "espejo", "reloj", "carta", "veneno", "puerta", "sombra", "lluvia", "máscara",
+]
+# The game's prefix for declaring a solution mid-game.
+SOLUTION_PREFIX = PREFIJO_SOLUCION
+
+
+class MockError(Exception):
+    """Injected failure. Carries an HTTP-like `status_code` so retry layers treat it like a real one."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Injected failure (HTTP {status_code})")
+        self.status_code = status_code
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class MockProvider(AIProvider):
+    """
+    Offline provider that plays both roles with scripted answers, for testing
+    and benchmarking the orchestration without API keys, network or cost.
+
+    Latency follows a log-normal distribution with median `latency` and shape
+    `latency_sigma` (seconds); streams deliver `output_tokens` words, the first
+    after that latency and the rest every `chunk_interval` seconds. A fraction
+    `failure_rate` of calls raises `MockError` with `failure_status`. When the
+    prompt allows declaring a solution, a fraction `solve_rate` of the answers
+    do so instead of asking. Given a `seed`, the answers are reproducible. Each option falls back to a
+    `MOCK_*` environment variable.
+    """
+
+    provider_name = "mock"
+
+    def __init__(
+        self,
+        model_name: str,
+        latency: Optional[float] = None,
+        latency_sigma: Optional[float] = None,
+        chunk_interval: Optional[float] = None,
+        output_tokens: Optional[int] = None,
+        failure_rate: Optional[float] = None,
+        failure_status: int = 503,
+        seed: Optional[int] = None,
+        solve_rate: Optional[float] = None,
+    ):
+        super().__init__(model_name)
+        self.latency = latency if latency is not None else _env_float("MOCK_LATENCY", 0.0)
+        self.latency_sigma = latency_sigma if latency_sigma is not None else _env_float("MOCK_LATENCY_SIGMA", 0.5)
+        self.chunk_interval = chunk_interval if chunk_interval is not None else _env_float("MOCK_CHUNK_INTERVAL", 0.0)
+        self.output_tokens = output_tokens if output_tokens is not None else int(_env_float("MOCK_OUTPUT_TOKENS", 12))
+        self.failure_rate = failure_rate if failure_rate is not None else _env_float("MOCK_FAILURE_RATE", 0.0)
+        self.failure_status = failure_status
+        self.solve_rate = solve_rate if solve_rate is not None else _env_float("MOCK_SOLVE_RATE", 0.1)
+        if seed is None and os.getenv("MOCK_SEED"):
+            seed = int(os.environ["MOCK_SEED"])
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    async def _wait(self, prompt: str):
+        """Waits the sampled latency, may inject a failure and reports the token usage."""
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.random.lognormvariate(0, self.latency_sigma) * self.latency)
+        else:
+            await asyncio.sleep(0)
+        if self.random.random() < self.failure_rate:
+            raise MockError(self.failure_status)
+        # Roughly four characters per token, like the real tokenizers.
+        record_usage(len(prompt) // 4 + 1, self.output_tokens)
+
+    def _words(self, count: int) -> List[str]:
+        return [self.random.choice(WORDS) for _ in range(count)]
+
+    def _text(self, prompt: str) -> str:
+        if SOLUTION_PREFIX in prompt and self.random.random() < self.solve_rate:
+            return f"{SOLUTION_PREFIX} " + " ".join(self._words(self.output_tokens)).capitalize() + "."
+        return "¿" + " ".join(self._words(self.output_tokens)).capitalize() + "?"
+
+    def _mystery(self) -> Dict[str, str]:
+        return {"enigma": " ".join(self._words(self.output_tokens * 2)).capitalize() + ".", "solucion": " ".join(self._words(self.output_tokens)).capitalize() + "."}
+
+    async def _stream(self, prompt: str, text: str) -> AsyncIterator[str]:
+        await self._wait(prompt)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.chunk_interval)
+            yield word if i == len(words) - 1 else word + " "
+
+    async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        await self._wait(system_prompt + user_prompt)
+        return self._text(system_prompt + user_prompt)
+
+    async def generate_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        await self._wait(system_prompt + user_prompt)
+        return self._mystery()
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._stream(system_prompt + user_prompt, self._text(system_prompt + user_prompt)):
+            yield chunk
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._stream(system_prompt + user_prompt, json.dumps(self._mystery(), ensure_ascii=False)):
+            yield chunk
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        await self._wait(system_prompt + user_prompt)
+        return self.random.choice(choices)
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        return await self.generate_text(system_prompt, render_messages(messages))
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.stream_text(system_prompt, render_messages(messages)):
+            yield chunk
@@ -1,28 +1,124 @@
+import asyncio
 import json
-import ollama
-from typing import Dict, Any
-from ai_providers.base_provider import AIProvider
+import os
+import httpx
+from ollama import AsyncClient
+from typing import Dict, Any, AsyncIterator, List, Optional, Union
+from ai_providers.base_provider import AIProvider, choice_schema, match_choice
+from ai_providers.json_stream import parse_json
+from ai_providers.metrics import record_usage
+
+DEFAULT_MAX_CONCURRENCY = 4
+# A {"answer": ...} object with the longest choice fits comfortably in this budget.
+CHOICE_MAX_TOKENS = 32
+
+
+def _parse_keep_alive(value: Optional[Union[str, float]]) -> Optional[Union[str, float]]:
+    # Ollama accepts either a number of seconds or a duration string such as "10m".
+    # Plain numbers coming from the environment or the CLI are sent as numbers,
+    # because the server rejects duration strings without a unit (e.g. "-1").
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
 
 class OllamaProvider(AIProvider):
-    async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
-        response = ollama.chat(
-            model=self.model_name,
-            messages=[
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_prompt},
-            ],
-            options=kwargs.get('options', {}),
+    provider_name = "ollama"
+    client_options = ("host",)
+    deterministic_choices = True
+
+    def __init__(
+        self,
+        model_name: str,
+        host: Optional[str] = None,
+        keep_alive: Optional[Union[str, float]] = None,
+        max_concurrency: Optional[int] = None,
+        client: Optional[AsyncClient] = None,
+    ):
+        super().__init__(model_name)
+        # host defaults to OLLAMA_HOST inside the client itself.
+        self.keep_alive = _parse_keep_alive(keep_alive if keep_alive is not None else os.getenv("OLLAMA_KEEP_ALIVE"))
+        self.max_concurrency = max_concurrency or int(os.getenv("OLLAMA_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        # The server only runs OLLAMA_NUM_PARALLEL requests per model at once; anything
+        # beyond our own limit waits here instead of piling up in the server queue.
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._owns_client = client is None
+        self.client = client or AsyncClient(
+            host=host,
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
         )
-        return response['message']['content']
 
-    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
-        response = ollama.chat(
-            model=self.model_name,
-            messages=[
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_prompt},
-            ],
-            format='json',
-            options=kwargs.get('options', {}),
+    @classmethod
+    def create_client(cls, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float, host: Optional[str] = None) -> AsyncClient:
+        # Shared by every model on the same server; each model still keeps its own semaphore.
+        return AsyncClient(
+            host=host,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections, keepalive_expiry=keepalive_expiry),
         )
-        return json.loads(response['message']['content'])
+
+    async def aclose(self):
+        if self._owns_client:
+            await self.client.close()
+
+    async def _chat(self, system_prompt: str, messages: List[Dict[str, str]], **kwargs):
+        async with self._semaphore:
+            response = await self.client.chat(
+                model=self.model_name,
+                messages=[{'role': 'system', 'content': system_prompt}, *messages],
+                keep_alive=self.keep_alive,
+                **kwargs,
+            )
+        record_usage(response.prompt_eval_count, response.eval_count)
+        return response
+
+    async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        response = await self._chat(system_prompt, [{'role': 'user', 'content': user_prompt}], options=kwargs.get('options', {}))
+        return response['message']['content']
+
+    async def generate_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        # A schema in `format` becomes a grammar, like for generate_choice; 'json' only forces valid JSON.
+        response = await self._chat(system_prompt, [{'role': 'user', 'content': user_prompt}], format=schema or 'json', options=kwargs.get('options', {}))
+        return parse_json(response['message']['content'], "Ollama", schema)
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        options = {'temperature': 0, 'num_predict': CHOICE_MAX_TOKENS, **kwargs.get('options', {})}
+        # Ollama turns a JSON schema in `format` into a grammar, so only the enum values can be sampled.
+        response = await self._chat(system_prompt, [{'role': 'user', 'content': user_prompt}], format=choice_schema(choices), options=options)
+        return match_choice(json.loads(response['message']['content'])['answer'], choices)
+
+    async def _stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        # The slot is held until the whole response has been streamed.
+        async with self._semaphore:
+            stream = await self.client.chat(
+                model=self.model_name,
+                messages=[{'role': 'system', 'content': system_prompt}, *messages],
+                keep_alive=self.keep_alive,
+                stream=True,
+                **kwargs,
+            )
+            async for part in stream:
+                if part['message']['content']:
+                    yield part['message']['content']
+                if part.done:
+                    record_usage(part.prompt_eval_count, part.eval_count)
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._stream_chat(system_prompt, [{'role': 'user', 'content': user_prompt}], options=kwargs.get('options', {})):
+            yield chunk
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._stream_chat(system_prompt, [{'role': 'user', 'content': user_prompt}], format=schema or 'json', options=kwargs.get('options', {})):
+            yield chunk
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        # While keep_alive holds the model loaded, the server reuses the KV cache
+        # of the previous request's matching prefix and only evaluates the new turn.
+        response = await self._chat(system_prompt, messages, options=kwargs.get('options', {}))
+        return response['message']['content']
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._stream_chat(system_prompt, messages, options=kwargs.get('options', {})):
+            yield chunk
@@ -1,33 +1,122 @@
 import json
 import os
-from openai import AsyncOpenAI
-from typing import Dict, Any
-from ai_providers.base_provider import AIProvider
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from typing import Dict, Any, AsyncIterator, List, Optional
+from ai_providers.base_provider import AIProvider, choice_schema, match_choice
+from ai_providers.json_stream import parse_json
+from ai_providers.metrics import record_usage
+from ai_providers.pool import http_limits
+
+# A {"answer": ...} object with the longest choice fits comfortably in this budget.
+CHOICE_MAX_TOKENS = 20
+REASONING_MODEL_PREFIXES = ("o1", "o3", "o4", "gpt-5")
+
+
+def _response_format(schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # Strict mode guarantees the schema, which must then list every property as
+    # required and forbid additional ones.
+    if schema is None:
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": "response", "strict": True, "schema": schema}}
+
+
+def _record_usage(usage):
+    if usage is not None:
+        details = usage.prompt_tokens_details
+        record_usage(usage.prompt_tokens, usage.completion_tokens, details.cached_tokens if details else None)
+
 
 class OpenAIProvider(AIProvider):
-    def __init__(self, model_name: str):
+    provider_name = "openai"
+    api_key_env = "OPENAI_API_KEY"
+    client_options = ("api_key",)
+
+    def __init__(self, model_name: str, api_key: Optional[str] = None, client: Optional[AsyncOpenAI] = None):
         super().__init__(model_name)
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self._owns_client = client is None
+        self.client = client or AsyncOpenAI(api_key=api_key or os.getenv(self.api_key_env))
+        self.deterministic_choices = not model_name.startswith(REASONING_MODEL_PREFIXES)
+
+    @classmethod
+    def create_client(cls, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float, api_key: Optional[str] = None) -> AsyncOpenAI:
+        limits = http_limits(DefaultAsyncHttpxClient, max_connections, max_keepalive_connections, keepalive_expiry)
+        return AsyncOpenAI(api_key=api_key or os.getenv(cls.api_key_env), http_client=DefaultAsyncHttpxClient(limits=limits))
+
+    async def aclose(self):
+        if self._owns_client:
+            await self.client.close()
 
     async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        return await self.chat(system_prompt, [{"role": "user", "content": user_prompt}], **kwargs)
+
+    async def generate_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
         response = await self.client.chat.completions.create(
             model=self.model_name,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
+            response_format=_response_format(schema),
             **kwargs,
         )
-        return response.choices[0].message.content
+        _record_usage(response.usage)
+        return parse_json(response.choices[0].message.content, "OpenAI", schema)
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.stream_chat(system_prompt, [{"role": "user", "content": user_prompt}], **kwargs):
+            yield chunk
 
-    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+    async def stream_json(self, system_prompt: str, user_prompt: str, schema: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self.stream_text(system_prompt, user_prompt, response_format=_response_format(schema), **kwargs):
+            yield chunk
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        # Reasoning models count their hidden reasoning against the output limit,
+        # so a tight cap would truncate them before they answer; they also reject
+        # any temperature but the default.
+        if not self.model_name.startswith(REASONING_MODEL_PREFIXES):
+            kwargs.setdefault("max_completion_tokens", CHOICE_MAX_TOKENS)
+            kwargs.setdefault("temperature", 0)
         response = await self.client.chat.completions.create(
             model=self.model_name,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            response_format={"type": "json_object"},
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "choice", "strict": True, "schema": choice_schema(choices)},
+            },
+            **kwargs,
+        )
+        _record_usage(response.usage)
+        return match_choice(json.loads(response.choices[0].message.content)["answer"], choices)
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        # OpenAI caches long prompt prefixes automatically; the key routes every
+        # turn of a conversation to the same cache so the history is a hit.
+        if cache_key:
+            kwargs.setdefault("prompt_cache_key", cache_key)
+        response = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "system", "content": system_prompt}, *messages],
+            **kwargs,
+        )
+        _record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        if cache_key:
+            kwargs.setdefault("prompt_cache_key", cache_key)
+        # Usage only comes in a final extra chunk, and only when asked for.
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        stream = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "system", "content": system_prompt}, *messages],
+            stream=True,
             **kwargs,
         )
-        return json.loads(response.choices[0].message.content)
+        async for chunk in stream:
+            _record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
@@ -0,0 +1,92 @@
+import hashlib
+import importlib
+import json
+import os
+from typing import Dict, Any, Optional, Tuple
+from ai_providers.base_provider import AIProvider
+from ai_providers.registry import provider_class
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+
+def http_limits(client_class: type, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float) -> Any:
+    """
+    Builds connection limits for an SDK's HTTP client class. The class's
+    `AsyncClient` base is found in its MRO, and `Limits` comes from the
+    module that defines it, so the SDK itself doesn't need to export it.
+    """
+    base = next(cls for cls in client_class.__mro__ if cls.__name__ == "AsyncClient")
+    http = importlib.import_module(base.__module__.split(".")[0])
+    return http.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections, keepalive_expiry=keepalive_expiry)
+
+
+def _fingerprint(api_key: Optional[str]) -> Optional[str]:
+    # Keys only need to be told apart; the pool never keeps them in plain text.
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16] if api_key else None
+
+
+def _options_key(options: Dict[str, Any]) -> str:
+    # The API key is already in the key as its fingerprint.
+    return json.dumps({name: value for name, value in options.items() if name != "api_key"}, sort_keys=True, default=repr)
+
+
+class ProviderPool:
+    """
+    Reuses provider instances and their SDK clients across roles and games.
+
+    A provider is shared by every caller asking for the same provider, model,
+    credentials and options. The SDK client underneath, with its keep-alive
+    connections, is shared more widely: by every model of the same backend
+    with the same credentials and client options. So a narrator and an
+    investigator on the same API, and all concurrent games, reuse the same
+    connections and TLS sessions.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._providers: Dict[Tuple, AIProvider] = {}
+        self._clients: Dict[Tuple, Any] = {}
+
+    def get(self, provider_name: str, model_name: str, **options) -> AIProvider:
+        """Returns the pooled provider, building it (and its client, if new) on first use."""
+        cls = provider_class(provider_name)
+        api_key = options.get("api_key") or (os.getenv(cls.api_key_env) if cls.api_key_env else None)
+        credentials = _fingerprint(api_key)
+        key = (provider_name, model_name, credentials, _options_key(options))
+        if key in self._providers:
+            return self._providers[key]
+
+        client_options = {name: options[name] for name in cls.client_options if options.get(name) is not None}
+        client_key = (provider_name, credentials, _options_key(client_options))
+        client = self._clients.get(client_key)
+        if client is None:
+            client = cls.create_client(self.max_connections, self.max_keepalive_connections, self.keepalive_expiry, **client_options)
+            if client is not None:
+                self._clients[client_key] = client
+        provider = cls(model_name, client=client, **options) if client is not None else cls(model_name, **options)
+        self._providers[key] = provider
+        return provider
+
+    async def aclose(self):
+        """Closes every pooled provider and shared client. The pool can be reused afterwards."""
+        for provider in self._providers.values():
+            await provider.aclose()
+        for client in self._clients.values():
+            await client.close()
+        self._providers.clear()
+        self._clients.clear()
+
+    async def __aenter__(self) -> "ProviderPool":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
@@ -0,0 +1,277 @@
+import asyncio
+import heapq
+import itertools
+from collections import Counter
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from ai_providers.base_provider import AIProvider, ProviderWrapper, render_messages
+from ai_providers.metrics import current_labels, record_queue_time, track_usage
+from ai_providers.resilience import deadline_paused, retry_after
+
+# Output tokens assumed for calls that don't set `max_tokens`. Quotas such as
+# OpenAI's count the requested maximum, so a guess on the high side is safer.
+EXPECTED_OUTPUT_TOKENS = {
+    "generate_choice": 8,
+    "generate_text": 256,
+    "stream_text": 256,
+    "chat": 256,
+    "stream_chat": 256,
+    "generate_json": 512,
+    "stream_json": 512,
+}
+
+# Lower runs first. Yes/no answers are short and a game is waiting on them;
+# speculative branches and background mystery production can wait.
+PRIORITY_CHOICE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BACKGROUND = 2
+
+# Finished flows' tags are pruned once this many flows are tracked.
+MAX_IDLE_FLOWS = 1024
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text` before sending it: about four characters per token."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute / 60` units per second up to `burst` seconds' worth.
+    A small burst spreads the calls evenly over the minute instead of spending
+    the whole quota at once and then idling, which is what triggers 429s on
+    APIs that measure over shorter windows. The level may go negative when a
+    call turns out to cost more than estimated; later calls then wait longer.
+    """
+
+    def __init__(self, per_minute: float, burst: float = 6.0):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst)
+        self.level = self.capacity
+        self._updated: Optional[float] = None
+
+    def _refill(self, now: float):
+        if self._updated is not None:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken. Amounts above the capacity only wait for a full bucket."""
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Keeps the calls to one model under a requests-per-minute and a
+    tokens-per-minute budget (either may be None).
+
+    Calls wait in a single queue ordered by priority and then by a per-game
+    virtual start tag (start-time fair queuing): each game's next tag is
+    pushed back by the tokens it asks for, so a game firing many or long
+    calls cannot starve the others. Only the head of the queue is dispatched, as soon as both buckets
+    allow it. After a 429 the whole queue pauses for the time the API asks.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None, burst: float = 6.0):
+        self.requests = TokenBucket(requests_per_minute, burst) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, burst) if tokens_per_minute else None
+        self.stats = Counter()
+        self._queue: List[Tuple[int, float, int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[Any, float] = {}
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_DEFAULT, flow: Any = None):
+        """Waits for this call's turn and charges its estimated `tokens`."""
+        loop = asyncio.get_running_loop()
+        start_tag = max(self._virtual_time, self._finish_tags.get(flow, 0.0))
+        self._finish_tags[flow] = start_tag + tokens
+        if len(self._finish_tags) > MAX_IDLE_FLOWS:
+            # A tag behind the virtual time acts like no tag at all; dropping them
+            # keeps a long-running server from remembering every game it played.
+            self._finish_tags = {key: tag for key, tag in self._finish_tags.items() if tag > self._virtual_time}
+        future = loop.create_future()
+        heapq.heappush(self._queue, (priority, start_tag, next(self._sequence), tokens, future))
+        self._dispatch()
+        if not future.done():
+            self.stats["queued"] += 1
+        started = loop.time()
+        try:
+            await future
+        except asyncio.CancelledError:
+            self._withdraw(future, start_tag, tokens, flow)
+            raise
+        waited = loop.time() - started
+        self.stats["wait_seconds"] += waited
+        return waited
+
+    def _withdraw(self, future: asyncio.Future, start_tag: float, tokens: int, flow: Any):
+        # A call cancelled while queued gives back its place in its game's flow,
+        # unless a later call of the same game already queued behind it. One
+        # dispatched just as it was cancelled never goes out, so its charge is
+        # refunded too.
+        if self._finish_tags.get(flow) == start_tag + tokens:
+            self._finish_tags[flow] = start_tag
+        if future.done() and not future.cancelled():
+            if self.requests is not None:
+                self.requests.refund(1)
+            if self.tokens is not None:
+                self.tokens.refund(tokens)
+        self._dispatch()
+
+    def release(self, estimated: int, used: Optional[int]):
+        """Corrects the charge of a finished call with the tokens it really used, when known."""
+        if self.tokens is None or used is None:
+            return
+        if used < estimated:
+            self.tokens.refund(estimated - used)
+        else:
+            self.tokens.level -= used - estimated
+
+    def throttled(self, error: BaseException):
+        """Called when the API rejected a call for exceeding its rate limit."""
+        self.stats["throttled"] += 1
+        loop = asyncio.get_running_loop()
+        pause = retry_after(error) or (1 / self.requests.rate if self.requests else 1.0)
+        self._paused_until = max(self._paused_until, loop.time() + pause)
+        if self.requests is not None:
+            # The API's window is fuller than ours thought: start it over.
+            self.requests.level = min(self.requests.level, 0.0)
+        self._dispatch()
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            priority, start_tag, _, tokens, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue) # Cancelled while waiting.
+                continue
+            now = loop.time()
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1, now) if self.requests else 0.0,
+                self.tokens.wait_time(tokens, now) if self.tokens else 0.0,
+            )
+            if wait > 0:
+                self._timer = loop.call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            if self.requests is not None:
+                self.requests.take(1, now)
+            if self.tokens is not None:
+                self.tokens.take(tokens, now)
+            self._virtual_time = max(self._virtual_time, start_tag)
+            future.set_result(None)
+
+
+def _is_rate_limit(error: BaseException) -> bool:
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status == 429 or "RateLimit" in type(error).__name__ or "ResourceExhausted" in type(error).__name__
+
+
+class RateLimitedProvider(ProviderWrapper):
+    """
+    Sends every call to the wrapped provider through a shared `RateLimiter`.
+    Wrapped by `ResilientProvider`, each retry waits for its turn again and the
+    time spent queueing does not count against the attempt's timeout.
+    """
+
+    def __init__(self, inner: AIProvider, limiter: RateLimiter):
+        super().__init__(inner)
+        self.limiter = limiter
+
+    def _ticket(self, method: str, prompt: str, kwargs: Dict[str, Any]) -> Tuple[int, int, Any]:
+        labels = current_labels()
+        tokens = estimate_tokens(prompt) + (kwargs.get("max_tokens") or EXPECTED_OUTPUT_TOKENS[method])
+        if labels.get("producer") or labels.get("speculative") is not None:
+            priority = PRIORITY_BACKGROUND
+        elif method == "generate_choice":
+            priority = PRIORITY_CHOICE
+        else:
+            priority = PRIORITY_DEFAULT
+        return tokens, priority, labels.get("game")
+
+    async def _wait_turn(self, tokens: int, priority: int, flow: Any):
+        with deadline_paused():
+            waited = await self.limiter.acquire(tokens, priority, flow)
+        if waited:
+            record_queue_time(waited)
+
+    def _settle(self, tokens: int, usage: Dict[str, int], error: Optional[BaseException] = None):
+        used = usage["input_tokens"] + usage["output_tokens"]
+        self.limiter.release(tokens, used or None)
+        if error is not None and _is_rate_limit(error):
+            self.limiter.throttled(error)
+
+    async def _limited(self, method: str, prompt: str, kwargs: Dict[str, Any], call: Callable[[], Awaitable[Any]]) -> Any:
+        tokens, priority, flow = self._ticket(method, prompt, kwargs)
+        await self._wait_turn(tokens, priority, flow)
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        error = None
+        try:
+            with track_usage(usage):
+                return await call()
+        except BaseException as e:
+            # Cancelled calls too: lost hedges, speculative branches and cancelled games.
+            error = e
+            raise
+        finally:
+            self._settle(tokens, usage, error)
+
+    async def _limited_stream(self, method: str, prompt: str, kwargs: Dict[str, Any], stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        tokens, priority, flow = self._ticket(method, prompt, kwargs)
+        await self._wait_turn(tokens, priority, flow)
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        iterator = stream()
+        error = None
+        try:
+            while True:
+                # Tracked around each step only, like MetricsProvider does.
+                with track_usage(usage):
+                    try:
+                        chunk = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                yield chunk
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            await iterator.aclose()
+            self._settle(tokens, usage, error)
+
+    async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        return await self._limited("generate_text", system_prompt + user_prompt, kwargs, lambda: self.inner.generate_text(system_prompt, user_prompt, **kwargs))
+
+    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        return await self._limited("generate_json", system_prompt + user_prompt, kwargs, lambda: self.inner.generate_json(system_prompt, user_prompt, **kwargs))
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._limited_stream("stream_text", system_prompt + user_prompt, kwargs, lambda: self.inner.stream_text(system_prompt, user_prompt, **kwargs)):
+            yield chunk
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._limited_stream("stream_json", system_prompt + user_prompt, kwargs, lambda: self.inner.stream_json(system_prompt, user_prompt, **kwargs)):
+            yield chunk
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        return await self._limited("generate_choice", system_prompt + user_prompt, kwargs, lambda: self.inner.generate_choice(system_prompt, user_prompt, choices, **kwargs))
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        return await self._limited("chat", system_prompt + render_messages(messages), kwargs, lambda: self.inner.chat(system_prompt, messages, cache_key=cache_key, **kwargs))
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._limited_stream("stream_chat", system_prompt + render_messages(messages), kwargs, lambda: self.inner.stream_chat(system_prompt, messages, cache_key=cache_key, **kwargs)):
+            yield chunk
@@ -0,0 +1,55 @@
+import importlib
+from importlib.metadata import entry_points
+from typing import Dict, List, Type, Union
+from ai_providers.base_provider import AIProvider
+
+# Third-party packages add providers by declaring an entry point in this group,
+# e.g. in their pyproject.toml:
+#   [project.entry-points."black_story.providers"]
+#   mistral = "black_story_mistral:MistralProvider"
+ENTRY_POINT_GROUP = "black_story.providers"
+
+# Built-in providers as "module:Class" so their SDKs are only imported when used.
+BUILTIN_PROVIDERS: Dict[str, str] = {
+    "ollama": "ai_providers.ollama_provider:OllamaProvider",
+    "gemini": "ai_providers.gemini_provider:GeminiProvider",
+    "anthropic": "ai_providers.anthropic_provider:AnthropicProvider",
+    "openai": "ai_providers.openai_provider:OpenAIProvider",
+    "mock": "ai_providers.mock_provider:MockProvider",
+}
+
+_registry: Dict[str, Union[str, Type[AIProvider]]] = dict(BUILTIN_PROVIDERS)
+_entry_points_loaded = False
+
+
+def _load_entry_points():
+    # Reading the metadata is cheap; the provider modules themselves are not imported here.
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        _registry.setdefault(entry_point.name, entry_point.value)
+
+
+def register_provider(name: str, provider: Union[str, Type[AIProvider]]):
+    """Registers a provider class, or a lazy "module:Class" reference to one, under `name`."""
+    _registry[name] = provider
+
+
+def available_providers() -> List[str]:
+    _load_entry_points()
+    return list(_registry)
+
+
+def provider_class(name: str) -> Type[AIProvider]:
+    """Returns the class registered as `name`, importing its module on first use."""
+    _load_entry_points()
+    if name not in _registry:
+        raise ValueError(f"Unknown AI provider: {name}")
+    provider = _registry[name]
+    if isinstance(provider, str):
+        module_name, _, class_name = provider.partition(":")
+        provider = getattr(importlib.import_module(module_name), class_name)
+        _registry[name] = provider
+    return provider
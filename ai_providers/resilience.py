@@ -0,0 +1,271 @@
+import asyncio
+import contextlib
+import contextvars
+import random
+from collections import Counter, deque
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Deque, Iterator, List, Optional
+from ai_providers.base_provider import AIProvider, InvalidChoiceError, ProviderWrapper
+from ai_providers.metrics import record_retry
+
+# Rate limits, timeouts, conflicts, server errors and Anthropic's "overloaded".
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+LATENCY_WINDOW = 200
+
+_deadline: contextvars.ContextVar[Optional[asyncio.Timeout]] = contextvars.ContextVar("attempt_deadline", default=None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Tells transient failures from permanent ones without importing every SDK:
+    HTTP errors expose `status_code` (OpenAI, Anthropic, Ollama) or `code`
+    (Google), and connection and timeout errors are recognised by class name.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    return any("Timeout" in cls.__name__ or "Connection" in cls.__name__ for cls in type(error).__mro__)
+
+
+@contextlib.contextmanager
+def deadline_paused() -> Iterator[None]:
+    """
+    Stops the clock of the current attempt's timeout inside the block, for
+    time spent waiting for our own turn (e.g. in a rate-limit queue) rather
+    than for the API.
+    """
+    deadline = _deadline.get()
+    if deadline is None or deadline.when() is None:
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    remaining = deadline.when() - loop.time()
+    deadline.reschedule(None)
+    try:
+        yield
+    finally:
+        deadline.reschedule(loop.time() + remaining)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the API asked us to wait in its `Retry-After` header, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientProvider(ProviderWrapper):
+    """
+    Adds deadlines, retries and a backup provider to any provider.
+
+    - Every attempt is cut off after `timeout` seconds (for streams, the wait
+      for each chunk), so one stuck request cannot stall a game.
+    - Retryable errors are retried up to `retries` times with exponential
+      backoff and full jitter, honouring `Retry-After` when the API sends it.
+    - When the attempts run out, or the error is not retryable, the call
+      falls back to `backup`. Backups can be `ResilientProvider`s themselves,
+      which makes a fallback chain.
+    - With `hedge_percentile`, a non-streaming call still running past that
+      percentile of the recent latencies fires the same request at `backup`
+      and keeps whichever answers first.
+
+    Invalid choices are the model's answer, not a failure, so they are raised
+    as they are. A stream is only retried or handed over before its first chunk.
+    """
+
+    def __init__(
+        self,
+        inner: AIProvider,
+        timeout: Optional[float] = None,
+        retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        backup: Optional[AIProvider] = None,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+    ):
+        super().__init__(inner)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.backup = backup
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.stats = Counter()
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    async def aclose(self):
+        await self.inner.aclose()
+        if self.backup is not None:
+            await self.backup.aclose()
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        requested = retry_after(error)
+        return min(self.backoff_max, max(delay, requested)) if requested is not None else delay
+
+    def _hedge_delay(self, method: str) -> Optional[float]:
+        latencies = self._latencies.get(method)
+        if self.backup is None or self.hedge_percentile is None or not latencies or len(latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(self.hedge_percentile / 100 * len(ordered)))]
+
+    async def _with_retries(self, method: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            started = loop.time()
+            try:
+                async with asyncio.timeout(self.timeout) as deadline:
+                    token = _deadline.set(deadline)
+                    try:
+                        result = await call()
+                    finally:
+                        _deadline.reset(token)
+            except InvalidChoiceError:
+                raise
+            except Exception as e:
+                if isinstance(e, TimeoutError):
+                    self.stats["timeouts"] += 1
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                self.stats["retries"] += 1
+                record_retry()
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self._latencies.setdefault(method, deque(maxlen=LATENCY_WINDOW)).append(loop.time() - started)
+            return result
+
+    async def _call(self, method: str, primary: Callable[[], Awaitable[Any]], backup: Optional[Callable[[], Awaitable[Any]]]) -> Any:
+        hedge_delay = self._hedge_delay(method)
+        if hedge_delay is None:
+            try:
+                return await self._with_retries(method, primary)
+            except InvalidChoiceError:
+                raise
+            except Exception:
+                if backup is None:
+                    raise
+                self.stats["fallbacks"] += 1
+                return await backup()
+
+        tasks = {asyncio.create_task(self._with_retries(method, primary)): "primary"}
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        hedged = not done
+        if hedged:
+            self.stats["hedges"] += 1
+            tasks[asyncio.create_task(backup())] = "backup"
+        try:
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    source = tasks.pop(task)
+                    error = task.exception()
+                    if error is None or isinstance(error, InvalidChoiceError):
+                        if hedged and source == "backup":
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    if source == "primary" and not hedged:
+                        # The primary failed before the hedge fired: fall back right away.
+                        self.stats["fallbacks"] += 1
+                        tasks[asyncio.create_task(backup())] = "backup"
+                    elif not tasks:
+                        raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _stream(self, primary: Callable[[], AsyncIterator[str]], backup: Optional[Callable[[], AsyncIterator[str]]]) -> AsyncIterator[str]:
+        attempt = 0
+        while True:
+            stream = primary()
+            started = False
+            try:
+                while True:
+                    try:
+                        async with asyncio.timeout(self.timeout) as deadline:
+                            token = _deadline.set(deadline)
+                            try:
+                                chunk = await stream.__anext__()
+                            finally:
+                                _deadline.reset(token)
+                    except StopAsyncIteration:
+                        return
+                    started = True
+                    yield chunk
+            except InvalidChoiceError:
+                raise
+            except Exception as e:
+                if isinstance(e, TimeoutError):
+                    self.stats["timeouts"] += 1
+                if started:
+                    raise
+                if attempt < self.retries and is_retryable(e):
+                    self.stats["retries"] += 1
+                    record_retry()
+                    await asyncio.sleep(self._backoff(attempt, e))
+                    attempt += 1
+                    continue
+                if backup is None:
+                    raise
+                self.stats["fallbacks"] += 1
+                async for chunk in backup():
+                    yield chunk
+                return
+            finally:
+                await stream.aclose()
+
+    async def generate_text(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        return await self._call(
+            "generate_text",
+            lambda: self.inner.generate_text(system_prompt, user_prompt, **kwargs),
+            self.backup and (lambda: self.backup.generate_text(system_prompt, user_prompt, **kwargs)),
+        )
+
+    async def generate_json(self, system_prompt: str, user_prompt: str, **kwargs) -> Dict[str, Any]:
+        return await self._call(
+            "generate_json",
+            lambda: self.inner.generate_json(system_prompt, user_prompt, **kwargs),
+            self.backup and (lambda: self.backup.generate_json(system_prompt, user_prompt, **kwargs)),
+        )
+
+    async def stream_text(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._stream(
+            lambda: self.inner.stream_text(system_prompt, user_prompt, **kwargs),
+            self.backup and (lambda: self.backup.stream_text(system_prompt, user_prompt, **kwargs)),
+        ):
+            yield chunk
+
+    async def stream_json(self, system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._stream(
+            lambda: self.inner.stream_json(system_prompt, user_prompt, **kwargs),
+            self.backup and (lambda: self.backup.stream_json(system_prompt, user_prompt, **kwargs)),
+        ):
+            yield chunk
+
+    async def generate_choice(self, system_prompt: str, user_prompt: str, choices: List[str], **kwargs) -> str:
+        return await self._call(
+            "generate_choice",
+            lambda: self.inner.generate_choice(system_prompt, user_prompt, choices, **kwargs),
+            self.backup and (lambda: self.backup.generate_choice(system_prompt, user_prompt, choices, **kwargs)),
+        )
+
+    async def chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> str:
+        return await self._call(
+            "chat",
+            lambda: self.inner.chat(system_prompt, messages, cache_key=cache_key, **kwargs),
+            self.backup and (lambda: self.backup.chat(system_prompt, messages, cache_key=cache_key, **kwargs)),
+        )
+
+    async def stream_chat(self, system_prompt: str, messages: List[Dict[str, str]], cache_key: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        async for chunk in self._stream(
+            lambda: self.inner.stream_chat(system_prompt, messages, cache_key=cache_key, **kwargs),
+            self.backup and (lambda: self.backup.stream_chat(system_prompt, messages, cache_key=cache_key, **kwargs)),
+        ):
+            yield chunk
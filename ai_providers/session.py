@@ -0,0 +1,48 @@
+import uuid
+from typing import Dict, Any, AsyncIterator, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ai_providers.base_provider import AIProvider
+
+
+class ChatSession:
+    """
+    A multi-turn conversation with a fixed system prompt.
+
+    Each call sends the system prompt and the previous messages unchanged and
+    appends only the new turn, so the request always starts with the prefix
+    of the previous one. Providers use that to serve the prefix from their
+    prompt cache (Anthropic `cache_control`, OpenAI prefix caching keyed by
+    `cache_key`, Gemini implicit caching, Ollama's loaded KV cache) instead of
+    re-processing the whole history every turn.
+    """
+
+    def __init__(self, provider: "AIProvider", system_prompt: str, messages: Optional[List[Dict[str, str]]] = None, cache_key: Optional[str] = None, **kwargs):
+        self.provider = provider
+        self.system_prompt = system_prompt
+        self.messages: List[Dict[str, str]] = list(messages or [])
+        self.cache_key = cache_key or uuid.uuid4().hex
+        self.kwargs = kwargs
+
+    async def send(self, content: str, **kwargs) -> str:
+        """Sends a user message and returns the reply, keeping both in the history."""
+        messages = self.messages + [{"role": "user", "content": content}]
+        reply = await self.provider.chat(self.system_prompt, messages, cache_key=self.cache_key, **{**self.kwargs, **kwargs})
+        self.messages = messages + [{"role": "assistant", "content": reply}]
+        return reply
+
+    async def stream(self, content: str, **kwargs) -> AsyncIterator[str]:
+        """Like `send`, but yields the reply in chunks. The history is only updated once the reply is complete."""
+        messages = self.messages + [{"role": "user", "content": content}]
+        chunks = []
+        async for chunk in self.provider.stream_chat(self.system_prompt, messages, cache_key=self.cache_key, **{**self.kwargs, **kwargs}):
+            chunks.append(chunk)
+            yield chunk
+        self.messages = messages + [{"role": "assistant", "content": "".join(chunks)}]
+
+    def fork(self) -> "ChatSession":
+        """Returns an independent copy that shares the history so far (and its cached prefix)."""
+        return ChatSession(self.provider, self.system_prompt, self.messages, cache_key=self.cache_key, **self.kwargs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"system_prompt": self.system_prompt, "messages": self.messages, "cache_key": self.cache_key}
@@ -0,0 +1,213 @@
+"""
+Mide el coste de orquestar partidas con el proveedor 'mock', sin red ni claves.
+
+Para cada combinación de concurrencia y turnos juega un lote con `jugar_lote`
+(la misma ruta que `main.py --partidas`) y mide partidas por segundo, el
+retraso del bucle de eventos, el tiempo de CPU por turno, la memoria por
+partida simultánea y lo que cuesta exportar una transcripción a Markdown. Con la
+latencia del mock a 0 los números reflejan solo el código propio. También mide,
+en procesos nuevos, cuánto tarda en importarse `main` y cada proveedor.
+
+    python benchmarks/benchmark_partidas.py --concurrencias 1,16,64 --turnos 5,15 --partidas 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from rich.console import Console
+from rich.table import Table
+
+import main
+from ai_providers import MetricsProvider, MetricsRecorder, MockProvider, ResilientProvider, available_providers
+from game_engine import ConfigPartida, Partida
+from historial import IndicePartidas, RegistroPartidas, exportar_markdown
+
+console = Console()
+
+
+def lista_enteros(valor: str):
+    return [int(parte) for parte in valor.split(",")]
+
+
+def proveedores(args, semilla: int, metricas: MetricsRecorder):
+    """Los proveedores envueltos igual que en `main.py`, para medir también las capas."""
+    def uno(modelo: str, desplazamiento: int):
+        mock = MockProvider(modelo, latency=args.latencia, chunk_interval=args.intervalo, failure_rate=args.fallos, seed=semilla + desplazamiento)
+        return MetricsProvider(ResilientProvider(mock, retries=2, backoff_base=0.001), metricas)
+    return uno("narrador", 0), uno("investigador", 1)
+
+
+async def medir_retraso(parar: asyncio.Event, muestras: list, intervalo: float = 0.005):
+    """Cuánto llega tarde el bucle a un temporizador de `intervalo` segundos: mide cuánto lo bloquea el código síncrono."""
+    loop = asyncio.get_running_loop()
+    while not parar.is_set():
+        inicio = loop.time()
+        await asyncio.sleep(intervalo)
+        muestras.append(loop.time() - inicio - intervalo)
+
+
+async def lote(args, concurrencia: int, turnos: int, memoria: bool) -> dict:
+    config = ConfigPartida("mock", "narrador", "mock", "investigador", turnos=turnos, sesiones=args.sesiones, especulativo=args.especulativo)
+    metricas = MetricsRecorder()
+    narrador, investigador = proveedores(args, args.semilla, metricas)
+    # Como en `main.py`: cada evento va a su JSONL y cada partida al índice.
+    indice = IndicePartidas()
+    registro = RegistroPartidas(indice=indice, metricas=metricas)
+    parar = asyncio.Event()
+    retrasos = []
+    medidor = asyncio.create_task(medir_retraso(parar, retrasos))
+    if memoria:
+        tracemalloc.start()
+    cpu, inicio = time.process_time(), time.perf_counter()
+    await main.jugar_lote(config, narrador, investigador, args.partidas, concurrencia, registro=registro)
+    duracion, cpu = time.perf_counter() - inicio, time.process_time() - cpu
+    pico = 0
+    if memoria:
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    parar.set()
+    await medidor
+    registro.cerrar()
+    indice.cerrar()
+    turnos_totales = args.partidas * turnos
+    return {
+        "concurrencia": concurrencia,
+        "turnos": turnos,
+        "partidas": args.partidas,
+        "segundos": duracion,
+        "partidas_por_segundo": args.partidas / duracion,
+        "cpu_por_turno_ms": cpu / turnos_totales * 1000,
+        "retraso_bucle_medio_ms": statistics.fmean(retrasos) * 1000 if retrasos else 0.0,
+        "retraso_bucle_max_ms": max(retrasos, default=0.0) * 1000,
+        "llamadas": len(metricas.records),
+        "memoria_por_partida_kb": pico / min(concurrencia, args.partidas) / 1024 if memoria else None,
+    }
+
+
+async def coste_exportacion(args, turnos: int, repeticiones: int = 20) -> float:
+    """Milisegundos por exportación a Markdown de la transcripción de una partida de `turnos` turnos."""
+    config = ConfigPartida("mock", "narrador", "mock", "investigador", turnos=turnos)
+    metricas = MetricsRecorder()
+    narrador, investigador = proveedores(args, args.semilla, metricas)
+    with tempfile.TemporaryDirectory() as directorio:
+        registro = RegistroPartidas(directorio, metricas=metricas)
+        partida = await Partida(config, narrador, investigador, observadores=[registro]).jugar()
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            exportar_markdown(registro.rutas[partida.id])
+        return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def tiempo_importacion(codigo: str, repeticiones: int = 3) -> float:
+    """Milisegundos que tarda `codigo` en un intérprete nuevo (el mejor de `repeticiones`), sin contar el arranque de Python."""
+    medir = f"import time; inicio = time.perf_counter(); {codigo}; print(time.perf_counter() - inicio)"
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-W", "ignore", "-c", medir], cwd=RAIZ, capture_output=True, text=True, check=True)
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]) * 1000)
+    return min(tiempos)
+
+
+def importaciones() -> dict:
+    tiempos = {"main": tiempo_importacion("import main")}
+    for proveedor in available_providers():
+        try:
+            tiempos[proveedor] = tiempo_importacion(f"from ai_providers import provider_class; provider_class({proveedor!r})")
+        except subprocess.CalledProcessError:
+            tiempos[proveedor] = None # SDK no instalado
+    return tiempos
+
+
+async def ejecutar(args) -> list:
+    resultados = []
+    for turnos in args.turnos:
+        exportacion_ms = await coste_exportacion(args, turnos)
+        for concurrencia in args.concurrencias:
+            resultado = await lote(args, concurrencia, turnos, memoria=False)
+            if not args.sin_memoria:
+                # Pasada aparte: tracemalloc ralentiza todo y falsearía los tiempos.
+                resultado["memoria_por_partida_kb"] = (await lote(args, concurrencia, turnos, memoria=True))["memoria_por_partida_kb"]
+            resultado["exportacion_ms"] = exportacion_ms
+            resultados.append(resultado)
+    return resultados
+
+
+def tabla(resultados: list) -> Table:
+    tabla = Table(title="Orquestación de partidas con el proveedor mock")
+    columnas = [
+        ("Concurrencia", "concurrencia", "{}"),
+        ("Turnos", "turnos", "{}"),
+        ("Partidas/s", "partidas_por_segundo", "{:.1f}"),
+        ("CPU/turno (ms)", "cpu_por_turno_ms", "{:.2f}"),
+        ("Retraso bucle medio (ms)", "retraso_bucle_medio_ms", "{:.2f}"),
+        ("Retraso bucle máx. (ms)", "retraso_bucle_max_ms", "{:.1f}"),
+        ("Memoria/partida (KB)", "memoria_por_partida_kb", "{:.0f}"),
+        ("Exportar MD (ms)", "exportacion_ms", "{:.2f}"),
+    ]
+    for titulo, _, _ in columnas:
+        tabla.add_column(titulo, justify="right")
+    for resultado in resultados:
+        tabla.add_row(*("-" if resultado[clave] is None else formato.format(resultado[clave]) for _, clave, formato in columnas))
+    return tabla
+
+
+def tabla_importaciones(tiempos: dict) -> Table:
+    tabla = Table(title="Tiempo de importación en un proceso nuevo")
+    tabla.add_column("Módulo")
+    tabla.add_column("ms", justify="right")
+    for modulo, ms in tiempos.items():
+        tabla.add_row(modulo if modulo == "main" else f"proveedor {modulo}", "-" if ms is None else f"{ms:.0f}")
+    return tabla
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de la orquestación de partidas con el proveedor mock.")
+    parser.add_argument("--concurrencias", type=lista_enteros, default=[1, 8, 32], help="Partidas simultáneas a probar, separadas por comas.")
+    parser.add_argument("--turnos", type=lista_enteros, default=[5, 15], help="Turnos por partida a probar, separados por comas.")
+    parser.add_argument("--partidas", type=int, default=32, help="Partidas por lote.")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latencia mediana en segundos de cada llamada al mock.")
+    parser.add_argument("--intervalo", type=float, default=0.0, help="Segundos entre fragmentos en streaming.")
+    parser.add_argument("--fallos", type=float, default=0.0, help="Fracción de llamadas que fallan (se reintentan).")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--sesiones", action="store_true", help="Juega con --sesiones.")
+    parser.add_argument("--especulativo", action="store_true", help="Juega con --especulativo.")
+    parser.add_argument("--sin-importacion", action="store_true", help="No mide el tiempo de importación.")
+    parser.add_argument("--sin-memoria", action="store_true", help="No mide la memoria (ahorra una pasada por combinación).")
+    parser.add_argument("--json", metavar="RUTA", default=None, help="Guarda los resultados en JSON para compararlos entre versiones.")
+    return parser.parse_args()
+
+
+def main_benchmark():
+    args = parse_args()
+    # El lote escribe sus transcripciones en ./historial_partidas y muestra una
+    # barra de progreso; aquí ambas cosas sobran.
+    main.console.quiet = True
+    with tempfile.TemporaryDirectory() as directorio:
+        cwd = os.getcwd()
+        os.chdir(directorio)
+        try:
+            resultados = asyncio.run(ejecutar(args))
+        finally:
+            os.chdir(cwd)
+    console.print(tabla(resultados))
+    tiempos = None if args.sin_importacion else importaciones()
+    if tiempos:
+        console.print(tabla_importaciones(tiempos))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"argumentos": vars(args), "resultados": resultados, "importacion_ms": tiempos}, f, ensure_ascii=False, indent=2)
+        console.print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
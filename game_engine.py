@@ -0,0 +1,549 @@
+import asyncio
+import re
+import unicodedata
+import uuid
+from collections import Counter
+from contextlib import aclosing
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from game_prompts import (
+    PROMPT_SISTEMA_COMUN,
+    PROMPT_SISTEMA_NARRADOR,
+    PROMPT_SISTEMA_INVESTIGADOR,
+    PROMPT_NARRADOR_GENERADOR,
+    PROMPT_INVESTIGADOR,
+    PROMPT_NARRADOR_RESPUESTA,
+    PROMPT_NARRADOR_JUEZ,
+    PROMPT_INVESTIGADOR_RESOLUCION,
+    PROMPT_INVESTIGADOR_SESION_INICIO,
+    PROMPT_INVESTIGADOR_SESION_TURNO,
+    PROMPT_INVESTIGADOR_SESION_RESOLUCION,
+    PROMPT_NARRADOR_SESION,
+    PROMPT_NARRADOR_SESION_PREGUNTA,
+    RESPUESTA_NARRADOR_SIN_VALIDAR,
+    RESPUESTAS_NARRADOR,
+    VEREDICTOS,
+    ESQUEMA_MISTERIO,
+    PREFIJO_SOLUCION,
+    PROMPT_INVESTIGADOR_DECLARAR,
+    PROMPT_NARRADOR_COMPROBACION,
+    COMPROBACIONES,
+)
+from ai_providers import AIProvider, ChatSession, InvalidChoiceError, JsonStreamParser, SchemaError, call_context
+
+if TYPE_CHECKING:
+    from historial import PuntosControl
+    from misterios import AlmacenMisterios
+
+Evento = Dict[str, Any]
+Observador = Callable[[Evento], Awaitable[None]]
+
+
+@dataclass
+class ConfigPartida:
+    provider_narrador: str
+    model_narrador: str
+    provider_investigador: str
+    model_investigador: str
+    turnos: int = 15
+    # Conversación multi-turno con el Investigador y prompt de sistema fijo para
+    # el Narrador, para aprovechar la caché de prompts de los proveedores.
+    sesiones: bool = False
+    # Mientras el Narrador responde, genera ya la siguiente pregunta para cada
+    # una de sus tres respuestas posibles y se queda con la que acierta.
+    especulativo: bool = False
+    # Fin anticipado: el Investigador puede dar la solución en cualquier turno
+    # y/o el Juez comprueba cada `comprobar_cada` turnos si ya está resuelto.
+    declarar_solucion: bool = False
+    comprobar_cada: int = 0
+
+
+def _patron_tolerante(palabra: str) -> str:
+    """`palabra` como expresión regular que acepta también cada letra sin tilde."""
+    patron = ""
+    for letra in palabra:
+        base = unicodedata.normalize("NFKD", letra)[0]
+        patron += f"[{re.escape(letra)}{re.escape(base)}]" if base != letra else re.escape(letra)
+    return patron
+
+
+# Tolera el formato que los modelos suelen añadir: negritas, sin tilde, minúsculas.
+_SOLUCION_DECLARADA = re.compile(rf"^\W*{_patron_tolerante(PREFIJO_SOLUCION.rstrip(':'))}\W*:\W*", re.IGNORECASE)
+
+
+def extraer_solucion(texto: str) -> Optional[str]:
+    """La hipótesis si el Investigador declara la solución (`SOLUCIÓN: ...`) en lugar de preguntar."""
+    declarada = _SOLUCION_DECLARADA.match(texto)
+    if declarada is None:
+        return None
+    return texto[declarada.end():].strip() or None
+
+
+# Un JSON que ni se puede reparar ni cumple el esquema se pide de nuevo, en
+# lugar de perder la partida (y lo ya pagado) en la Fase 1.
+INTENTOS_MISTERIO = 2
+
+
+def validar_misterio(misterio: Dict[str, Any]) -> Dict[str, str]:
+    """Se queda con el enigma y la solución, que no pueden estar vacíos (el esquema no lo impide)."""
+    enigma, solucion = misterio["enigma"].strip(), misterio["solucion"].strip()
+    if not enigma or not solucion:
+        raise SchemaError("El misterio tiene el enigma o la solución vacíos.")
+    return {"enigma": enigma, "solucion": solucion}
+
+
+async def generar_misterio(provider: AIProvider) -> Dict[str, str]:
+    """Fase 1 sin streaming: pide al Narrador un misterio nuevo y devuelve su enigma y su solución."""
+    for intento in range(INTENTOS_MISTERIO):
+        try:
+            misterio = await provider.generate_json(
+                system_prompt=PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_NARRADOR,
+                user_prompt=PROMPT_NARRADOR_GENERADOR,
+                schema=ESQUEMA_MISTERIO,
+            )
+            return validar_misterio(misterio)
+        except ValueError:
+            if intento == INTENTOS_MISTERIO - 1:
+                raise
+
+
+class Partida:
+    """
+    Una partida completa de Black Stories entre un Narrador y un Investigador.
+
+    La partida no escribe nada en la terminal: cada paso se publica como un
+    evento (un diccionario con la clave `tipo`) a los observadores, que deciden
+    cómo mostrarlo. Así la misma lógica sirve para una partida interactiva y
+    para lotes de partidas concurrentes.
+
+    Con `streaming` activado, el enigma, las preguntas y la resolución se
+    publican también como eventos `fragmento` a medida que llegan los tokens.
+
+    Con `puntos_control`, el estado se guarda tras cada fase y la partida se
+    puede continuar con `Partida.reanudar` si el proceso muere a mitad.
+    """
+
+    def __init__(
+        self,
+        config: ConfigPartida,
+        narrador_provider: AIProvider,
+        investigador_provider: AIProvider,
+        observadores: Optional[List[Observador]] = None,
+        id_partida: Optional[str] = None,
+        streaming: bool = False,
+        almacen_misterios: Optional["AlmacenMisterios"] = None,
+        puntos_control: Optional["PuntosControl"] = None,
+    ):
+        self.id = id_partida or uuid.uuid4().hex[:8]
+        self.config = config
+        self.narrador_provider = narrador_provider
+        self.investigador_provider = investigador_provider
+        self.observadores = list(observadores or [])
+        self.streaming = streaming
+        self.almacen_misterios = almacen_misterios
+        self.puntos_control = puntos_control
+
+        self.fecha = datetime.now()
+        # "misterio", "investigacion" o "resolucion": la fase en la que se reanudaría.
+        self.fase = "misterio"
+        self.enigma = ""
+        self.solucion_secreta = ""
+        self.origen_misterio = ""
+        self.historial_chat: List[str] = []
+        self.turnos_jugados = 0
+        self.investigador_resolucion = ""
+        self.veredicto = ""
+        # Turno en que se ganó la partida antes de tiempo (None si no se ganó o se ganó en el veredicto final).
+        self.turnos_resolucion: Optional[int] = None
+        self.respuestas_invalidas = 0
+        self.error: Optional[str] = None
+        self.sesion_investigador: Optional[ChatSession] = None
+        self.ultima_respuesta = ""
+        self.especulacion = Counter()
+        self._pregunta_especulada: Optional[asyncio.Task] = None
+
+    @classmethod
+    def reanudar(cls, estado: Dict[str, Any], narrador_provider: AIProvider, investigador_provider: AIProvider, **opciones) -> "Partida":
+        """Reconstruye una partida a partir de su último punto de control (`Partida.estado`). `jugar` la continúa desde ahí."""
+        partida = cls(ConfigPartida(**estado["config"]), narrador_provider, investigador_provider, id_partida=estado["id"], **opciones)
+        partida.fecha = datetime.fromisoformat(estado["fecha"])
+        partida.fase = estado["fase"]
+        partida.enigma = estado["enigma"]
+        partida.solucion_secreta = estado["solucion"]
+        partida.origen_misterio = estado["origen_misterio"]
+        partida.historial_chat = list(estado["historial_chat"])
+        partida.turnos_jugados = estado["turnos_jugados"]
+        partida.ultima_respuesta = estado["ultima_respuesta"]
+        partida.respuestas_invalidas = estado["respuestas_invalidas"]
+        partida.investigador_resolucion = estado["investigador_resolucion"]
+        partida.veredicto = estado.get("veredicto", "")
+        partida.turnos_resolucion = estado.get("turnos_resolucion")
+        partida.error = estado["error"]
+        partida.especulacion = Counter(estado["especulacion"])
+        sesion = estado["sesion_investigador"]
+        if sesion is not None:
+            # Misma clave de caché: el proveedor puede seguir sirviendo el prefijo ya procesado.
+            partida.sesion_investigador = investigador_provider.session(sesion["system_prompt"], messages=sesion["messages"], cache_key=sesion["cache_key"])
+        return partida
+
+    def estado(self) -> Dict[str, Any]:
+        """Todo lo necesario para continuar la partida en otro proceso, serializable en JSON."""
+        return {
+            "id": self.id,
+            "fecha": self.fecha.isoformat(),
+            "config": asdict(self.config),
+            "fase": self.fase,
+            "enigma": self.enigma,
+            "solucion": self.solucion_secreta,
+            "origen_misterio": self.origen_misterio,
+            "historial_chat": self.historial_chat,
+            "turnos_jugados": self.turnos_jugados,
+            "ultima_respuesta": self.ultima_respuesta,
+            "respuestas_invalidas": self.respuestas_invalidas,
+            "investigador_resolucion": self.investigador_resolucion,
+            "veredicto": self.veredicto,
+            "turnos_resolucion": self.turnos_resolucion,
+            "error": self.error,
+            "especulacion": dict(self.especulacion),
+            "sesion_investigador": self.sesion_investigador.to_dict() if self.sesion_investigador is not None else None,
+        }
+
+    def _guardar_estado(self):
+        if self.puntos_control is not None:
+            self.puntos_control.guardar(self.estado())
+
+    async def _emitir(self, tipo: str, **datos):
+        evento = {"tipo": tipo, "partida": self.id, **datos}
+        for observador in self.observadores:
+            await observador(evento)
+
+    async def _fallo(self, fase: str, mensaje: str):
+        if self.error is None:
+            self.error = f"{fase}: {mensaje}"
+        await self._emitir("error", fase=fase, mensaje=mensaje)
+
+    def _contexto(self, rol: str, fase: str, **etiquetas):
+        """Etiqueta las llamadas a los proveedores hechas dentro del bloque, para las métricas."""
+        return call_context(game=self.id, role=rol, phase=fase, **etiquetas)
+
+    async def _generar_texto(self, rol: str, fase: str, completo: Callable[[], Awaitable[str]], en_fragmentos: Callable[[], AsyncIterator[str]], **datos) -> str:
+        with self._contexto(rol, fase, turn=datos.get("turno")):
+            if not self.streaming:
+                return await completo()
+            fragmentos = []
+            async for fragmento in en_fragmentos():
+                fragmentos.append(fragmento)
+                await self._emitir("fragmento", rol=rol, fase=fase, texto=fragmento, **datos)
+            return "".join(fragmentos)
+
+    def _llamada_investigador(self, fase: str, historial_chat: List[str], sesion: Optional[ChatSession], respuesta: str):
+        """
+        Prepara la llamada al Investigador para el estado indicado, sin modificar
+        la partida. Devuelve las funciones que piden el texto completo o en
+        fragmentos y la sesión que hay que conservar después de la llamada.
+        """
+        system_prompt = PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_INVESTIGADOR
+        if self.config.declarar_solucion:
+            system_prompt += "\n" + PROMPT_INVESTIGADOR_DECLARAR
+        if self.config.sesiones and (sesion is not None or fase == "pregunta"):
+            if sesion is None:
+                sesion = self.investigador_provider.session(system_prompt)
+                mensaje = PROMPT_INVESTIGADOR_SESION_INICIO.format(enigma=self.enigma)
+            elif fase == "pregunta":
+                mensaje = PROMPT_INVESTIGADOR_SESION_TURNO.format(respuesta=respuesta)
+            else:
+                mensaje = PROMPT_INVESTIGADOR_SESION_RESOLUCION.format(respuesta=respuesta)
+            return (lambda: sesion.send(mensaje)), (lambda: sesion.stream(mensaje)), sesion
+
+        plantilla = PROMPT_INVESTIGADOR if fase == "pregunta" else PROMPT_INVESTIGADOR_RESOLUCION
+        user_prompt = plantilla.format(enigma=self.enigma, historial_chat="\n".join(historial_chat))
+        provider = self.investigador_provider
+        return (
+            lambda: provider.generate_text(system_prompt=system_prompt, user_prompt=user_prompt),
+            lambda: provider.stream_text(system_prompt=system_prompt, user_prompt=user_prompt),
+            sesion,
+        )
+
+    async def _texto_investigador(self, fase: str, **datos) -> str:
+        """Pide al Investigador su siguiente pregunta (`fase="pregunta"`) o su resolución final."""
+        completo, en_fragmentos, sesion = self._llamada_investigador(fase, self.historial_chat, self.sesion_investigador, self.ultima_respuesta)
+        texto = await self._generar_texto("investigador", fase, completo, en_fragmentos, **datos)
+        self.sesion_investigador = sesion
+        return texto
+
+    async def _rama_especulativa(self, turno: int, pregunta: str, respuesta: str) -> Tuple[str, Optional[ChatSession]]:
+        """Genera la pregunta del turno siguiente a `turno` suponiendo que el Narrador responde `respuesta` a `pregunta`."""
+        historial_chat = self.historial_chat + [f"Investigador: {pregunta}", f"Narrador: {respuesta}"]
+        sesion = self.sesion_investigador.fork() if self.sesion_investigador is not None else None
+        completo, _, sesion = self._llamada_investigador("pregunta", historial_chat, sesion, respuesta)
+        with self._contexto("investigador", "pregunta", turn=turno + 1, speculative=respuesta):
+            return await completo(), sesion
+
+    async def _resolver_ramas(self, ramas: Dict[str, asyncio.Task], respuesta: str) -> Optional[asyncio.Task]:
+        """Se queda con la rama que coincide con la respuesta real y cancela el resto."""
+        if not ramas:
+            return None
+        elegida = ramas.pop(respuesta, None)
+        self.especulacion["aciertos" if elegida is not None else "fallos"] += 1
+        for tarea in ramas.values():
+            if tarea.done():
+                self.especulacion["desperdiciadas"] += 1 # Ya se pagó entera
+            else:
+                tarea.cancel()
+                self.especulacion["canceladas"] += 1
+        await asyncio.gather(*ramas.values(), return_exceptions=True)
+        return elegida
+
+    def _prompts_narrador(self, pregunta: str):
+        if self.config.sesiones:
+            return (
+                PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_NARRADOR + "\n" + PROMPT_NARRADOR_SESION.format(solucion_secreta=self.solucion_secreta),
+                PROMPT_NARRADOR_SESION_PREGUNTA.format(pregunta_investigador=pregunta),
+            )
+        return (
+            PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_NARRADOR,
+            PROMPT_NARRADOR_RESPUESTA.format(solucion_secreta=self.solucion_secreta, pregunta_investigador=pregunta),
+        )
+
+    async def _generar_misterio(self) -> Dict[str, Any]:
+        if not self.streaming:
+            return await generar_misterio(self.narrador_provider)
+        system_prompt = PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_NARRADOR
+        for intento in range(INTENTOS_MISTERIO):
+            # El JSON se valida a medida que llega: si un campo sale mal, se corta
+            # la generación ahí y se pide otra, sin pagar el resto.
+            lector = JsonStreamParser(ESQUEMA_MISTERIO)
+            enigma_publicado = ""
+            try:
+                async with aclosing(self.narrador_provider.stream_json(system_prompt=system_prompt, user_prompt=PROMPT_NARRADOR_GENERADOR, schema=ESQUEMA_MISTERIO)) as fragmentos:
+                    async for fragmento in fragmentos:
+                        lector.feed(fragmento)
+                        # Del JSON que va llegando solo se publica el enigma; la solución es secreta.
+                        enigma = lector.partial().get("enigma") or ""
+                        if len(enigma) > len(enigma_publicado):
+                            await self._emitir("fragmento", rol="narrador", fase="misterio", texto=enigma[len(enigma_publicado):])
+                            enigma_publicado = enigma
+                return validar_misterio(lector.result())
+            except ValueError as e:
+                if intento == INTENTOS_MISTERIO - 1:
+                    raise
+                await self._emitir("reintento", rol="narrador", fase="misterio", motivo=str(e))
+                await self._emitir("pensando", rol="narrador", fase="misterio")
+
+    async def _comprobar(self, turno: int, propuesta: Optional[str] = None) -> Optional[bool]:
+        """
+        Pregunta al Juez si el misterio ya está resuelto: con la solución que
+        propone el Investigador o, sin ella, solo con el historial. Devuelve
+        None si el Juez falla; la partida sigue como si nada.
+        """
+        await self._emitir("pensando", rol="narrador", fase="comprobacion", turno=turno)
+        historial_chat = "\n".join(self.historial_chat)
+        try:
+            with self._contexto("narrador", "comprobacion", turn=turno):
+                if propuesta is not None:
+                    resuelto = await self.narrador_provider.generate_choice(
+                        system_prompt=PROMPT_SISTEMA_NARRADOR,
+                        user_prompt=PROMPT_NARRADOR_JUEZ.format(solucion_secreta=self.solucion_secreta, historial_chat=historial_chat + f"\nResolución del Investigador: {propuesta}"),
+                        choices=VEREDICTOS,
+                    ) == "GANADOR"
+                else:
+                    resuelto = await self.narrador_provider.generate_choice(
+                        system_prompt=PROMPT_SISTEMA_NARRADOR,
+                        user_prompt=PROMPT_NARRADOR_COMPROBACION.format(solucion_secreta=self.solucion_secreta, historial_chat=historial_chat),
+                        choices=COMPROBACIONES,
+                    ) == "RESUELTO"
+        except Exception as e:
+            await self._emitir("error", fase="comprobacion", mensaje=str(e))
+            return None
+        await self._emitir("comprobacion", turno=turno, resuelto=resuelto, propuesta=propuesta is not None)
+        if resuelto:
+            self.veredicto = "GANADOR"
+            self.turnos_resolucion = turno
+        return resuelto
+
+    async def _turno_propuesta(self, turno: int, propuesta: str) -> bool:
+        """Un turno en el que el Investigador da la solución en lugar de preguntar. Devuelve False si acierta."""
+        await self._emitir("solucion_propuesta", turno=turno, texto=propuesta)
+        resuelto = await self._comprobar(turno, propuesta)
+        self.turnos_jugados = turno
+        if resuelto:
+            self.investigador_resolucion = propuesta
+            self.historial_chat.append(f"Investigador (Resolución Final): {propuesta}")
+        elif resuelto is False:
+            self.ultima_respuesta = "no"
+            self.historial_chat.append(f"Investigador (Propuesta de solución): {propuesta}")
+            self.historial_chat.append("Narrador: no")
+        else:
+            self.ultima_respuesta = RESPUESTA_NARRADOR_SIN_VALIDAR
+            await self._emitir("turno_incompleto", turno=turno)
+        self._guardar_estado()
+        return not resuelto
+
+    # Fase 1: Creación del Misterio
+    async def crear_misterio(self) -> bool:
+        # Con una reserva de misterios, la partida empieza sin esperar al Narrador.
+        misterio = self.almacen_misterios.tomar() if self.almacen_misterios else None
+        origen = "reserva"
+        if misterio is None:
+            origen = "generado"
+            await self._emitir("pensando", rol="narrador", fase="misterio")
+            try:
+                with self._contexto("narrador", "misterio"):
+                    misterio = await self._generar_misterio()
+            except Exception as e:
+                await self._fallo("misterio", str(e))
+                return False
+            if self.almacen_misterios:
+                # Se guarda como ya usado para que la reserva no lo repita más adelante.
+                self.almacen_misterios.anadir(
+                    misterio["enigma"], misterio["solucion"],
+                    self.narrador_provider.provider_name, self.narrador_provider.model_name, usado=True,
+                )
+        self.enigma = misterio["enigma"]
+        self.solucion_secreta = misterio["solucion"]
+        self.origen_misterio = origen
+        self.fase = "investigacion"
+        self._guardar_estado()
+        await self._emitir("misterio", enigma=self.enigma, origen=origen)
+        return True
+
+    # Fase 2: Investigación (un turno del bucle)
+    async def jugar_turno(self, turno: int) -> bool:
+        """Juega un turno. Devuelve False si la investigación termina aquí: por un error o porque ya está resuelta."""
+        await self._emitir("turno", turno=turno, total=self.config.turnos)
+
+        # a. Turno del Investigador
+        await self._emitir("pensando", rol="investigador", fase="pregunta", turno=turno)
+        try:
+            if self._pregunta_especulada is not None:
+                tarea, self._pregunta_especulada = self._pregunta_especulada, None
+                investigador_question, self.sesion_investigador = await tarea
+            else:
+                investigador_question = await self._texto_investigador("pregunta", turno=turno)
+        except Exception as e:
+            await self._fallo("pregunta", str(e))
+            return False
+        propuesta = extraer_solucion(investigador_question) if self.config.declarar_solucion else None
+        if propuesta is not None:
+            return await self._turno_propuesta(turno, propuesta)
+        await self._emitir("pregunta", turno=turno, texto=investigador_question)
+
+        # b. Turno del Narrador
+        await self._emitir("pensando", rol="narrador", fase="respuesta", turno=turno)
+        # La respuesta se restringe a las tres opciones válidas en el propio proveedor.
+        # Si aun así el modelo se desvía, el turno se descarta en lugar de inventar una respuesta.
+        narrador_answer = ""
+        self.ultima_respuesta = RESPUESTA_NARRADOR_SIN_VALIDAR
+        system_prompt, user_prompt = self._prompts_narrador(investigador_question)
+        ramas = {}
+        if self.config.especulativo and turno < self.config.turnos:
+            ramas = {
+                respuesta: asyncio.create_task(self._rama_especulativa(turno, investigador_question, respuesta))
+                for respuesta in RESPUESTAS_NARRADOR
+            }
+            self.especulacion["ramas"] += len(ramas)
+        try:
+            with self._contexto("narrador", "respuesta", turn=turno):
+                narrador_answer = await self.narrador_provider.generate_choice(
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    choices=RESPUESTAS_NARRADOR,
+                )
+            self.ultima_respuesta = narrador_answer
+            await self._emitir("respuesta", turno=turno, texto=narrador_answer)
+        except InvalidChoiceError as e:
+            self.respuestas_invalidas += 1
+            await self._emitir("respuesta_invalida", turno=turno, texto=e.text)
+        except Exception as e:
+            await self._resolver_ramas(ramas, "")
+            await self._fallo("respuesta", str(e))
+            return False
+        self._pregunta_especulada = await self._resolver_ramas(ramas, narrador_answer)
+
+        # c. Actualización de Estado
+        # Solo añadir al historial si ambos se generaron correctamente
+        if investigador_question and narrador_answer:
+            self.historial_chat.append(f"Investigador: {investigador_question}")
+            self.historial_chat.append(f"Narrador: {narrador_answer}")
+        else:
+            await self._emitir("turno_incompleto", turno=turno)
+        self.turnos_jugados = turno
+        self._guardar_estado()
+
+        # d. Comprobación periódica del Juez (no hace falta tras el último turno: llega la resolución)
+        cada = self.config.comprobar_cada
+        if cada and turno % cada == 0 and turno < self.config.turnos and narrador_answer:
+            if await self._comprobar(turno):
+                self._guardar_estado()
+                return False
+        return True
+
+    # Fase 3: Revelación (El Final)
+    async def resolver(self):
+        await self._emitir("fin_investigacion", solucion=self.solucion_secreta)
+        if self.veredicto:
+            # Ganada durante la investigación: sobran la resolución final y el juicio.
+            await self._emitir("veredicto", veredicto=self.veredicto, turno=self.turnos_resolucion)
+            return
+
+        # Fase 3.1: Resolución del Investigador (ya hecha si la partida se reanuda en el veredicto)
+        if not self.investigador_resolucion:
+            await self._emitir("pensando", rol="investigador", fase="resolucion")
+            try:
+                self.investigador_resolucion = await self._texto_investigador("resolucion")
+                self.historial_chat.append(f"Investigador (Resolución Final): {self.investigador_resolucion}")
+                await self._emitir("resolucion", texto=self.investigador_resolucion)
+            except Exception as e:
+                await self._fallo("resolucion", str(e))
+                self.investigador_resolucion = "ERROR_RESOLUCION"
+            self._guardar_estado()
+
+        # Juicio Final
+        await self._emitir("pensando", rol="narrador", fase="veredicto")
+        try:
+            with self._contexto("narrador", "veredicto"):
+                self.veredicto = await self.narrador_provider.generate_choice(
+                    system_prompt=PROMPT_SISTEMA_NARRADOR, # Solo el prompt del narrador para el juicio
+                    user_prompt=PROMPT_NARRADOR_JUEZ.format(
+                        solucion_secreta=self.solucion_secreta,
+                        historial_chat="\n".join(self.historial_chat) + f"\nResolución del Investigador: {self.investigador_resolucion}"
+                    ),
+                    choices=VEREDICTOS,
+                )
+            await self._emitir("veredicto", veredicto=self.veredicto)
+        except Exception as e:
+            await self._fallo("veredicto", str(e))
+            self.veredicto = "ERROR"
+
+    async def jugar(self) -> "Partida":
+        """Juega la partida hasta el veredicto, o la continúa si viene de `Partida.reanudar`."""
+        reanudada = self.fase != "misterio"
+        if reanudada:
+            await self._emitir("inicio", config=asdict(self.config), fecha=self.fecha.isoformat(), reanudada=True, turnos_jugados=self.turnos_jugados)
+            await self._emitir("misterio", enigma=self.enigma, origen=self.origen_misterio)
+        else:
+            await self._emitir("inicio", config=asdict(self.config), fecha=self.fecha.isoformat())
+        if reanudada or await self.crear_misterio():
+            if self.fase == "investigacion":
+                # Una partida ya ganada (y reanudada justo después) no juega más turnos.
+                ultimo_turno = self.turnos_jugados if self.veredicto else self.config.turnos
+                for turno in range(self.turnos_jugados + 1, ultimo_turno + 1):
+                    if not await self.jugar_turno(turno):
+                        break
+                if self._pregunta_especulada is not None:
+                    self._pregunta_especulada.cancel()
+                    await asyncio.gather(self._pregunta_especulada, return_exceptions=True)
+                    self._pregunta_especulada = None
+                self.fase = "resolucion"
+                self._guardar_estado()
+            await self.resolver()
+        await self._emitir(
+            "fin", veredicto=self.veredicto, turnos_jugados=self.turnos_jugados, turnos_resolucion=self.turnos_resolucion,
+            respuestas_invalidas=self.respuestas_invalidas, error=self.error, especulacion=dict(self.especulacion),
+        )
+        if self.puntos_control is not None:
+            self.puntos_control.borrar(self.id)
+        return self
+
@@ -3,6 +3,10 @@ PROMPT_SISTEMA_COMUN = "Eres una IA participando en un juego de misterio 'Black
 PROMPT_SISTEMA_NARRADOR = "Tu rol es ser el 'Narrador'. Eres el guardián del secreto. Nunca des pistas. Eres estricto, literal y misterioso. Nunca rompas las reglas del juego."
 PROMPT_SISTEMA_INVESTIGADOR = "Tu rol es ser el 'Investigador'. Eres lógico, metódico y brillante. Tu objetivo es descubrir la verdad haciendo preguntas inteligentes de sí/no."
 
+# Respuestas permitidas (las llamadas se restringen a estos valores)
+RESPUESTAS_NARRADOR = ["sí", "no", "no es relevante"]
+VEREDICTOS = ["GANADOR", "PERDEDOR"]
+
 # Prompts de Tarea (Juego)
 
 # 1. PROMPT_NARRADOR_GENERADOR (Fase 1)
@@ -12,6 +16,18 @@ Tarea: Debes generar una historia con una premisa (enigma) corta y una solución
 Formato OBLIGATORIO: Responde SOLAMENTE con un objeto JSON válido, sin ningún texto antes ni después. El JSON debe tener dos claves: `enigma` (string) y `solucion` (string).
 """
 
+# Esquema del JSON de la Fase 1, para la salida estructurada de cada proveedor.
+# El enigma va primero: en streaming se muestra mientras llega la solución.
+ESQUEMA_MISTERIO = {
+    "type": "object",
+    "properties": {
+        "enigma": {"type": "string"},
+        "solucion": {"type": "string"},
+    },
+    "required": ["enigma", "solucion"],
+    "additionalProperties": False,
+}
+
 # 2. PROMPT_INVESTIGADOR (Fase 2)
 PROMPT_INVESTIGADOR = """
 Rol: Eres un detective brillante resolviendo un misterio.
@@ -44,3 +60,52 @@ Rol: Eres un detective brillante que ha terminado su investigación.
 Contexto: Este es el enigma: `{enigma}`. Este es el historial completo de la investigación: `{historial_chat}`.
 Tarea: Basándote en toda la información recopilada, formula tu resolución final del misterio. No hagas una pregunta. Responde SOLAMENTE con tu hipótesis de la solución, sin texto adicional.
 """
+
+# 6. Modo sesión (Fase 2 y 3)
+# El Investigador mantiene una conversación: el enigma va en el primer mensaje y
+# cada turno solo añade la respuesta del Narrador, en lugar de reescribir todo
+# el historial. Así el prefijo de la conversación se puede servir desde la caché
+# de prompts del proveedor.
+PROMPT_INVESTIGADOR_SESION_INICIO = """
+Rol: Eres un detective brillante resolviendo un misterio.
+Reglas: Tu única herramienta son preguntas de 'sí' o 'no'. El Narrador solo puede responder 'sí', 'no', o 'no es relevante'. No hagas preguntas abiertas.
+Contexto: Este es el enigma: `{enigma}`. Después de cada pregunta recibirás la respuesta del Narrador.
+Tarea: Formula tu primera pregunta de 'sí' o 'no'. Responde SOLAMENTE con la pregunta, sin texto adicional.
+"""
+
+PROMPT_INVESTIGADOR_SESION_TURNO = """Narrador: {respuesta}
+Formula tu siguiente pregunta de 'sí' o 'no'. Responde SOLAMENTE con la pregunta, sin texto adicional."""
+
+PROMPT_INVESTIGADOR_SESION_RESOLUCION = """Narrador: {respuesta}
+La investigación ha terminado. Basándote en toda la información recopilada, formula tu resolución final del misterio. No hagas una pregunta. Responde SOLAMENTE con tu hipótesis de la solución, sin texto adicional."""
+
+RESPUESTA_NARRADOR_SIN_VALIDAR = "(el Narrador no dio una respuesta válida)"
+
+# El Narrador lleva la solución en el prompt de sistema, idéntico en todos los
+# turnos (y por tanto cacheable); cada turno solo envía la pregunta.
+PROMPT_NARRADOR_SESION = """
+Reglas: Tu única respuesta permitida es ESTRICTAMENTE una de estas tres opciones: `sí`, `no`, `no es relevante`. No puedes dar pistas, ni explicaciones. Si la pregunta es parcialmente cierta, pero no del todo, responde `no`.
+Contexto: Esta es la solución secreta que SÓLO TÚ CONOCES: `{solucion_secreta}`.
+"""
+
+PROMPT_NARRADOR_SESION_PREGUNTA = """El investigador pregunta: `{pregunta_investigador}`. Compara la pregunta con la solución secreta y responde ESTRICTAMENTE con `sí`, `no`, o `no es relevante`."""
+
+# 7. Fin anticipado (opcional)
+# El Investigador puede dar la solución en lugar de preguntar; el Juez la
+# comprueba al momento y, si es correcta, la partida termina ahí. Va en su
+# prompt de sistema, igual con sesiones que sin ellas.
+PREFIJO_SOLUCION = "SOLUCIÓN:"
+
+PROMPT_INVESTIGADOR_DECLARAR = f"""Si crees que ya conoces la solución, en lugar de una pregunta responde `{PREFIJO_SOLUCION}` seguido de tu hipótesis completa. Si fallas, el Narrador responderá `no` y la investigación seguirá."""
+
+# Comprobación periódica del Juez a mitad de partida: una sola palabra, sin esperar a la resolución.
+COMPROBACIONES = ["RESUELTO", "SIGUE"]
+
+PROMPT_NARRADOR_COMPROBACION = """
+Rol: Eres el Juez del juego 'Black Stories'.
+Contexto: La partida sigue en curso. Vas a decidir si el Investigador ya ha resuelto el misterio.
+Información: Esta es la solución secreta: `{solucion_secreta}`.
+Historial: Este es el historial de preguntas y respuestas hasta ahora: `{historial_chat}`.
+Tarea: Si con estas preguntas y sus respuestas el Investigador ya ha descubierto los puntos clave de la solución (incluso si no ha adivinado cada detalle), el misterio está resuelto. Si todavía le faltan puntos clave, la partida sigue.
+Formato OBLIGATORIO: Responde SOLAMENTE con la palabra `RESUELTO` o la palabra `SIGUE`.
+"""
@@ -0,0 +1,415 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ai_providers import MetricsRecorder
+from game_engine import Evento
+
+DIRECTORIO = "./historial_partidas"
+INDICE = os.path.join(DIRECTORIO, "indice.sqlite")
+EN_CURSO = os.path.join(DIRECTORIO, "en_curso")
+# Los fragmentos y los spinners solo sirven para mostrar la partida en vivo.
+TIPOS_SIN_GUARDAR = {"fragmento", "pensando"}
+
+
+class IndicePartidas:
+    """
+    Metadatos y resultados de todas las partidas en un fichero SQLite, una fila
+    por partida, para consultas agregadas sin volver a leer las transcripciones.
+
+    La fila se crea al empezar la partida y se completa al terminar; las que se
+    quedan sin `terminada` se interrumpieron. Varios procesos pueden compartir el
+    mismo índice.
+    """
+
+    def __init__(self, ruta: str = INDICE):
+        self.ruta = ruta
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._db = sqlite3.connect(ruta, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS partidas (
+                id TEXT PRIMARY KEY,
+                fecha TEXT NOT NULL,
+                transcripcion TEXT NOT NULL,
+                proveedor_narrador TEXT NOT NULL,
+                modelo_narrador TEXT NOT NULL,
+                proveedor_investigador TEXT NOT NULL,
+                modelo_investigador TEXT NOT NULL,
+                turnos INTEGER NOT NULL,
+                origen_misterio TEXT,
+                enigma TEXT,
+                turnos_jugados INTEGER,
+                turnos_resolucion INTEGER,
+                respuestas_invalidas INTEGER NOT NULL DEFAULT 0,
+                veredicto TEXT,
+                error TEXT,
+                llamadas INTEGER,
+                tokens_entrada INTEGER,
+                tokens_salida INTEGER,
+                coste REAL,
+                duracion REAL,
+                terminada REAL
+            );
+            CREATE INDEX IF NOT EXISTS partidas_modelos ON partidas(modelo_narrador, modelo_investigador);
+            CREATE INDEX IF NOT EXISTS partidas_fecha ON partidas(fecha);
+        """)
+
+    def empezar(self, id_partida: str, fecha: str, transcripcion: str, config: Dict[str, Any]):
+        self._db.execute(
+            "INSERT OR REPLACE INTO partidas (id, fecha, transcripcion, proveedor_narrador, modelo_narrador, proveedor_investigador, modelo_investigador, turnos) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (id_partida, fecha, transcripcion, config["provider_narrador"], config["model_narrador"], config["provider_investigador"], config["model_investigador"], config["turnos"]),
+        )
+
+    def actualizar(self, id_partida: str, **campos):
+        asignaciones = ", ".join(f"{campo} = ?" for campo in campos)
+        self._db.execute(f"UPDATE partidas SET {asignaciones} WHERE id = ?", (*campos.values(), id_partida))
+
+    def transcripcion(self, id_partida: str) -> Optional[str]:
+        fila = self._db.execute("SELECT transcripcion FROM partidas WHERE id = ?", (id_partida,)).fetchone()
+        return fila["transcripcion"] if fila else None
+
+    def consultar(self, sql: str, parametros: tuple = ()) -> List[Dict[str, Any]]:
+        """Ejecuta una consulta de lectura sobre la tabla `partidas`."""
+        return [dict(fila) for fila in self._db.execute(sql, parametros)]
+
+    def resultados_por_modelos(self) -> List[Dict[str, Any]]:
+        """
+        Partidas, porcentaje de victorias, turnos medios (jugados, y hasta ganar
+        en las que terminaron antes de tiempo) y coste por pareja de modelos, de
+        más a menos partidas.
+        """
+        return self.consultar("""
+            SELECT proveedor_narrador, modelo_narrador, proveedor_investigador, modelo_investigador,
+                   COUNT(*) AS partidas,
+                   AVG(veredicto = 'GANADOR') AS victorias,
+                   AVG(turnos_jugados) AS turnos_medios,
+                   AVG(turnos_resolucion) AS turnos_para_resolver,
+                   SUM(veredicto = 'ERROR' OR error IS NOT NULL) AS errores,
+                   SUM(coste) AS coste,
+                   AVG(duracion) AS duracion_media
+            FROM partidas
+            WHERE terminada IS NOT NULL
+            GROUP BY proveedor_narrador, modelo_narrador, proveedor_investigador, modelo_investigador
+            ORDER BY partidas DESC
+        """)
+
+    def cerrar(self):
+        self._db.close()
+
+
+class RegistroPartidas:
+    """
+    Observador que guarda cada partida en un JSONL según ocurre: un evento por
+    línea, escrito y volcado al instante, de modo que una partida interrumpida
+    conserva todo lo jugado hasta entonces. Al terminar añade una línea por
+    llamada a los modelos (con `metricas`) y completa su fila en `indice`.
+
+    Sirve para varias partidas a la vez; `rutas` guarda la transcripción de cada una.
+    """
+
+    def __init__(self, directorio: str = DIRECTORIO, indice: Optional[IndicePartidas] = None, metricas: Optional[MetricsRecorder] = None):
+        self.directorio = directorio
+        self.indice = indice
+        self.metricas = metricas
+        self.rutas: Dict[str, str] = {}
+        self._ficheros: Dict[str, Any] = {}
+        self._inicios: Dict[str, float] = {}
+        os.makedirs(directorio, exist_ok=True)
+
+    def _escribir(self, id_partida: str, linea: Dict[str, Any]):
+        fichero = self._ficheros[id_partida]
+        fichero.write(json.dumps(linea, ensure_ascii=False) + "\n")
+        fichero.flush()
+
+    async def __call__(self, evento: Evento):
+        tipo, id_partida = evento["tipo"], evento["partida"]
+        if tipo in TIPOS_SIN_GUARDAR:
+            return
+        if tipo == "inicio":
+            fecha = datetime.fromisoformat(evento["fecha"])
+            ruta = os.path.join(self.directorio, f"partida_{fecha.strftime('%Y%m%d_%H%M%S')}_{id_partida}.jsonl")
+            self.rutas[id_partida] = ruta
+            self._ficheros[id_partida] = open(ruta, "a", encoding="utf-8")
+            self._inicios[id_partida] = time.time()
+            if self.indice is not None:
+                self.indice.empezar(id_partida, evento["fecha"], ruta, evento["config"])
+        if id_partida not in self._ficheros:
+            return
+        self._escribir(id_partida, {"t": time.time(), **evento})
+
+        if self.indice is not None and tipo == "misterio":
+            self.indice.actualizar(id_partida, origen_misterio=evento["origen"], enigma=evento["enigma"])
+        elif tipo == "fin":
+            self._terminar(evento)
+
+    def _terminar(self, evento: Evento):
+        id_partida = evento["partida"]
+        registros = self.metricas.for_game(id_partida) if self.metricas else []
+        for registro in registros:
+            self._escribir(id_partida, {"tipo": "llamada", "partida": id_partida, **registro})
+        self._ficheros.pop(id_partida).close()
+        if self.indice is not None:
+            costes = [registro["cost"] for registro in registros if registro["cost"] is not None]
+            self.indice.actualizar(
+                id_partida,
+                turnos_jugados=evento["turnos_jugados"],
+                turnos_resolucion=evento.get("turnos_resolucion"),
+                respuestas_invalidas=evento.get("respuestas_invalidas", 0),
+                veredicto=evento["veredicto"] or None,
+                error=evento.get("error"),
+                llamadas=len(registros),
+                tokens_entrada=sum(registro["input_tokens"] for registro in registros),
+                tokens_salida=sum(registro["output_tokens"] for registro in registros),
+                coste=sum(costes) if costes else None,
+                duracion=time.time() - self._inicios.pop(id_partida),
+                terminada=time.time(),
+            )
+
+    def descartar(self, id_partida: str):
+        """Cierra la transcripción de una partida que no va a terminar; lo escrito hasta entonces se conserva."""
+        fichero = self._ficheros.pop(id_partida, None)
+        if fichero is not None:
+            fichero.close()
+        self._inicios.pop(id_partida, None)
+
+    def cerrar(self):
+        """Cierra las transcripciones de las partidas que no llegaron a terminar."""
+        for fichero in self._ficheros.values():
+            fichero.close()
+        self._ficheros.clear()
+
+
+def _proceso_vivo(pid: int) -> bool:
+    if os.name == "nt":
+        # En Windows os.kill terminaría el proceso; allí no se distingue y se da por muerto.
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class PuntosControl:
+    """
+    El estado de cada partida en curso (`Partida.estado`) en un JSON propio,
+    reescrito tras cada fase y borrado al terminar la partida. Cada escritura
+    va a un fichero temporal que luego reemplaza al anterior, así que un corte
+    a mitad nunca deja un punto de control a medias.
+
+    Cada punto de control lleva el proceso que lo escribió, para que otro
+    proceso que comparta el directorio no reanude una partida que sigue viva.
+    """
+
+    def __init__(self, directorio: str = EN_CURSO):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, id_partida: str) -> str:
+        return os.path.join(self.directorio, f"{id_partida}.json")
+
+    def guardar(self, estado: Dict[str, Any]):
+        ruta = self._ruta(estado["id"])
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({**estado, "proceso": os.getpid(), "equipo": socket.gethostname()}, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    def cargar(self, id_partida: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._ruta(id_partida), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def borrar(self, id_partida: str):
+        try:
+            os.remove(self._ruta(id_partida))
+        except FileNotFoundError:
+            pass
+
+    def apartar(self, id_partida: str):
+        """Renombra un punto de control que no se puede cargar, para que no se vuelva a intentar reanudarlo."""
+        try:
+            os.replace(self._ruta(id_partida), f"{self._ruta(id_partida)}.danado")
+        except FileNotFoundError:
+            pass
+
+    def pendientes(self, config: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Las partidas sin terminar de procesos que ya no existen (con `config`,
+        solo las que la tienen), de la más antigua a la más reciente. Los
+        puntos de control ilegibles se apartan.
+        """
+        estados = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".json"):
+                continue
+            id_partida = nombre[:-len(".json")]
+            try:
+                estado = self.cargar(id_partida)
+            except ValueError:
+                estado = {}
+            if estado is None:
+                continue
+            if not isinstance(estado, dict) or not {"id", "fecha", "config", "proceso"} <= estado.keys():
+                self.apartar(id_partida)
+                continue
+            if config is not None and estado["config"] != config:
+                continue
+            if estado.get("equipo") == socket.gethostname() and _proceso_vivo(estado["proceso"]):
+                continue
+            estados.append(estado)
+        return sorted(estados, key=lambda estado: estado["fecha"])
+
+
+def cargar_transcripcion(ruta: str) -> List[Evento]:
+    """Lee los eventos de una transcripción JSONL. Una última línea a medias (la partida se cortó al escribirla) se ignora."""
+    eventos = []
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                eventos.append(json.loads(linea))
+            except json.JSONDecodeError:
+                break
+    return eventos
+
+
+def transcripcion_markdown(eventos: List[Evento]) -> str:
+    """La transcripción en Markdown, con la tabla de métricas y un diagrama Mermaid de la investigación."""
+    config: Dict[str, Any] = {}
+    fecha = enigma = solucion = resolucion = veredicto = ""
+    # Por número de turno: una partida reanudada puede repetir el turno que se cortó.
+    turnos: Dict[int, tuple] = {}
+    preguntas: Dict[int, str] = {}
+    propuestas: Dict[int, str] = {}
+    errores: List[str] = []
+    metricas: List[Dict[str, Any]] = []
+    fin: Dict[str, Any] = {}
+    for evento in eventos:
+        tipo = evento["tipo"]
+        if tipo == "inicio":
+            config, fecha = evento["config"], evento["fecha"]
+        elif tipo == "misterio":
+            enigma = evento["enigma"]
+        elif tipo == "pregunta":
+            preguntas[evento["turno"]] = evento["texto"]
+        elif tipo == "solucion_propuesta":
+            propuestas[evento["turno"]] = evento["texto"]
+        elif tipo == "comprobacion" and evento["propuesta"]:
+            propuesta = propuestas[evento["turno"]]
+            if evento["resuelto"]:
+                resolucion = propuesta
+            else:
+                turnos[evento["turno"]] = (f"(Propuesta de solución) {propuesta}", "no")
+        elif tipo == "respuesta":
+            # Como en la partida, solo los turnos completos pasan al historial.
+            turnos[evento["turno"]] = (preguntas.get(evento["turno"], ""), evento["texto"])
+        elif tipo == "fin_investigacion":
+            solucion = evento["solucion"]
+        elif tipo == "resolucion":
+            resolucion = evento["texto"]
+        elif tipo == "veredicto":
+            veredicto = evento["veredicto"]
+        elif tipo == "error":
+            errores.append(f"{evento['fase']}: {evento['mensaje']}")
+        elif tipo == "fin":
+            fin = evento
+        elif tipo == "llamada":
+            metricas.append(evento)
+    historial = [linea for _, (pregunta, respuesta) in sorted(turnos.items()) for linea in (f"Investigador: {pregunta}", f"Narrador: {respuesta}")]
+    if resolucion:
+        historial.append(f"Investigador (Resolución Final): {resolucion}")
+
+    lineas = [
+        "# BlackStory AI - Transcripción de Partida\n",
+        f"**Fecha:** {datetime.fromisoformat(fecha).strftime('%Y-%m-%d %H:%M:%S') if fecha else '-'}",
+        f"**Narrador:** {config.get('provider_narrador')} ({config.get('model_narrador')})",
+        f"**Investigador:** {config.get('provider_investigador')} ({config.get('model_investigador')})",
+        f"**Turnos:** {config.get('turnos')}\n",
+        f"## Enigma\n{enigma}\n",
+        f"## Solución Secreta\n{solucion}\n",
+        "## Historial de Chat",
+        *(f"- {linea}" for linea in historial),
+        f"\n## Veredicto Final\n{veredicto or ('(partida sin terminar)' if not fin else '')}\n",
+    ]
+    if fin.get("especulacion"):
+        resumen = ", ".join(f"{clave}: {valor}" for clave, valor in sorted(fin["especulacion"].items()))
+        lineas.append(f"**Especulación:** {resumen}\n")
+    if fin.get("turnos_resolucion") is not None:
+        lineas.append(f"**Resuelto en el turno:** {fin['turnos_resolucion']} de {config.get('turnos')}\n")
+    if fin.get("respuestas_invalidas"):
+        lineas.append(f"**Respuestas inválidas del Narrador descartadas:** {fin['respuestas_invalidas']}\n")
+    if errores:
+        lineas.append(f"## Error\n{errores[0]}\n")
+    if metricas:
+        lineas += [
+            "## Métricas",
+            "| Rol | Fase | Turno | Modelo | Tiempo (s) | Primer token (s) | Tokens entrada | Tokens salida | Reintentos | Coste (USD) | Notas |",
+            "|---|---|---|---|---|---|---|---|---|---|---|",
+        ]
+        for registro in metricas:
+            primer_token = f"{registro['ttft']:.2f}" if registro["ttft"] is not None else "-"
+            coste = f"{registro['cost']:.6f}" if registro["cost"] is not None else "-"
+            notas = []
+            if registro.get("speculative"):
+                notas.append(f"especulativa ({registro['speculative']})")
+            if registro["error"]:
+                notas.append("cancelada" if registro["error"] == "CancelledError" else registro["error"])
+            lineas.append(
+                f"| {registro.get('role', '-')} | {registro.get('phase', '-')} | {registro.get('turn') or '-'} | {registro['model']} "
+                f"| {registro['duration']:.2f} | {primer_token} | {registro['input_tokens']} | {registro['output_tokens']} "
+                f"| {registro['retries']} | {coste} | {', '.join(notas)} |"
+            )
+        costes = [registro["cost"] for registro in metricas if registro["cost"] is not None]
+        lineas.append(
+            f"\n**Total:** {len(metricas)} llamadas, {sum(r['duration'] for r in metricas):.2f} s, "
+            f"{sum(r['input_tokens'] for r in metricas)} tokens de entrada, {sum(r['output_tokens'] for r in metricas)} de salida"
+            + (f", {sum(costes):.6f} USD" if costes else "") + "\n"
+        )
+
+    lineas += [
+        "## Diagrama de Flujo (Mermaid)",
+        "```mermaid",
+        "graph TD",
+        "    subgraph Misterio",
+        "        A[Enigma] --> B(Solución Secreta)",
+        "    end",
+        "",
+        "    subgraph Investigación",
+        "        B -- Conocida por Narrador --> C(Narrador)",
+        "        A -- Conocida por Investigador --> D(Investigador)",
+        "    end",
+        "",
+        "    subgraph Turnos",
+    ]
+    for numero, (pregunta, respuesta) in enumerate((turnos[turno] for turno in sorted(turnos)), 1):
+        lineas.append(f"        D -- Pregunta {numero}: {pregunta} --> C")
+        lineas.append(f"        C -- Respuesta {numero}: {respuesta} --> D")
+    lineas += [
+        "    end",
+        "",
+        "    subgraph Resultado",
+        f"        D -- Veredicto: {veredicto} --> E(Fin de Partida)",
+        "    end",
+        "```",
+    ]
+    return "\n".join(lineas) + "\n"
+
+
+def exportar_markdown(ruta_jsonl: str, ruta_markdown: Optional[str] = None) -> str:
+    """Escribe junto a la transcripción JSONL (o en `ruta_markdown`) su versión en Markdown y devuelve la ruta."""
+    ruta_markdown = ruta_markdown or os.path.splitext(ruta_jsonl)[0] + ".md"
+    with open(ruta_markdown, "w", encoding="utf-8") as f:
+        f.write(transcripcion_markdown(cargar_transcripcion(ruta_jsonl)))
+    return ruta_markdown
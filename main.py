@@ -1,35 +1,420 @@
 import argparse
 import asyncio
-import json
 import os
-from datetime import datetime
+from collections import Counter
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
 from rich.console import Console
 from rich.panel import Panel
 from rich.spinner import Spinner
 from rich.text import Text
 from rich.live import Live
+from rich.progress import Progress, SpinnerColumn, BarColumn, MofNCompleteColumn, TextColumn, TimeElapsedColumn
+from rich.table import Table
 from dotenv import load_dotenv
 
-from game_prompts import (
-    PROMPT_SISTEMA_COMUN,
-    PROMPT_SISTEMA_NARRADOR,
-    PROMPT_SISTEMA_INVESTIGADOR,
-    PROMPT_NARRADOR_GENERADOR,
-    PROMPT_INVESTIGADOR,
-    PROMPT_NARRADOR_RESPUESTA,
-    PROMPT_NARRADOR_JUEZ,
-    PROMPT_INVESTIGADOR_RESOLUCION,
-)
-from ai_providers import get_ai_provider, AIProvider
+from ai_providers import available_providers, AIProvider, ProviderPool, RateLimiter, RateLimitedProvider, ResponseCache, CachedProvider, MetricsRecorder, MetricsProvider, ResilientProvider
+from game_engine import ConfigPartida, Partida, Evento
+from historial import DIRECTORIO, IndicePartidas, PuntosControl, RegistroPartidas, exportar_markdown
+from misterios import AlmacenMisterios, ProductorMisterios
 
 console = Console()
 
-async def main():
-    load_dotenv() # Load environment variables from .env file
+# Incorporados más los que instalen otros paquetes (ver ai_providers/registry.py).
+PROVEEDORES = available_providers()
+
+
+class ConsolaPartida:
+    """Muestra en la terminal los eventos de una única partida, con spinners de `rich`."""
+
+    TEXTOS_PENSANDO = {
+        "misterio": "[bold green]Narrador pensando el misterio...[/bold green]",
+        "pregunta": "[bold yellow]Investigador ({model_investigador}) pensando...[/bold yellow]",
+        "respuesta": "[bold green]Narrador ({model_narrador}) evaluando...[/bold green]",
+        "resolucion": "[bold yellow]Investigador ({model_investigador}) formulando resolución final...[/bold yellow]",
+        "veredicto": "[bold green]Narrador ({model_narrador}) emitiendo veredicto...[/bold green]",
+        "comprobacion": "[bold green]Narrador ({model_narrador}) comprobando si el misterio está resuelto...[/bold green]",
+    }
+    TEXTOS_ERROR = {
+        "misterio": "Error al crear el misterio",
+        "pregunta": "Error Investigador",
+        "respuesta": "Error Narrador",
+        "resolucion": "Error al obtener la resolución del Investigador",
+        "veredicto": "Error al emitir veredicto",
+        "comprobacion": "Error al comprobar si el misterio está resuelto (la partida sigue)",
+    }
+
+    def __init__(self, config: ConfigPartida):
+        self.config = config
+        self.live = None
+        self.texto_parcial = ""
+        self.reanudada = False
+
+    def _parar_spinner(self):
+        if self.live is not None:
+            self.live.stop()
+            self.live = None
+        self.texto_parcial = ""
+
+    def _vista_parcial(self, fase: str):
+        # Mientras llegan los tokens se muestra el texto parcial en lugar del spinner;
+        # al llegar el evento final se borra y se imprime la versión completa.
+        if fase == "misterio":
+            return Panel(Text(self.texto_parcial), title="[bold blue]El Misterio[/bold blue]", title_align="left", border_style="blue")
+        if fase == "resolucion":
+            return Panel(Text(self.texto_parcial), title="[bold yellow]Hipótesis Final[/bold yellow]", title_align="left", border_style="yellow")
+        return Text.assemble(("Investigador: ", "bold yellow"), self.texto_parcial)
+
+    async def __call__(self, evento: Evento):
+        tipo = evento["tipo"]
+        if tipo == "fragmento":
+            self.texto_parcial += evento["texto"]
+            if self.live is not None:
+                self.live.update(self._vista_parcial(evento["fase"]))
+            return
+        self._parar_spinner()
+        if tipo == "pensando":
+            texto = self.TEXTOS_PENSANDO[evento["fase"]].format(**vars(self.config))
+            self.live = Live(Spinner("dots", text=texto), console=console, transient=True)
+            self.live.start()
+        elif tipo == "inicio" and evento.get("reanudada"):
+            self.reanudada = True
+            console.print(f"[bold cyan]Reanudando la partida {evento['partida']} tras el turno {evento['turnos_jugados']}.[/bold cyan]\n")
+        elif tipo == "misterio":
+            if not self.reanudada:
+                origen = " (de la reserva)" if evento["origen"] == "reserva" else ""
+                console.print(f"[bold green]Misterio creado{origen}![/bold green]\n")
+            console.print(Panel(Text(f"[bold blue]Enigma:[/bold blue]\n{evento['enigma']}", justify="left"), title="[bold blue]El Misterio[/bold blue]", title_align="left", border_style="blue"))
+            console.print(f"\n[bold cyan]{'Continúa' if self.reanudada else 'Comienza'} la investigación...[/bold cyan]\n")
+        elif tipo == "turno":
+            console.print(f"\n[bold white]--- Turno {evento['turno']}/{evento['total']} ---[/bold white]")
+        elif tipo == "pregunta":
+            console.print(f"[bold yellow]Investigador:[/bold yellow] {evento['texto']}")
+        elif tipo == "respuesta":
+            console.print(f"[bold green]Narrador:[/bold green] {evento['texto']}")
+        elif tipo == "solucion_propuesta":
+            console.print(f"[bold yellow]Investigador (propone la solución):[/bold yellow] {evento['texto']}")
+        elif tipo == "comprobacion":
+            if evento["resuelto"]:
+                console.print(f"[bold green]¡El Juez da el misterio por resuelto en el turno {evento['turno']}![/bold green]")
+            elif evento["propuesta"]:
+                console.print("[bold green]Narrador:[/bold green] no (la solución propuesta no es correcta)")
+        elif tipo == "respuesta_invalida":
+            console.print(f"[bold red]Respuesta del Narrador fuera de las opciones permitidas: {evento['texto']!r}[/bold red]")
+        elif tipo == "reintento":
+            console.print(f"[bold red]El misterio no llegó en el formato esperado; se pide de nuevo ({evento['motivo']}).[/bold red]")
+        elif tipo == "turno_incompleto":
+            console.print("[bold red]Turno incompleto debido a un error. No se añade al historial.[/bold red]")
+        elif tipo == "fin_investigacion":
+            console.print(Panel(Text("[bold blue]--- FIN DE LA PARTIDA ---[/bold blue]", justify="center")))
+            console.print(Panel(Text(f"[bold magenta]Solución Secreta:[/bold magenta]\n{evento['solucion']}", justify="left"), title="[bold magenta]La Verdad Revelada[/bold magenta]", title_align="left", border_style="magenta"))
+        elif tipo == "resolucion":
+            console.print(Panel(f"[bold yellow]Resolución del Investigador:[/bold yellow]\n{evento['texto']}", title="[bold yellow]Hipótesis Final[/bold yellow]", title_align="left", border_style="yellow"))
+        elif tipo == "veredicto":
+            anticipado = f" (resuelto en el turno {evento['turno']} de {self.config.turnos})" if evento.get("turno") else ""
+            console.print(f"\n[bold yellow]Veredicto: {evento['veredicto']}{anticipado}[/bold yellow]")
+        elif tipo == "error":
+            console.print(f"[bold red]{self.TEXTOS_ERROR[evento['fase']]}: {evento['mensaje']}[/bold red]")
+        elif tipo == "fin" and evento["especulacion"]:
+            console.print(resumen_especulacion(evento["especulacion"]))
+
+
+def resumen_especulacion(especulacion: dict) -> str:
+    turnos = especulacion.get("aciertos", 0) + especulacion.get("fallos", 0)
+    return (
+        f"Especulación: [bold]{especulacion.get('aciertos', 0)}/{turnos}[/bold] preguntas adelantadas, "
+        f"{especulacion.get('ramas', 0)} ramas lanzadas, {especulacion.get('canceladas', 0)} canceladas a tiempo, "
+        f"{especulacion.get('desperdiciadas', 0)} completadas y descartadas"
+    )
+
+
+def comprobar_claves_api(args) -> bool:
+    # Check for API keys after loading environment variables
+    proveedores = {args.provider_narrador, args.provider_investigador}
+    proveedores.update(proveedor for proveedor, _ in args.respaldo_narrador + args.respaldo_investigador)
+    claves = {
+        "gemini": ("GOOGLE_API_KEY", "Gemini"),
+        "openai": ("OPENAI_API_KEY", "OpenAI"),
+        "anthropic": ("ANTHROPIC_API_KEY", "Anthropic"),
+    }
+    for proveedor, (variable, nombre) in claves.items():
+        if proveedor in proveedores and not os.getenv(variable):
+            console.print(f"[bold red]Error: {variable} no encontrada en .env. Por favor, crea un archivo .env y añade tu clave API de {nombre}.[/bold red]")
+            return False
+    return True
+
+
+def opciones_proveedor(args, proveedor: str) -> dict:
+    """Opciones de construcción específicas de cada proveedor tomadas de la línea de comandos."""
+    if proveedor == "ollama":
+        return {
+            "host": args.ollama_host,
+            "keep_alive": args.ollama_keep_alive,
+            "max_concurrency": args.ollama_concurrencia,
+        }
+    if proveedor == "mock":
+        return {
+            "latency": args.mock_latencia,
+            "failure_rate": args.mock_fallos,
+            "seed": args.mock_semilla,
+        }
+    return {}
+
+
+def lista_respaldos(valor: str) -> List[Tuple[str, str]]:
+    """Convierte 'proveedor:modelo,proveedor:modelo' en una lista de pares, para argparse."""
+    respaldos = []
+    for elemento in valor.split(","):
+        proveedor, _, modelo = elemento.strip().partition(":")
+        if proveedor not in PROVEEDORES or not modelo:
+            raise argparse.ArgumentTypeError(f"'{elemento}' no es de la forma proveedor:modelo con proveedor en {', '.join(PROVEEDORES)}.")
+        respaldos.append((proveedor, modelo))
+    return respaldos
+
+
+def limites_por_modelo(valor: str) -> Dict[str, float]:
+    """
+    Convierte '60' (para todos los modelos) o 'gemini=15,openai:gpt-4o=500'
+    (por proveedor o por modelo) en un diccionario de límites, para argparse.
+    """
+    limites = {}
+    for elemento in valor.split(","):
+        clave, _, numero = elemento.strip().rpartition("=")
+        try:
+            limites[clave] = float(numero)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"'{elemento}' no es un número ni de la forma proveedor[:modelo]=número.")
+    return limites
+
+
+def limite(limites: Dict[str, float], proveedor: str, modelo: str) -> Optional[float]:
+    """El límite más específico que se aplica al modelo: el suyo, el de su proveedor o el general."""
+    for clave in (f"{proveedor}:{modelo}", proveedor, ""):
+        if clave in limites:
+            return limites[clave]
+    return None
+
+
+def proveedor_limitado(args, pool: ProviderPool, limitadores: Dict[Tuple[str, str], RateLimiter], proveedor: str, modelo: str) -> AIProvider:
+    """
+    El proveedor de `pool`, con los límites de --rpm y --tpm de su modelo si
+    los tiene. Los roles que usan el mismo modelo comparten limitador, porque
+    la cuota de la API es la misma.
+    """
+    provider = pool.get(proveedor, modelo, **opciones_proveedor(args, proveedor))
+    rpm, tpm = limite(args.rpm, proveedor, modelo), limite(args.tpm, proveedor, modelo)
+    if not rpm and not tpm:
+        return provider
+    if (proveedor, modelo) not in limitadores:
+        limitadores[(proveedor, modelo)] = RateLimiter(rpm, tpm)
+    return RateLimitedProvider(provider, limitadores[(proveedor, modelo)])
+
+
+def proveedor_resiliente(args, pool: ProviderPool, limitadores: Dict[Tuple[str, str], RateLimiter], proveedor: str, modelo: str, respaldos: List[Tuple[str, str]]) -> ResilientProvider:
+    """
+    Construye el proveedor con plazo y reintentos. Si falla, pasa al primer
+    respaldo, que a su vez pasa al siguiente, y así hasta agotar la cadena.
+    Los proveedores salen de `pool`, así que comparten conexiones entre roles.
+    """
+    respaldo = None
+    for proveedor_respaldo, modelo_respaldo in reversed(respaldos):
+        respaldo = ResilientProvider(
+            proveedor_limitado(args, pool, limitadores, proveedor_respaldo, modelo_respaldo),
+            timeout=args.timeout, retries=args.reintentos, backup=respaldo,
+        )
+    return ResilientProvider(
+        proveedor_limitado(args, pool, limitadores, proveedor, modelo),
+        timeout=args.timeout, retries=args.reintentos, backup=respaldo, hedge_percentile=args.cubrir_percentil,
+    )
+
+
+def envolver_proveedor(args, provider: AIProvider, cache: Optional[ResponseCache], metricas: MetricsRecorder) -> AIProvider:
+    """Añade por fuera de `proveedor_resiliente` la caché de respuestas (con --cache) y las métricas."""
+    if cache is not None:
+        provider = CachedProvider(provider, cache, sampled=args.cache_muestreadas)
+    # Por fuera de la caché, para medir lo que espera la partida y no solo las llamadas reales.
+    return MetricsProvider(provider, metricas)
+
+
+def resumen_resiliencia(rol: str, provider: ResilientProvider) -> Optional[str]:
+    stats = provider.stats
+    if not stats:
+        return None
+    return (
+        f"{rol}: {stats['retries']} reintentos, {stats['timeouts']} plazos agotados, "
+        f"{stats['fallbacks']} pasos al respaldo, {stats['hedges']} peticiones duplicadas "
+        f"({stats['hedge_wins']} ganadas por el respaldo)"
+    )
+
+
+def resumen_limites(proveedor: str, modelo: str, limitador: RateLimiter) -> Optional[str]:
+    stats = limitador.stats
+    if not stats["queued"] and not stats["throttled"]:
+        return None
+    return (
+        f"Límites de {proveedor} ({modelo}): {stats['queued']} llamadas esperaron turno "
+        f"({stats['wait_seconds']:.1f} s en total), {stats['throttled']} rechazadas por la API (429)"
+    )
+
+
+def tabla_perfil(metricas: MetricsRecorder) -> Table:
+    tabla = Table(title="Perfil de llamadas (de más a menos tiempo total)")
+    for columna in ("Rol", "Fase", "Modelo"):
+        tabla.add_column(columna)
+    for columna in ("Llamadas", "Errores", "Reintentos", "Total (s)", "Media (s)", "p95 (s)", "1er token (s)", "Tokens ent./sal.", "Coste (USD)"):
+        tabla.add_column(columna, justify="right")
+    for fila in metricas.summary():
+        tabla.add_row(
+            fila["role"] or "-", fila["phase"] or "-", fila["model"],
+            str(fila["calls"]), str(fila["errors"]), str(fila["retries"]),
+            f"{fila['total_time']:.2f}", f"{fila['mean_time']:.2f}", f"{fila['p95_time']:.2f}",
+            f"{fila['mean_ttft']:.2f}" if fila["mean_ttft"] is not None else "-",
+            f"{fila['input_tokens']}/{fila['output_tokens']}",
+            f"{fila['cost']:.4f}" if fila["cost"] is not None else "-",
+        )
+    return tabla
+
+
+def tabla_resultados(indice: IndicePartidas) -> Table:
+    tabla = Table(title="Resultados por pareja de modelos")
+    for columna in ("Narrador", "Investigador"):
+        tabla.add_column(columna)
+    for columna in ("Partidas", "Victorias", "Turnos medios", "Turnos hasta resolver", "Errores", "Duración media (s)", "Coste (USD)"):
+        tabla.add_column(columna, justify="right")
+    for fila in indice.resultados_por_modelos():
+        tabla.add_row(
+            f"{fila['proveedor_narrador']} ({fila['modelo_narrador']})", f"{fila['proveedor_investigador']} ({fila['modelo_investigador']})",
+            str(fila["partidas"]), f"{fila['victorias']:.0%}",
+            f"{fila['turnos_medios']:.1f}" if fila["turnos_medios"] is not None else "-",
+            f"{fila['turnos_para_resolver']:.1f}" if fila["turnos_para_resolver"] is not None else "-", str(fila["errores"]),
+            f"{fila['duracion_media']:.1f}" if fila["duracion_media"] is not None else "-",
+            f"{fila['coste']:.4f}" if fila["coste"] is not None else "-",
+        )
+    return tabla
+
+
+def exportar(indice: IndicePartidas, partidas: List[str]):
+    """Exporta a Markdown las transcripciones indicadas por ruta JSONL o por id de partida."""
+    for partida in partidas:
+        ruta = partida if os.path.exists(partida) else indice.transcripcion(partida)
+        if ruta is None or not os.path.exists(ruta):
+            console.print(f"[bold red]No se encuentra la transcripción de '{partida}'.[/bold red]")
+            continue
+        destino = exportar_markdown(ruta)
+        console.print(f"[bold blue]Transcripción exportada a:[/bold blue] [link=file://{os.path.abspath(destino)}]{destino}[/link]")
+
+
+async def jugar_una_partida(config: ConfigPartida, narrador_provider: AIProvider, investigador_provider: AIProvider, streaming: bool = True, almacen_misterios: Optional[AlmacenMisterios] = None, registro: Optional[RegistroPartidas] = None, puntos_control: Optional[PuntosControl] = None, estado: Optional[dict] = None):
+    """Juega una partida mostrándola en la terminal; con `estado` (un punto de control), la continúa."""
+    observadores = [ConsolaPartida(config)] + ([registro] if registro else [])
+    opciones = dict(observadores=observadores, streaming=streaming, almacen_misterios=almacen_misterios, puntos_control=puntos_control)
+    if estado is not None:
+        partida = Partida.reanudar(estado, narrador_provider, investigador_provider, **opciones)
+    else:
+        partida = Partida(config, narrador_provider, investigador_provider, **opciones)
+    try:
+        await partida.jugar()
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        if puntos_control is not None and partida.fase != "misterio":
+            console.print(f"\n[bold yellow]Partida interrumpida. Para continuarla: --reanudar {partida.id}[/bold yellow]")
+        raise
+    if registro is not None:
+        filename = registro.rutas[partida.id]
+        console.print(f"\n[bold blue]Transcripción guardada en:[/bold blue] [link=file://{os.path.abspath(filename)}]{filename}[/link]")
+
+
+async def jugar_lote(config: ConfigPartida, narrador_provider: AIProvider, investigador_provider: AIProvider, partidas: int, concurrencia: int, almacen_misterios: Optional[AlmacenMisterios] = None, registro: Optional[RegistroPartidas] = None, puntos_control: Optional[PuntosControl] = None):
+    """
+    Juega `partidas` partidas en el mismo bucle de eventos, con como mucho
+    `concurrencia` a la vez. Con `puntos_control`, las partidas con la misma
+    configuración que se quedaron sin terminar cuentan para el lote y se
+    continúan donde se cortaron, en lugar de empezar otras desde cero.
+    """
+    pendientes = puntos_control.pendientes(asdict(config))[:partidas] if puntos_control else []
+    if pendientes:
+        console.print(f"Reanudando [bold]{len(pendientes)}[/bold] partidas sin terminar de un lote anterior.")
+    semaforo = asyncio.Semaphore(concurrencia)
+    veredictos = Counter()
+    especulacion = Counter()
+    turnos_resolucion: List[int] = []
+
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn("[bold]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeElapsedColumn(),
+        TextColumn("{task.fields[detalle]}"),
+        console=console,
+    )
+    tarea_partidas = progress.add_task("Partidas", total=partidas, detalle="")
+    tarea_turnos = progress.add_task("Turnos", total=partidas * config.turnos, detalle="")
+    en_curso = 0
+
+    def detalle_partidas() -> str:
+        resumen = " ".join(f"{veredicto}: {n}" for veredicto, n in sorted(veredictos.items()))
+        return f"en curso: {en_curso} {resumen}"
+
+    async def contar_turnos(evento: Evento):
+        if evento["tipo"] in ("respuesta", "respuesta_invalida") or (evento["tipo"] == "comprobacion" and evento["propuesta"]):
+            progress.advance(tarea_turnos)
+
+    async def una_partida(indice: int):
+        nonlocal en_curso
+        async with semaforo:
+            en_curso += 1
+            progress.update(tarea_partidas, detalle=detalle_partidas())
+            observadores = [contar_turnos] + ([registro] if registro else [])
+            opciones = dict(observadores=observadores, almacen_misterios=almacen_misterios, puntos_control=puntos_control)
+            partida = None
+            if indice < len(pendientes):
+                try:
+                    partida = Partida.reanudar(pendientes[indice], narrador_provider, investigador_provider, **opciones)
+                    progress.advance(tarea_turnos, partida.turnos_jugados)
+                except (ValueError, KeyError, TypeError) as e:
+                    # Se aparta para que no falle en cada lote, y el hueco lo ocupa una partida nueva.
+                    puntos_control.apartar(pendientes[indice]["id"])
+                    progress.console.print(f"[bold red]No se pudo reanudar la partida {pendientes[indice]['id']} ({e!r}); se juega una nueva en su lugar.[/bold red]")
+            if partida is None:
+                partida = Partida(config, narrador_provider, investigador_provider, **opciones)
+            try:
+                await partida.jugar()
+                veredictos[partida.veredicto or "ERROR"] += 1
+                especulacion.update(partida.especulacion)
+                if partida.turnos_resolucion is not None:
+                    turnos_resolucion.append(partida.turnos_resolucion)
+            except Exception as e:
+                veredictos["ERROR"] += 1
+                progress.console.print(f"[bold red]Partida {indice + 1} abortada: {e}[/bold red]")
+            # Las partidas que terminan antes de tiempo no completan todos sus turnos
+            progress.advance(tarea_turnos, config.turnos - partida.turnos_jugados)
+            en_curso -= 1
+            progress.update(tarea_partidas, advance=1, detalle=detalle_partidas())
+
+    with progress:
+        await asyncio.gather(*(una_partida(i) for i in range(partidas)))
+
+    tabla = Table(title="Resultados del lote")
+    tabla.add_column("Veredicto")
+    tabla.add_column("Partidas", justify="right")
+    for veredicto, n in veredictos.most_common():
+        tabla.add_row(veredicto, str(n))
+    console.print(tabla)
+    if turnos_resolucion:
+        console.print(
+            f"Ganadas antes de tiempo: [bold]{len(turnos_resolucion)}[/bold] partidas, resueltas en [bold]{sum(turnos_resolucion) / len(turnos_resolucion):.1f}[/bold] turnos de media; "
+            f"se ahorraron {sum(config.turnos - turnos for turnos in turnos_resolucion)} turnos"
+        )
+    if especulacion:
+        console.print(resumen_especulacion(especulacion))
+
+
+def crear_parser() -> argparse.ArgumentParser:
+    """Las opciones de la línea de comandos, compartidas con `servidor.py`."""
     parser = argparse.ArgumentParser(description="BlackStory AI: An AI-driven mystery game.")
     parser.add_argument(
         "-pn", "--provider-narrador",
-        choices=["ollama", "gemini", "anthropic", "openai"],
+        choices=PROVEEDORES,
         default="gemini",
         help="Proveedor de la IA Narradora."
     )
@@ -40,7 +425,7 @@ async def main():
     )
     parser.add_argument(
         "-pi", "--provider-investigador",
-        choices=["ollama", "gemini", "anthropic", "openai"],
+        choices=PROVEEDORES,
         default="gemini",
         help="Proveedor de la IA Investigadora."
     )
@@ -55,200 +440,351 @@ async def main():
         default=15,
         help="Número máximo de turnos (preguntas) antes de revelar la solución."
     )
+    parser.add_argument(
+        "--partidas",
+        type=int,
+        default=1,
+        help="Número de partidas a jugar. Con más de una se juegan en modo lote, sin mostrar cada turno."
+    )
+    parser.add_argument(
+        "--concurrencia",
+        type=int,
+        default=4,
+        help="Número máximo de partidas simultáneas en modo lote."
+    )
+    parser.add_argument(
+        "--sesiones",
+        action="store_true",
+        help="Conversación multi-turno con caché de prompts: cada turno solo envía lo nuevo en lugar de repetir todo el historial."
+    )
+    parser.add_argument(
+        "--especulativo",
+        action="store_true",
+        help="Genera la siguiente pregunta del Investigador para las tres respuestas posibles mientras el Narrador decide, y se queda con la correcta."
+    )
+    parser.add_argument(
+        "--declarar-solucion",
+        action="store_true",
+        help="Permite al Investigador dar la solución en cualquier turno en lugar de preguntar. El Juez la comprueba al momento: si acierta la partida termina ahí, y si no el Narrador responde 'no' y la investigación sigue."
+    )
+    parser.add_argument(
+        "--comprobar-cada",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Cada N turnos el Juez comprueba con una respuesta de una palabra si el Investigador ya ha descubierto los puntos clave, y si es así da la partida por ganada sin jugar el resto. (Por defecto: 0, nunca)"
+    )
+    parser.add_argument(
+        "--sin-streaming",
+        action="store_true",
+        help="Muestra cada respuesta solo cuando está completa, en lugar de token a token."
+    )
+    parser.add_argument(
+        "--historial",
+        metavar="DIRECTORIO",
+        default=DIRECTORIO,
+        help=f"Directorio de las transcripciones: un JSONL por partida, escrito evento a evento. (Por defecto: {DIRECTORIO})"
+    )
+    parser.add_argument(
+        "--indice",
+        metavar="RUTA",
+        default=None,
+        help="Índice SQLite con los metadatos y resultados de cada partida. (Por defecto: indice.sqlite dentro de --historial)"
+    )
+    parser.add_argument(
+        "--reanudar",
+        metavar="PARTIDA",
+        default=None,
+        help="Continúa una partida interrumpida desde su último turno completo, con su misma configuración de proveedores y modelos. Los lotes reanudan solos las suyas."
+    )
+    parser.add_argument(
+        "--exportar",
+        nargs="+",
+        metavar="PARTIDA",
+        default=None,
+        help="Exporta a Markdown, con el diagrama Mermaid, las transcripciones indicadas (por id de partida o ruta del JSONL) y termina sin jugar."
+    )
+    parser.add_argument(
+        "--estadisticas",
+        action="store_true",
+        help="Muestra las victorias, los turnos medios y el coste por pareja de modelos de todas las partidas del índice y termina sin jugar."
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="RUTA",
+        default=None,
+        help="Activa la caché de respuestas en este fichero SQLite (p. ej. .cache/respuestas.sqlite). Las llamadas idénticas se sirven desde disco."
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=256,
+        help="Tamaño máximo de la caché en MB; al superarlo se descartan las respuestas usadas hace más tiempo."
+    )
+    parser.add_argument(
+        "--cache-muestreadas",
+        action="store_true",
+        help="Guarda en caché también las llamadas muestreadas (temperatura distinta de 0), para repetir un lote entero sin conexión. Por defecto solo se guardan las de temperatura 0."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Segundos máximos por llamada a un modelo (en streaming, por cada fragmento). Al agotarse se reintenta. (Por defecto: sin límite)"
+    )
+    parser.add_argument(
+        "--reintentos",
+        type=int,
+        default=2,
+        help="Reintentos ante errores transitorios (límite de peticiones, errores del servidor, plazos agotados), con espera exponencial aleatoria."
+    )
+    parser.add_argument(
+        "--respaldo-narrador",
+        metavar="PROVEEDOR:MODELO[,...]",
+        type=lista_respaldos,
+        default=[],
+        help="Modelos de respaldo del Narrador, en orden, para cuando el principal falla tras agotar los reintentos. P. ej. openai:gpt-4o-mini,ollama:llama3"
+    )
+    parser.add_argument(
+        "--respaldo-investigador",
+        metavar="PROVEEDOR:MODELO[,...]",
+        type=lista_respaldos,
+        default=[],
+        help="Modelos de respaldo del Investigador, igual que --respaldo-narrador."
+    )
+    parser.add_argument(
+        "--cubrir-percentil",
+        type=float,
+        default=None,
+        help="Si una llamada tarda más que este percentil (p. ej. 95) de las recientes, lanza la misma petición al primer respaldo y se queda con la primera respuesta."
+    )
+    parser.add_argument(
+        "--rpm",
+        metavar="N|PROVEEDOR[:MODELO]=N,...",
+        type=limites_por_modelo,
+        default={},
+        help="Peticiones por minuto máximas a cada modelo, p. ej. 15 para todos o gemini=15,openai:gpt-4o=500. Las llamadas esperan turno en una cola repartida con justicia entre partidas, con prioridad para las respuestas sí/no del Narrador."
+    )
+    parser.add_argument(
+        "--tpm",
+        metavar="N|PROVEEDOR[:MODELO]=N,...",
+        type=limites_por_modelo,
+        default={},
+        help="Tokens por minuto máximos a cada modelo, con el mismo formato que --rpm. Los tokens del prompt se estiman antes de enviarlo."
+    )
+    parser.add_argument(
+        "--conexiones-max",
+        type=int,
+        default=100,
+        help="Conexiones HTTP simultáneas máximas por API y clave, compartidas por todos los roles y partidas."
+    )
+    parser.add_argument(
+        "--conexiones-en-espera",
+        type=int,
+        default=20,
+        help="Conexiones HTTP que se mantienen abiertas entre llamadas para reutilizarlas (keep-alive)."
+    )
+    parser.add_argument(
+        "--metricas",
+        metavar="RUTA",
+        default=None,
+        help="Añade a este fichero JSONL una línea por llamada a los modelos, con rol, fase, tiempos, tokens, reintentos y coste."
+    )
+    parser.add_argument(
+        "--perfil",
+        action="store_true",
+        help="Muestra al final una tabla con el tiempo, los tokens y el coste de las llamadas por rol, fase y modelo."
+    )
+    parser.add_argument(
+        "--misterios",
+        metavar="RUTA",
+        default=None,
+        help="Reserva de misterios pregenerados en este fichero SQLite (p. ej. .cache/misterios.sqlite). Las partidas toman de ella el enigma en lugar de esperar a generarlo."
+    )
+    parser.add_argument(
+        "--reserva-misterios",
+        type=int,
+        default=0,
+        help="Misterios sin usar que se mantienen en la reserva, generándolos en segundo plano mientras se juega (por defecto 0: no se generan)."
+    )
+    parser.add_argument(
+        "--productores",
+        type=int,
+        default=1,
+        help="Misterios que se generan a la vez para rellenar la reserva."
+    )
+    parser.add_argument(
+        "--solo-rellenar",
+        action="store_true",
+        help="Rellena la reserva hasta --reserva-misterios y termina sin jugar."
+    )
+    parser.add_argument(
+        "--ollama-host",
+        default=None,
+        help="URL del servidor Ollama (por defecto OLLAMA_HOST o http://localhost:11434)."
+    )
+    parser.add_argument(
+        "--ollama-keep-alive",
+        default=None,
+        help="Tiempo que Ollama mantiene el modelo cargado entre peticiones, p. ej. '30m' o '-1' (por defecto OLLAMA_KEEP_ALIVE)."
+    )
+    parser.add_argument(
+        "--ollama-concurrencia",
+        type=int,
+        default=None,
+        help="Peticiones simultáneas máximas a Ollama. Conviene igualarlo a OLLAMA_NUM_PARALLEL del servidor (por defecto 4)."
+    )
+    parser.add_argument(
+        "--mock-latencia",
+        type=float,
+        default=None,
+        help="Latencia mediana en segundos del proveedor 'mock', que juega sin conexión ni claves (por defecto MOCK_LATENCY o 0)."
+    )
+    parser.add_argument(
+        "--mock-fallos",
+        type=float,
+        default=None,
+        help="Fracción de llamadas del proveedor 'mock' que fallan con un error 503 simulado (por defecto MOCK_FAILURE_RATE o 0)."
+    )
+    parser.add_argument(
+        "--mock-semilla",
+        type=int,
+        default=None,
+        help="Semilla del proveedor 'mock', para repetir exactamente las mismas partidas."
+    )
+    return parser
+
+
+def comprobar_argumentos(parser: argparse.ArgumentParser, args):
+    if args.partidas < 1 or args.concurrencia < 1:
+        parser.error("--partidas y --concurrencia deben ser al menos 1.")
+    if args.cubrir_percentil is not None and not (0 < args.cubrir_percentil < 100):
+        parser.error("--cubrir-percentil debe estar entre 0 y 100.")
+    if (args.reserva_misterios or args.solo_rellenar) and not args.misterios:
+        parser.error("--reserva-misterios y --solo-rellenar requieren --misterios.")
+    if args.comprobar_cada < 0:
+        parser.error("--comprobar-cada no puede ser negativo.")
+    if args.reanudar and args.partidas > 1:
+        parser.error("--reanudar continúa una sola partida; no se puede combinar con --partidas.")
+
 
+async def main():
+    load_dotenv() # Load environment variables from .env file
+    parser = crear_parser()
     args = parser.parse_args()
+    comprobar_argumentos(parser, args)
 
-    # Check for API keys after loading environment variables
-    if args.provider_narrador == "gemini" or args.provider_investigador == "gemini":
-        if not os.getenv("GOOGLE_API_KEY"):
-            console.print("[bold red]Error: GOOGLE_API_KEY no encontrada en .env. Por favor, crea un archivo .env y añade tu clave API de Gemini.[/bold red]")
-            return
-    if args.provider_narrador == "openai" or args.provider_investigador == "openai":
-        if not os.getenv("OPENAI_API_KEY"):
-            console.print("[bold red]Error: OPENAI_API_KEY no encontrada en .env. Por favor, crea un archivo .env y añade tu clave API de OpenAI.[/bold red]")
-            return
-    if args.provider_narrador == "anthropic" or args.provider_investigador == "anthropic":
-        if not os.getenv("ANTHROPIC_API_KEY"):
-            console.print("[bold red]Error: ANTHROPIC_API_KEY no encontrada en .env. Por favor, crea un archivo .env y añade tu clave API de Anthropic.[/bold red]")
+    indice = IndicePartidas(args.indice or os.path.join(args.historial, "indice.sqlite"))
+    if args.exportar or args.estadisticas:
+        if args.exportar:
+            exportar(indice, args.exportar)
+        if args.estadisticas:
+            console.print(tabla_resultados(indice))
+        indice.cerrar()
+        return
+
+    puntos_control = PuntosControl(os.path.join(args.historial, "en_curso"))
+    estado = None
+    if args.reanudar:
+        estado = puntos_control.cargar(args.reanudar)
+        if estado is None:
+            console.print(f"[bold red]No hay ninguna partida sin terminar con id '{args.reanudar}'.[/bold red]")
+            indice.cerrar()
             return
+        # La partida sigue con los proveedores y modelos con los que empezó.
+        for opcion, valor in estado["config"].items():
+            setattr(args, opcion, valor)
+
+    if not comprobar_claves_api(args):
+        indice.cerrar()
+        return
+
+    config = ConfigPartida(
+        provider_narrador=args.provider_narrador,
+        model_narrador=args.model_narrador,
+        provider_investigador=args.provider_investigador,
+        model_investigador=args.model_investigador,
+        turnos=args.turnos,
+        sesiones=args.sesiones,
+        especulativo=args.especulativo,
+        declarar_solucion=args.declarar_solucion,
+        comprobar_cada=args.comprobar_cada,
+    )
+    # Un único cliente por API y clave: narrador, investigador, respaldos y
+    # partidas simultáneas reutilizan las mismas conexiones.
+    pool = ProviderPool(max_connections=args.conexiones_max, max_keepalive_connections=args.conexiones_en_espera)
+    limitadores: Dict[Tuple[str, str], RateLimiter] = {}
+    resiliencia_narrador = proveedor_resiliente(args, pool, limitadores, args.provider_narrador, args.model_narrador, args.respaldo_narrador)
+    resiliencia_investigador = proveedor_resiliente(args, pool, limitadores, args.provider_investigador, args.model_investigador, args.respaldo_investigador)
+    cache = ResponseCache(args.cache, max_bytes=args.cache_max_mb * 1024 * 1024) if args.cache else None
+    metricas = MetricsRecorder(args.metricas)
+    narrador_provider = envolver_proveedor(args, resiliencia_narrador, cache, metricas)
+    investigador_provider = envolver_proveedor(args, resiliencia_investigador, cache, metricas)
+    registro = RegistroPartidas(args.historial, indice, metricas)
+
+    almacen_misterios = AlmacenMisterios(args.misterios) if args.misterios else None
+    productor = None
+    if almacen_misterios is not None and args.reserva_misterios > 0:
+        # Sin caché: repetiría el mismo misterio y la reserva no se llenaría nunca.
+        productor = ProductorMisterios(almacen_misterios, envolver_proveedor(args, resiliencia_narrador, None, metricas), args.reserva_misterios, args.productores)
 
-    narrador_provider: AIProvider = get_ai_provider(args.provider_narrador, args.model_narrador)
-    investigador_provider: AIProvider = get_ai_provider(args.provider_investigador, args.model_investigador)
+    if args.solo_rellenar:
+        try:
+            with console.status(f"[bold green]Rellenando la reserva de misterios ({almacen_misterios.disponibles()} disponibles)...[/bold green]"):
+                if productor is not None:
+                    await productor.ejecutar()
+        finally:
+            await pool.aclose()
+        if productor is not None:
+            if productor.abandonado:
+                console.print(f"[bold red]Relleno abandonado tras {productor.max_fallos_seguidos} errores o duplicados seguidos.[/bold red]")
+            console.print(f"Misterios generados: [bold]{productor.generados}[/bold], duplicados descartados: [bold]{productor.duplicados}[/bold], errores: [bold]{productor.errores}[/bold]")
+        console.print(f"Misterios disponibles en la reserva: [bold]{almacen_misterios.disponibles()}[/bold]")
+        almacen_misterios.cerrar()
+        if args.perfil:
+            console.print(tabla_perfil(metricas))
+        metricas.close()
+        indice.cerrar()
+        return
 
     console.print(Panel(Text("[bold blue]Iniciando BlackStory AI[/bold blue]", justify="center")))
     console.print(f"Narrador: [bold green]{args.provider_narrador} ({args.model_narrador})[/bold green]")
     console.print(f"Investigador: [bold yellow]{args.provider_investigador} ({args.model_investigador})[/bold yellow]")
     console.print(f"Turnos máximos: [bold magenta]{args.turnos}[/bold magenta]\n")
 
-    # Fase 1: Creación del Misterio
-    enigma = ""
-    solucion_secreta = ""
-    with Live(Spinner("dots", text="[bold green]Narrador pensando el misterio...[/bold green]"), console=console, transient=True) as live:
-        try:
-            narrador_response = await narrador_provider.generate_json(
-                system_prompt=PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_NARRADOR,
-                user_prompt=PROMPT_NARRADOR_GENERADOR
-            )
-            enigma = narrador_response["enigma"]
-            solucion_secreta = narrador_response["solucion"]
-            live.stop()
-            console.print("[bold green]Misterio creado![/bold green]\n")
-        except Exception as e:
-            live.stop()
-            console.print(f"[bold red]Error al crear el misterio: {e}[/bold red]")
-            return
-
-    # Fase 2: Investigación (El Bucle)
-    console.print(Panel(Text(f"[bold blue]Enigma:[/bold blue]\n{enigma}", justify="left"), title="[bold blue]El Misterio[/bold blue]", title_align="left", border_style="blue"))
-    console.print("\n[bold cyan]Comienza la investigación...[/bold cyan]\n")
-
-    historial_chat = []
-    for turno in range(1, args.turnos + 1):
-        console.print(f"\n[bold white]--- Turno {turno}/{args.turnos} ---[/bold white]")
-
-        # a. Turno del Investigador
-        investigador_question = ""
-        with Live(Spinner("dots", text=f"[bold yellow]Investigador ({args.model_investigador}) pensando...[/bold yellow]"), console=console, transient=True) as live:
-            try:
-                investigador_question = await investigador_provider.generate_text(
-                    system_prompt=PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_INVESTIGADOR,
-                    user_prompt=PROMPT_INVESTIGADOR.format(enigma=enigma, historial_chat="\n".join(historial_chat))
-                )
-                live.stop()
-                console.print(f"[bold yellow]Investigador:[/bold yellow] {investigador_question}")
-            except Exception as e:
-                live.stop()
-                console.print(f"[bold red]Error Investigador: {e}[/bold red]")
-                break
-
-        # b. Turno del Narrador
-        narrador_answer = ""
-        with Live(Spinner("dots", text=f"[bold green]Narrador ({args.model_narrador}) evaluando...[/bold green]"), console=console, transient=True) as live:
-            try:
-                raw_answer = await narrador_provider.generate_text(
-                    system_prompt=PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_NARRADOR,
-                    user_prompt=PROMPT_NARRADOR_RESPUESTA.format(
-                        solucion_secreta=solucion_secreta,
-                        pregunta_investigador=investigador_question
-                    )
-                )
-                # Validación estricta de la respuesta del Narrador
-                if raw_answer.lower().strip() in ["sí", "si", "no", "no es relevante"]:
-                    narrador_answer = raw_answer.lower().strip()
-                else:
-                    narrador_answer = "no es relevante" # Forzar a una respuesta válida si el LLM se desvía
-                live.stop()
-                console.print(f"[bold green]Narrador:[/bold green] {narrador_answer}")
-            except Exception as e:
-                live.stop()
-                console.print(f"[bold red]Error Narrador: {e}[/bold red]")
-                break
-
-        # c. Actualización de Estado
-        # Solo añadir al historial si ambos se generaron correctamente
-        if investigador_question and narrador_answer:
-            historial_chat.append(f"Investigador: {investigador_question}")
-            historial_chat.append(f"Narrador: {narrador_answer}")
+    if productor is not None:
+        productor.iniciar()
+    try:
+        if args.partidas == 1:
+            await jugar_una_partida(config, narrador_provider, investigador_provider, streaming=not args.sin_streaming, almacen_misterios=almacen_misterios, registro=registro, puntos_control=puntos_control, estado=estado)
         else:
-            # Si uno de los dos falló, no se añade nada para este turno
-            console.print("[bold red]Turno incompleto debido a un error. No se añade al historial.[/bold red]")
-
+            console.print(f"Partidas: [bold magenta]{args.partidas}[/bold magenta] (concurrencia {args.concurrencia})\n")
+            await jugar_lote(config, narrador_provider, investigador_provider, args.partidas, args.concurrencia, almacen_misterios, registro, puntos_control)
+    finally:
+        registro.cerrar()
+        if productor is not None:
+            await productor.detener()
+        await pool.aclose()
 
-    # Fase 3: Revelación (El Final)
-    console.print(Panel(Text("[bold blue]--- FIN DE LA PARTIDA ---[/bold blue]", justify="center")))
-    console.print(Panel(Text(f"[bold magenta]Solución Secreta:[/bold magenta]\n{solucion_secreta}", justify="left"), title="[bold magenta]La Verdad Revelada[/bold magenta]", title_align="left", border_style="magenta"))
+    if almacen_misterios is not None:
+        console.print(f"Misterios disponibles en la reserva: [bold]{almacen_misterios.disponibles()}[/bold]")
+        almacen_misterios.cerrar()
 
-    # Fase 3.1: Resolución del Investigador
-    investigador_resolucion = ""
-    with Live(Spinner("dots", text=f"[bold yellow]Investigador ({args.model_investigador}) formulando resolución final...[/bold yellow]"), console=console, transient=True) as live:
-        try:
-            investigador_resolucion = await investigador_provider.generate_text(
-                system_prompt=PROMPT_SISTEMA_COMUN + "\n" + PROMPT_SISTEMA_INVESTIGADOR,
-                user_prompt=PROMPT_INVESTIGADOR_RESOLUCION.format(enigma=enigma, historial_chat="\n".join(historial_chat))
-            )
-            live.stop()
-            console.print(Panel(f"[bold yellow]Resolución del Investigador:[/bold yellow]\n{investigador_resolucion}", title="[bold yellow]Hipótesis Final[/bold yellow]", title_align="left", border_style="yellow"))
-            historial_chat.append(f"Investigador (Resolución Final): {investigador_resolucion}")
-        except Exception as e:
-            live.stop()
-            console.print(f"[bold red]Error al obtener la resolución del Investigador: {e}[/bold red]")
-            investigador_resolucion = "ERROR_RESOLUCION"
-
-    # Juicio Final
-    veredicto = ""
-    with Live(Spinner("dots", text=f"[bold green]Narrador ({args.model_narrador}) emitiendo veredicto...[/bold green]"), console=console, transient=True) as live:
-        try:
-            raw_veredicto = await narrador_provider.generate_text(
-                system_prompt=PROMPT_SISTEMA_NARRADOR, # Solo el prompt del narrador para el juicio
-                user_prompt=PROMPT_NARRADOR_JUEZ.format(
-                    solucion_secreta=solucion_secreta,
-                    historial_chat="\n".join(historial_chat) + f"\nResolución del Investigador: {investigador_resolucion}"
-                )
-            )
-            if raw_veredicto.upper().strip() in ["GANADOR", "PERDEDOR"]:
-                veredicto = raw_veredicto.upper().strip()
-            else:
-                veredicto = "PERDEDOR" # Forzar a un veredicto válido
-            live.stop()
-            console.print(f"\n[bold yellow]Veredicto: {veredicto}[/bold yellow]")
-        except Exception as e:
-            live.stop()
-            console.print(f"[bold red]Error al emitir veredicto: {e}[/bold red]")
-            veredicto = "ERROR"
-
-    # Guardado
-    os.makedirs("./historial_partidas", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"./historial_partidas/partida_{timestamp}.md"
-
-    mermaid_content = f"""
-graph TD
-    subgraph Misterio
-        A[Enigma] --> B(Solución Secreta)
-    end
-
-    subgraph Investigación
-        B -- Conocida por Narrador --> C(Narrador)
-        A -- Conocida por Investigador --> D(Investigador)
-    end
-
-    subgraph Turnos
-"""
-    for i in range(0, len(historial_chat), 2):
-        if i + 1 < len(historial_chat): # Ensure there's a corresponding answer
-            question = historial_chat[i].replace("Investigador: ", "")
-            answer = historial_chat[i+1].replace("Narrador: ", "")
-            mermaid_content += f"        D -- Pregunta {i//2 + 1}: {question} --> C\n"
-            mermaid_content += f"        C -- Respuesta {i//2 + 1}: {answer} --> D\n"
-        else:
-            console.print(f"[bold red]Advertencia: Historial de chat incompleto en el turno {i//2 + 1}. Se omitirá del diagrama.[/bold red]")
-
-    mermaid_content += f"""
-    end
-
-    subgraph Resultado
-        D -- Veredicto: {veredicto} --> E(Fin de Partida)
-    end
-"""
-
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("# BlackStory AI - Transcripción de Partida\n\n")
-        f.write(f"**Fecha:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"**Narrador:** {args.provider_narrador} ({args.model_narrador})\n")
-        f.write(f"**Investigador:** {args.provider_investigador} ({args.model_investigador})\n")
-        f.write(f"**Turnos:** {args.turnos}\n\n")
-        f.write(f"## Enigma\n{enigma}\n\n")
-        f.write(f"## Solución Secreta\n{solucion_secreta}\n\n")
-        f.write("## Historial de Chat\n")
-        for line in historial_chat:
-            f.write(f"- {line}\n")
-        f.write(f"\n## Veredicto Final\n{veredicto}\n\n")
-        f.write("## Diagrama de Flujo (Mermaid)\n")
-        f.write("```mermaid\n")
-        f.write(mermaid_content)
-        f.write("```\n")
-
-    console.print(f"\n[bold blue]Transcripción guardada en:[/bold blue] [link=file://{os.path.abspath(filename)}]{filename}[/link]")
+    if args.perfil:
+        console.print(tabla_perfil(metricas))
+    metricas.close()
+    indice.cerrar()
+    for rol, provider in (("Narrador", resiliencia_narrador), ("Investigador", resiliencia_investigador)):
+        resumen = resumen_resiliencia(rol, provider)
+        if resumen:
+            console.print(resumen)
+    for (proveedor, modelo), limitador in limitadores.items():
+        resumen = resumen_limites(proveedor, modelo, limitador)
+        if resumen:
+            console.print(resumen)
+    if cache is not None:
+        console.print(f"Caché: [bold]{cache.hits}[/bold] aciertos, [bold]{cache.misses}[/bold] fallos")
+        cache.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+from ai_providers import AIProvider, call_context
+from game_engine import generar_misterio
+
+# MinHash con 64 permutaciones repartidas en 16 bandas de 4 filas: dos misterios
+# comparten alguna banda con alta probabilidad a partir de ~50% de similitud,
+# y esos candidatos se confirman con la similitud estimada por la firma completa.
+PERMUTACIONES = 64
+BANDAS = 16
+FILAS_POR_BANDA = PERMUTACIONES // BANDAS
+TAMANO_SHINGLE = 3
+UMBRAL_SIMILITUD = 0.7
+
+_PRIMO = (1 << 61) - 1
+_COEFICIENTES = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % (_PRIMO - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _PRIMO,
+    )
+    for i in range(PERMUTACIONES)
+]
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin acentos ni puntuación y con los espacios colapsados."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", texto).split())
+
+
+def firma_minhash(texto_normalizado: str) -> List[int]:
+    palabras = texto_normalizado.split()
+    shingles = {" ".join(palabras[i:i + TAMANO_SHINGLE]) for i in range(max(1, len(palabras) - TAMANO_SHINGLE + 1))}
+    valores = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    return [min((a * v + b) % _PRIMO for v in valores) for a, b in _COEFICIENTES]
+
+
+def _valores_bandas(firma: List[int]) -> List[int]:
+    return [
+        int.from_bytes(hashlib.blake2b(struct.pack(f"<{FILAS_POR_BANDA}Q", *firma[i:i + FILAS_POR_BANDA]), digest_size=8).digest(), "big", signed=True)
+        for i in range(0, PERMUTACIONES, FILAS_POR_BANDA)
+    ]
+
+
+class AlmacenMisterios:
+    """
+    Reserva de misterios ya generados, guardada en un fichero SQLite.
+
+    Los misterios se añaden una sola vez y se marcan como usados al tomarlos, de
+    modo que varios procesos pueden compartir la misma reserva. Al añadir se
+    descartan los duplicados exactos (por huella del texto normalizado) y los
+    casi duplicados (por MinHash con LSH), para que la reserva siga siendo
+    variada con decenas de miles de entradas sin comparar contra todas.
+    """
+
+    def __init__(self, ruta: str, umbral_similitud: float = UMBRAL_SIMILITUD):
+        self.ruta = ruta
+        self.umbral_similitud = umbral_similitud
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._db = sqlite3.connect(ruta, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS misterios (
+                id INTEGER PRIMARY KEY,
+                huella TEXT NOT NULL UNIQUE,
+                enigma TEXT NOT NULL,
+                solucion TEXT NOT NULL,
+                firma BLOB NOT NULL,
+                proveedor TEXT,
+                modelo TEXT,
+                creado REAL NOT NULL,
+                usado REAL
+            );
+            CREATE INDEX IF NOT EXISTS misterios_disponibles ON misterios(usado, id);
+            CREATE TABLE IF NOT EXISTS bandas (
+                banda INTEGER NOT NULL,
+                valor INTEGER NOT NULL,
+                misterio_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bandas_valor ON bandas(banda, valor);
+        """)
+
+    def disponibles(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM misterios WHERE usado IS NULL").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM misterios").fetchone()[0]
+
+    def es_duplicado(self, enigma: str, solucion: str) -> bool:
+        normalizado = normalizar(f"{enigma} {solucion}")
+        if self._db.execute("SELECT 1 FROM misterios WHERE huella = ?", (self._huella(normalizado),)).fetchone():
+            return True
+        return self._casi_duplicado(firma_minhash(normalizado))
+
+    def _huella(self, normalizado: str) -> str:
+        return hashlib.sha256(normalizado.encode("utf-8")).hexdigest()
+
+    def _casi_duplicado(self, firma: List[int]) -> bool:
+        candidatos = set()
+        for banda, valor in enumerate(_valores_bandas(firma)):
+            candidatos.update(fila[0] for fila in self._db.execute(
+                "SELECT misterio_id FROM bandas WHERE banda = ? AND valor = ?", (banda, valor)
+            ))
+        for misterio_id in candidatos:
+            blob = self._db.execute("SELECT firma FROM misterios WHERE id = ?", (misterio_id,)).fetchone()[0]
+            otra = struct.unpack(f"<{PERMUTACIONES}Q", blob)
+            similitud = sum(1 for x, y in zip(firma, otra) if x == y) / PERMUTACIONES
+            if similitud >= self.umbral_similitud:
+                return True
+        return False
+
+    def anadir(self, enigma: str, solucion: str, proveedor: str = "", modelo: str = "", usado: bool = False) -> bool:
+        """Añade un misterio a la reserva. Devuelve False si era un duplicado y se ha descartado."""
+        normalizado = normalizar(f"{enigma} {solucion}")
+        firma = firma_minhash(normalizado)
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            if self._db.execute("SELECT 1 FROM misterios WHERE huella = ?", (self._huella(normalizado),)).fetchone() or self._casi_duplicado(firma):
+                self._db.execute("ROLLBACK")
+                return False
+            ahora = time.time()
+            cursor = self._db.execute(
+                "INSERT INTO misterios (huella, enigma, solucion, firma, proveedor, modelo, creado, usado) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._huella(normalizado), enigma, solucion, struct.pack(f"<{PERMUTACIONES}Q", *firma), proveedor, modelo, ahora, ahora if usado else None),
+            )
+            self._db.executemany(
+                "INSERT INTO bandas (banda, valor, misterio_id) VALUES (?, ?, ?)",
+                [(banda, valor, cursor.lastrowid) for banda, valor in enumerate(_valores_bandas(firma))],
+            )
+            self._db.execute("COMMIT")
+            return True
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def tomar(self) -> Optional[Dict[str, str]]:
+        """Saca el misterio disponible más antiguo y lo marca como usado, o devuelve None si no queda ninguno."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            fila = self._db.execute("SELECT id, enigma, solucion FROM misterios WHERE usado IS NULL ORDER BY id LIMIT 1").fetchone()
+            if fila is not None:
+                self._db.execute("UPDATE misterios SET usado = ? WHERE id = ?", (time.time(), fila[0]))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        if fila is None:
+            return None
+        return {"enigma": fila[1], "solucion": fila[2]}
+
+    def cerrar(self):
+        self._db.close()
+
+
+class ProductorMisterios:
+    """
+    Mantiene la reserva con al menos `reserva` misterios sin usar, generándolos
+    en segundo plano con `concurrencia` llamadas simultáneas al Narrador.
+    `provider` no debe pasar por la caché de respuestas: devolvería siempre el
+    mismo misterio, que la reserva descartaría como duplicado.
+    """
+
+    ESPERA_RESERVA_LLENA = 1.0
+    ESPERA_TRAS_ERROR = 5.0
+
+    def __init__(self, almacen: AlmacenMisterios, provider: AIProvider, reserva: int, concurrencia: int = 1):
+        self.almacen = almacen
+        self.provider = provider
+        self.reserva = reserva
+        self.concurrencia = concurrencia
+        self.generados = 0
+        self.duplicados = 0
+        self.errores = 0
+        # Un relleno que solo encadena errores o duplicados se abandona tras tantos seguidos.
+        self.max_fallos_seguidos = max(10, 3 * reserva)
+        self.abandonado = False
+        self._fallos_seguidos = 0
+        self._en_curso = 0
+        self._tareas: List[asyncio.Task] = []
+
+    async def rellenar(self, continuo: bool = False):
+        """
+        Genera misterios hasta completar la reserva, o hasta `max_fallos_seguidos`
+        errores o duplicados seguidos; con `continuo`, sigue reponiéndolos
+        indefinidamente.
+        """
+        while True:
+            disponibles = self.almacen.disponibles()
+            if not continuo and (disponibles >= self.reserva or self.abandonado):
+                return
+            # Cuenta también los que otros productores ya están generando, para no pasarse de la reserva.
+            if disponibles + self._en_curso >= self.reserva:
+                await asyncio.sleep(self.ESPERA_RESERVA_LLENA)
+                continue
+            self._en_curso += 1
+            try:
+                with call_context(role="narrador", phase="misterio", producer=True):
+                    misterio = await generar_misterio(self.provider)
+            except Exception:
+                misterio = None
+                self.errores += 1
+            finally:
+                self._en_curso -= 1
+            if misterio is not None and self.almacen.anadir(misterio["enigma"], misterio["solucion"], self.provider.provider_name, self.provider.model_name):
+                self.generados += 1
+                self._fallos_seguidos = 0
+                continue
+            if misterio is not None:
+                self.duplicados += 1
+            self._fallos_seguidos += 1
+            if self._fallos_seguidos >= self.max_fallos_seguidos:
+                self.abandonado = True
+            await asyncio.sleep(self.ESPERA_TRAS_ERROR)
+
+    async def ejecutar(self, continuo: bool = False):
+        await asyncio.gather(*(self.rellenar(continuo) for _ in range(self.concurrencia)))
+
+    def iniciar(self):
+        """Arranca la reposición continua en segundo plano."""
+        self._tareas = [asyncio.create_task(self.rellenar(continuo=True)) for _ in range(self.concurrencia)]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
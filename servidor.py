@@ -0,0 +1,477 @@
+"""
+Servidor HTTP local de BlackStory AI: crea partidas bajo petición y emite cada
+paso como un evento estructurado (Server-Sent Events), con las mismas capas de
+proveedores que `main.py` y sin lanzar un proceso por partida.
+
+    python servidor.py --puerto 8080 -pn gemini -mn gemini-2.5-flash -pi ollama -mi gemma3:1b
+
+    POST   /partidas               Crea una partida. Cuerpo JSON opcional con campos de
+                                   ConfigPartida, "streaming" o "reanudar" (id de una partida
+                                   interrumpida). Devuelve su id y la URL de sus eventos.
+    GET    /partidas               Partidas en memoria, en curso y terminadas.
+    GET    /partidas/{id}          Estado de una partida.
+    GET    /partidas/{id}/eventos  Eventos de la partida (text/event-stream): primero los ya
+                                   emitidos (o los posteriores a Last-Event-ID) y luego en vivo.
+    DELETE /partidas/{id}          Cancela una partida en curso.
+    GET    /salud                  Partidas en curso y límites.
+
+Todas las partidas comparten un bucle de eventos, el pool de proveedores (con
+sus conexiones ya abiertas), los limitadores de --rpm/--tpm, la caché y el
+historial. El evento "misterio" solo lleva el enigma; la solución no sale del
+servidor hasta "fin_investigacion".
+"""
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from dataclasses import asdict, fields
+from http import HTTPStatus
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from ai_providers import AIProvider, MetricsRecorder, ProviderPool, RateLimiter, ResponseCache, provider_class
+from game_engine import ConfigPartida, Evento, Partida
+from historial import IndicePartidas, PuntosControl, RegistroPartidas, TIPOS_SIN_GUARDAR
+import main
+from misterios import AlmacenMisterios, ProductorMisterios
+from main import console
+
+# Una petición más lenta o más grande que esto no es de un cliente legítimo.
+PLAZO_PETICION = 10.0
+MAX_CABECERAS = 100
+MAX_CUERPO = 64 * 1024
+# Comentario SSE periódico: mantiene viva la conexión y descubre los clientes que se fueron.
+LATIDO = 15.0
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado: int, mensaje: str, cabeceras: Optional[Dict[str, str]] = None):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.cabeceras = cabeceras or {}
+
+
+class Suscriptor:
+    """
+    Un cliente recibiendo los eventos de una partida, con su propia cola
+    acotada. La partida nunca espera a un cliente lento: si su cola se llena,
+    se descartan los fragmentos (el texto completo llega en el evento final) y,
+    si tampoco cabe un evento completo, se le desconecta. Al volver con
+    Last-Event-ID recupera lo que se perdió.
+    """
+
+    def __init__(self, tam_cola: int):
+        self.cola: asyncio.Queue = asyncio.Queue(tam_cola)
+        self.desbordado = False
+
+    def publicar(self, elemento: Optional[Tuple[int, Evento]]):
+        if self.desbordado:
+            return
+        try:
+            self.cola.put_nowait(elemento)
+        except asyncio.QueueFull:
+            if elemento is not None and elemento[1]["tipo"] == "fragmento":
+                return
+            self.desbordado = True
+
+
+class SesionPartida:
+    """Una partida del servidor: su tarea, los eventos ya emitidos y los clientes que la siguen."""
+
+    def __init__(self, partida: Partida, max_suscriptores: int, tam_cola: int):
+        self.partida = partida
+        self.max_suscriptores = max_suscriptores
+        self.tam_cola = tam_cola
+        # Sin fragmentos ni spinners, para quien se conecta tarde o vuelve a conectarse.
+        self.eventos: List[Tuple[int, Evento]] = []
+        self.suscriptores: Set[Suscriptor] = set()
+        self.tarea: Optional[asyncio.Task] = None
+        self.estado = "en_curso"
+        self._siguiente_id = 1
+
+    async def __call__(self, evento: Evento):
+        elemento = (self._siguiente_id, evento)
+        self._siguiente_id += 1
+        if evento["tipo"] not in TIPOS_SIN_GUARDAR:
+            self.eventos.append(elemento)
+        for suscriptor in self.suscriptores:
+            suscriptor.publicar(elemento)
+
+    def suscribir(self, desde: int) -> Tuple[List[Tuple[int, Evento]], Suscriptor]:
+        """
+        Los eventos posteriores a `desde` ya emitidos y un suscriptor que recibirá
+        los siguientes, terminados siempre por None aunque la partida acabe antes.
+        """
+        if len(self.suscriptores) >= self.max_suscriptores:
+            raise ErrorHTTP(429, f"La partida ya tiene {self.max_suscriptores} clientes conectados.")
+        suscriptor = Suscriptor(self.tam_cola)
+        self.suscriptores.add(suscriptor)
+        if self.estado != "en_curso":
+            suscriptor.publicar(None)
+        return [elemento for elemento in self.eventos if elemento[0] > desde], suscriptor
+
+    def terminar(self, estado: str):
+        self.estado = estado
+        for suscriptor in self.suscriptores:
+            suscriptor.publicar(None)
+
+    def resumen(self) -> Dict[str, Any]:
+        partida = self.partida
+        return {
+            "id": partida.id,
+            "estado": self.estado,
+            "config": asdict(partida.config),
+            "fecha": partida.fecha.isoformat(),
+            "enigma": partida.enigma or None,
+            "turnos_jugados": partida.turnos_jugados,
+            "veredicto": partida.veredicto or None,
+            "turnos_resolucion": partida.turnos_resolucion,
+            "error": partida.error,
+            "eventos": len(self.eventos),
+            "clientes": len(self.suscriptores),
+        }
+
+
+def formato_sse(id_evento: int, evento: Evento) -> bytes:
+    datos = json.dumps(evento, ensure_ascii=False)
+    return f"id: {id_evento}\nevent: {evento['tipo']}\ndata: {datos}\n\n".encode("utf-8")
+
+
+def respuesta_json(estado: int, cuerpo: Any, cabeceras: Optional[Dict[str, str]] = None) -> bytes:
+    datos = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+    lineas = [
+        f"HTTP/1.1 {estado} {HTTPStatus(estado).phrase}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(datos)}",
+        "Connection: close",
+        *(f"{nombre}: {valor}" for nombre, valor in (cabeceras or {}).items()),
+    ]
+    return ("\r\n".join(lineas) + "\r\n\r\n").encode("latin-1") + datos
+
+
+async def leer_peticion(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+    """Método, ruta (sin la query), cabeceras en minúsculas y cuerpo de una petición HTTP/1.1."""
+    linea = (await reader.readline()).decode("latin-1").strip()
+    if not linea:
+        raise ConnectionResetError("Conexión cerrada sin petición")
+    partes = linea.split(" ")
+    if len(partes) != 3:
+        raise ErrorHTTP(400, "Línea de petición no válida.")
+    metodo, ruta, _ = partes
+    cabeceras = {}
+    while True:
+        linea = (await reader.readline()).decode("latin-1")
+        if linea in ("\r\n", "\n", ""):
+            break
+        if len(cabeceras) >= MAX_CABECERAS:
+            raise ErrorHTTP(431, "Demasiadas cabeceras.")
+        nombre, _, valor = linea.partition(":")
+        cabeceras[nombre.strip().lower()] = valor.strip()
+    try:
+        longitud = int(cabeceras.get("content-length", "0"))
+    except ValueError:
+        raise ErrorHTTP(400, "Content-Length no válido.")
+    if longitud > MAX_CUERPO:
+        raise ErrorHTTP(413, f"El cuerpo no puede pasar de {MAX_CUERPO} bytes.")
+    cuerpo = await reader.readexactly(longitud) if longitud > 0 else b""
+    return metodo.upper(), ruta.split("?", 1)[0].rstrip("/") or "/", cabeceras, cuerpo
+
+
+class ServidorPartidas:
+    """
+    Atiende las peticiones HTTP y juega las partidas. Cada partida es una
+    tarea del mismo bucle de eventos y se publica a sus clientes como
+    observadora más, junto al registro del historial.
+    """
+
+    def __init__(self, args, pool: ProviderPool, metricas: MetricsRecorder, cache: Optional[ResponseCache], registro: RegistroPartidas, puntos_control: PuntosControl, almacen_misterios: Optional[AlmacenMisterios] = None):
+        self.args = args
+        self.pool = pool
+        self.metricas = metricas
+        self.cache = cache
+        self.registro = registro
+        self.puntos_control = puntos_control
+        self.almacen_misterios = almacen_misterios
+        self.limitadores: Dict[Tuple[str, str], RateLimiter] = {}
+        self.sesiones: "OrderedDict[str, SesionPartida]" = OrderedDict()
+        self.en_curso = 0
+        self._proveedores: Dict[Tuple[str, str, str], AIProvider] = {}
+
+    def proveedor(self, rol: str, proveedor: str, modelo: str) -> AIProvider:
+        """
+        El proveedor de un rol con todas sus capas, construido una vez y
+        compartido por todas las partidas. El del "productor" de misterios es el
+        del Narrador sin la caché, que le devolvería siempre el mismo misterio.
+        """
+        clave = (rol, proveedor, modelo)
+        if clave not in self._proveedores:
+            respaldos = self.args.respaldo_investigador if rol == "investigador" else self.args.respaldo_narrador
+            resiliente = main.proveedor_resiliente(self.args, self.pool, self.limitadores, proveedor, modelo, respaldos)
+            cache = None if rol == "productor" else self.cache
+            self._proveedores[clave] = main.envolver_proveedor(self.args, resiliente, cache, self.metricas)
+        return self._proveedores[clave]
+
+    def _config(self, cuerpo: Dict[str, Any]) -> ConfigPartida:
+        """La configuración pedida, con los valores de la línea de comandos para lo que no venga."""
+        tipos = {campo.name: campo.type for campo in fields(ConfigPartida)}
+        desconocidos = set(cuerpo) - set(tipos)
+        if desconocidos:
+            raise ErrorHTTP(400, f"Campos desconocidos: {', '.join(sorted(desconocidos))}.")
+        valores = {nombre: cuerpo.get(nombre, getattr(self.args, nombre)) for nombre in tipos}
+        for nombre, valor in valores.items():
+            # bool es subclase de int: `"turnos": true` no es un número de turnos.
+            if not isinstance(valor, tipos[nombre]) or (tipos[nombre] is int and isinstance(valor, bool)):
+                raise ErrorHTTP(400, f"'{nombre}' debe ser de tipo {tipos[nombre].__name__}.")
+        config = ConfigPartida(**valores)
+        if config.turnos < 1 or config.comprobar_cada < 0:
+            raise ErrorHTTP(400, "'turnos' debe ser al menos 1 y 'comprobar_cada' no puede ser negativo.")
+        for proveedor in (config.provider_narrador, config.provider_investigador):
+            if proveedor not in main.PROVEEDORES:
+                raise ErrorHTTP(400, f"Proveedor desconocido '{proveedor}'. Disponibles: {', '.join(main.PROVEEDORES)}.")
+            try:
+                variable = provider_class(proveedor).api_key_env
+            except ImportError as e:
+                raise ErrorHTTP(400, f"El proveedor '{proveedor}' no está instalado: {e}")
+            if variable and not os.getenv(variable):
+                raise ErrorHTTP(400, f"Falta {variable} en el entorno del servidor para usar '{proveedor}'.")
+        return config
+
+    def crear(self, cuerpo: Dict[str, Any]) -> SesionPartida:
+        if self.en_curso >= self.args.max_partidas:
+            raise ErrorHTTP(429, f"Ya hay {self.en_curso} partidas en curso; el límite es {self.args.max_partidas}.", {"Retry-After": "5"})
+        streaming = cuerpo.pop("streaming", True)
+        id_reanudar = cuerpo.pop("reanudar", None)
+        if not isinstance(streaming, bool):
+            raise ErrorHTTP(400, "'streaming' debe ser de tipo bool.")
+        estado = None
+        if id_reanudar is not None:
+            if id_reanudar in self.sesiones and self.sesiones[id_reanudar].estado == "en_curso":
+                raise ErrorHTTP(409, f"La partida '{id_reanudar}' sigue en curso.")
+            try:
+                estado = self.puntos_control.cargar(str(id_reanudar))
+            except ValueError:
+                raise ErrorHTTP(422, f"El punto de control de '{id_reanudar}' no es JSON válido.")
+            if estado is None:
+                raise ErrorHTTP(404, f"No hay ninguna partida sin terminar con id '{id_reanudar}'.")
+            if not isinstance(estado, dict) or not isinstance(estado.get("config"), dict):
+                raise ErrorHTTP(422, f"El punto de control de '{id_reanudar}' no tiene configuración.")
+            cuerpo = estado["config"]
+        config = self._config(cuerpo)
+
+        narrador = self.proveedor("narrador", config.provider_narrador, config.model_narrador)
+        investigador = self.proveedor("investigador", config.provider_investigador, config.model_investigador)
+        opciones = dict(streaming=streaming, almacen_misterios=self.almacen_misterios, puntos_control=self.puntos_control)
+        if estado is None:
+            partida = Partida(config, narrador, investigador, **opciones)
+        else:
+            try:
+                partida = Partida.reanudar(estado, narrador, investigador, **opciones)
+            except (ValueError, KeyError, TypeError) as e:
+                # De otra versión o a medio editar: no se puede continuar, pero no tumba la conexión.
+                raise ErrorHTTP(422, f"No se puede reanudar '{id_reanudar}' desde su punto de control: {e!r}")
+        sesion = SesionPartida(partida, self.args.max_clientes, self.args.cola_eventos)
+        partida.observadores = [sesion, self.registro]
+        self.sesiones[partida.id] = sesion
+        self.sesiones.move_to_end(partida.id)
+        self.en_curso += 1
+        sesion.tarea = asyncio.create_task(self._jugar(sesion))
+        return sesion
+
+    async def _jugar(self, sesion: SesionPartida):
+        partida = sesion.partida
+        estado = "terminada"
+        try:
+            await partida.jugar()
+        except asyncio.CancelledError:
+            estado = "cancelada"
+            self.registro.descartar(partida.id)
+            raise
+        except Exception as e:
+            estado = "error"
+            await sesion({"tipo": "error", "partida": partida.id, "fase": "servidor", "mensaje": str(e)})
+            self.registro.descartar(partida.id)
+            console.print(f"[bold red]Partida {partida.id} abortada: {e}[/bold red]")
+        finally:
+            self.en_curso -= 1
+            sesion.terminar(estado)
+            # Ya están en la transcripción: en un proceso de larga duración no se acumulan.
+            self.metricas.discard_game(partida.id)
+            self._retirar_terminadas()
+
+    def _retirar_terminadas(self):
+        terminadas = [id_partida for id_partida, sesion in self.sesiones.items() if sesion.estado != "en_curso"]
+        for id_partida in terminadas[:max(0, len(terminadas) - self.args.partidas_retenidas)]:
+            del self.sesiones[id_partida]
+
+    def _sesion(self, id_partida: str) -> SesionPartida:
+        sesion = self.sesiones.get(id_partida)
+        if sesion is None:
+            raise ErrorHTTP(404, f"No hay ninguna partida '{id_partida}' en el servidor.")
+        return sesion
+
+    async def atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                metodo, ruta, cabeceras, cuerpo = await asyncio.wait_for(leer_peticion(reader), PLAZO_PETICION)
+                await self._despachar(metodo, ruta, cabeceras, cuerpo, writer)
+            except ErrorHTTP as e:
+                writer.write(respuesta_json(e.estado, {"error": str(e)}, e.cabeceras))
+                await writer.drain()
+            except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError):
+                writer.write(respuesta_json(400, {"error": "Petición incompleta o mal formada."}))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass # El cliente se fue
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _despachar(self, metodo: str, ruta: str, cabeceras: Dict[str, str], cuerpo: bytes, writer: asyncio.StreamWriter):
+        partes = ruta.strip("/").split("/")
+        if partes == ["salud"] and metodo == "GET":
+            respuesta = {"partidas_en_curso": self.en_curso, "max_partidas": self.args.max_partidas, "partidas_en_memoria": len(self.sesiones)}
+            if self.almacen_misterios is not None:
+                respuesta["misterios_disponibles"] = self.almacen_misterios.disponibles()
+        elif partes == ["partidas"] and metodo == "POST":
+            try:
+                datos = json.loads(cuerpo or b"{}")
+            except json.JSONDecodeError:
+                raise ErrorHTTP(400, "El cuerpo debe ser un objeto JSON.")
+            if not isinstance(datos, dict):
+                raise ErrorHTTP(400, "El cuerpo debe ser un objeto JSON.")
+            sesion = self.crear(datos)
+            id_partida = sesion.partida.id
+            writer.write(respuesta_json(201, {**sesion.resumen(), "eventos_url": f"/partidas/{id_partida}/eventos"}, {"Location": f"/partidas/{id_partida}"}))
+            await writer.drain()
+            return
+        elif partes == ["partidas"] and metodo == "GET":
+            respuesta = [sesion.resumen() for sesion in self.sesiones.values()]
+        elif len(partes) == 2 and partes[0] == "partidas" and metodo == "GET":
+            respuesta = self._sesion(partes[1]).resumen()
+        elif len(partes) == 2 and partes[0] == "partidas" and metodo == "DELETE":
+            sesion = self._sesion(partes[1])
+            if sesion.estado != "en_curso":
+                raise ErrorHTTP(409, f"La partida '{partes[1]}' ya ha terminado.")
+            sesion.tarea.cancel()
+            await asyncio.gather(sesion.tarea, return_exceptions=True)
+            self.puntos_control.borrar(partes[1])
+            respuesta = sesion.resumen()
+        elif len(partes) == 3 and partes[0] == "partidas" and partes[2] == "eventos" and metodo == "GET":
+            try:
+                desde = int(cabeceras.get("last-event-id", "0"))
+            except ValueError:
+                raise ErrorHTTP(400, "Last-Event-ID no válido.")
+            await self._transmitir(self._sesion(partes[1]), desde, writer)
+            return
+        elif partes[0] in ("salud", "partidas"):
+            raise ErrorHTTP(405, f"Método {metodo} no permitido en {ruta}.")
+        else:
+            raise ErrorHTTP(404, f"No existe {ruta}.")
+        writer.write(respuesta_json(200, respuesta))
+        await writer.drain()
+
+    async def _transmitir(self, sesion: SesionPartida, desde: int, writer: asyncio.StreamWriter):
+        """Envía los eventos de la partida como text/event-stream hasta que termina o el cliente se va."""
+        pendientes, suscriptor = sesion.suscribir(desde)
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+            )
+            for id_evento, evento in pendientes:
+                writer.write(formato_sse(id_evento, evento))
+                # drain() espera si el cliente no lee: la contrapresión llega hasta su cola.
+                await writer.drain()
+            # Aunque la partida termine mientras tanto, lo que emita sigue en la cola hasta el None.
+            while True:
+                try:
+                    elemento = await asyncio.wait_for(suscriptor.cola.get(), LATIDO)
+                except asyncio.TimeoutError:
+                    writer.write(b": latido\n\n")
+                    await writer.drain()
+                    continue
+                if elemento is None:
+                    return
+                writer.write(formato_sse(*elemento))
+                await writer.drain()
+                if suscriptor.desbordado and suscriptor.cola.empty():
+                    return # Demasiado lento: que vuelva con Last-Event-ID.
+        finally:
+            sesion.suscriptores.discard(suscriptor)
+
+    async def cerrar(self):
+        """Cancela las partidas en curso. Sus puntos de control se conservan para reanudarlas."""
+        tareas = [sesion.tarea for sesion in self.sesiones.values() if sesion.estado == "en_curso"]
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+
+
+async def servir(args):
+    indice = IndicePartidas(args.indice or os.path.join(args.historial, "indice.sqlite"))
+    metricas = MetricsRecorder(args.metricas)
+    registro = RegistroPartidas(args.historial, indice, metricas)
+    puntos_control = PuntosControl(os.path.join(args.historial, "en_curso"))
+    cache = ResponseCache(args.cache, max_bytes=args.cache_max_mb * 1024 * 1024) if args.cache else None
+    pool = ProviderPool(max_connections=args.conexiones_max, max_keepalive_connections=args.conexiones_en_espera)
+    almacen_misterios = AlmacenMisterios(args.misterios) if args.misterios else None
+    servidor = ServidorPartidas(args, pool, metricas, cache, registro, puntos_control, almacen_misterios)
+    # Los proveedores por defecto se crean ya, para que la primera partida no pague su arranque.
+    servidor.proveedor("narrador", args.provider_narrador, args.model_narrador)
+    servidor.proveedor("investigador", args.provider_investigador, args.model_investigador)
+    productor = None
+    if almacen_misterios is not None and args.reserva_misterios > 0:
+        # Repone con el Narrador por defecto; las partidas con otros modelos también toman de la reserva, como en main.py.
+        productor = ProductorMisterios(almacen_misterios, servidor.proveedor("productor", args.provider_narrador, args.model_narrador), args.reserva_misterios, args.productores)
+        productor.iniciar()
+
+    servidor_http = await asyncio.start_server(servidor.atender, args.host, args.puerto)
+    console.print(f"Servidor de partidas en [bold]http://{args.host}:{args.puerto}[/bold] (hasta {args.max_partidas} partidas a la vez)")
+    try:
+        async with servidor_http:
+            await servidor_http.serve_forever()
+    finally:
+        await servidor.cerrar()
+        if productor is not None:
+            await productor.detener()
+        registro.cerrar()
+        await pool.aclose()
+        if almacen_misterios is not None:
+            almacen_misterios.cerrar()
+        metricas.close()
+        indice.cerrar()
+        if cache is not None:
+            cache.close()
+
+
+def main_servidor():
+    load_dotenv()
+    parser = main.crear_parser()
+    parser.description = "Servidor HTTP local de BlackStory AI: partidas bajo petición con sus eventos en streaming (SSE)."
+    grupo = parser.add_argument_group("servidor")
+    grupo.add_argument("--host", default="127.0.0.1", help="Dirección en la que escuchar. (Por defecto: 127.0.0.1, solo esta máquina)")
+    grupo.add_argument("--puerto", type=int, default=8080, help="Puerto HTTP. (Por defecto: 8080)")
+    grupo.add_argument("--max-partidas", type=int, default=32, help="Partidas en curso a la vez; por encima, POST /partidas responde 429. (Por defecto: 32)")
+    grupo.add_argument("--max-clientes", type=int, default=8, help="Clientes conectados a la vez a los eventos de una misma partida. (Por defecto: 8)")
+    grupo.add_argument("--cola-eventos", type=int, default=256, help="Eventos en espera por cliente antes de descartar fragmentos y desconectarlo. (Por defecto: 256)")
+    grupo.add_argument("--partidas-retenidas", type=int, default=100, help="Partidas terminadas que se guardan en memoria para consultarlas y repetir sus eventos. (Por defecto: 100)")
+    args = parser.parse_args()
+    main.comprobar_argumentos(parser, args)
+    if args.solo_rellenar:
+        parser.error("--solo-rellenar no juega partidas; úsalo con main.py.")
+    if min(args.max_partidas, args.max_clientes, args.cola_eventos) < 1 or args.partidas_retenidas < 0:
+        parser.error("--max-partidas, --max-clientes y --cola-eventos deben ser al menos 1, y --partidas-retenidas no puede ser negativo.")
+    if not main.comprobar_claves_api(args):
+        return
+    try:
+        asyncio.run(servir(args))
+    except KeyboardInterrupt:
+        console.print("Servidor detenido. Las partidas interrumpidas se pueden continuar con --reanudar.")
+
+
+if __name__ == "__main__":
+    main_servidor()
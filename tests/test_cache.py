@@ -0,0 +1,61 @@
+import asyncio
+
+from ai_providers import CachedProvider, ResponseCache
+from ai_providers.mock_provider import MockProvider
+from game_engine import ConfigPartida, Partida
+
+
+def cached(cache: ResponseCache, sampled: bool = False, seed: int = 0) -> CachedProvider:
+    return CachedProvider(MockProvider("mock", latency=0, seed=seed), cache, sampled=sampled)
+
+
+def play(provider: CachedProvider, games: int) -> list:
+    async def run():
+        config = ConfigPartida("mock", "mock", "mock", "mock", turnos=2)
+        return [await Partida(config, provider, provider).jugar() for _ in range(games)]
+    return asyncio.run(run())
+
+
+def test_sampled_calls_are_not_cached_by_default():
+    cache = ResponseCache(":memory:")
+    provider = cached(cache)
+    first = asyncio.run(provider.generate_text("system", "user"))
+    second = asyncio.run(provider.generate_text("system", "user"))
+    assert first != second
+    assert cache.hits == cache.misses == 0
+
+
+def test_deterministic_calls_are_cached_by_default():
+    cache = ResponseCache(":memory:")
+    provider = cached(cache)
+    first = asyncio.run(provider.generate_text("system", "user", temperature=0))
+    assert asyncio.run(provider.generate_text("system", "user", temperature=0)) == first
+    assert cache.hits == 1
+
+
+def test_choices_follow_the_backend_default_temperature():
+    cache = ResponseCache(":memory:")
+    provider = cached(cache)
+    asyncio.run(provider.generate_choice("system", "user", ["sí", "no"]))
+    assert cache.misses == 0 # The mock picks at random.
+
+    provider.deterministic_choices = True
+    first = asyncio.run(provider.generate_choice("system", "user", ["sí", "no"]))
+    assert asyncio.run(provider.generate_choice("system", "user", ["sí", "no"])) == first
+    assert cache.hits == 1
+
+
+def test_batch_games_differ_with_the_default_cache():
+    partidas = play(cached(ResponseCache(":memory:")), 4)
+    assert len({partida.enigma for partida in partidas}) == 4
+
+
+def test_sampled_cache_keeps_games_distinct_and_replays_them():
+    cache = ResponseCache(":memory:")
+    primeras = play(cached(cache, sampled=True, seed=1), 3)
+    assert len({partida.enigma for partida in primeras}) == 3
+
+    # Another process with a different seed replays the same games from the cache.
+    repetidas = play(cached(cache, sampled=True, seed=2), 3)
+    assert [partida.enigma for partida in repetidas] == [partida.enigma for partida in primeras]
+    assert [partida.historial_chat for partida in repetidas] == [partida.historial_chat for partida in primeras]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from ai_providers import JsonStreamParser, SchemaError, parse_json
+from ai_providers.mock_provider import MockProvider
+from game_engine import ConfigPartida, Partida
+from game_prompts import ESQUEMA_MISTERIO
+
+
+def feed_by_char(text: str, schema=None) -> JsonStreamParser:
+    parser = JsonStreamParser(schema)
+    for c in text:
+        parser.feed(c)
+    return parser
+
+
+def test_parses_a_chunked_object_with_surrounding_prose():
+    text = 'Aquí tienes:\n```json\n{"enigma": "Un hombre \\"muere\\"", "solucion": "Hielo"}\n```'
+    parser = feed_by_char(text, ESQUEMA_MISTERIO)
+    assert parser.done
+    assert parser.result() == {"enigma": 'Un hombre "muere"', "solucion": "Hielo"}
+
+
+def test_tolerates_trailing_commas_and_raw_newlines():
+    assert parse_json('{"enigma": "dos\nlíneas", "solucion": "x", "pistas": [1, 2,],}') == {
+        "enigma": "dos\nlíneas", "solucion": "x", "pistas": [1, 2],
+    }
+
+
+def test_partial_shows_the_string_being_received():
+    parser = JsonStreamParser(ESQUEMA_MISTERIO)
+    parser.feed('{"enigma": "Un faro')
+    assert parser.partial() == {"enigma": "Un faro"}
+    # An escape sequence cut by the chunk boundary is left out until it completes.
+    parser.feed(' \\u00e1')
+    assert parser.partial() == {"enigma": "Un faro á"}
+    parser.feed(' \\u00')
+    assert parser.partial()["enigma"].startswith("Un faro á")
+
+
+def test_truncated_response_keeps_the_complete_fields():
+    parser = feed_by_char('{"enigma": "Un faro", "solucion": "El farero')
+    assert not parser.done
+    assert parser.result() == {"enigma": "Un faro"}
+
+
+def test_schema_errors_are_raised_as_soon_as_a_value_arrives():
+    parser = JsonStreamParser(ESQUEMA_MISTERIO)
+    with pytest.raises(SchemaError):
+        parser.feed('{"enigma": 3, "solucion": ')
+
+
+def test_missing_required_field_fails_validation():
+    with pytest.raises(SchemaError):
+        parse_json('{"enigma": "Un faro"}', schema=ESQUEMA_MISTERIO)
+
+
+def test_text_without_an_object_is_rejected():
+    with pytest.raises(ValueError, match="Could not parse JSON"):
+        parse_json("Lo siento, no puedo.")
+
+
+def test_streamed_mystery_publishes_only_the_enigma():
+    eventos = []
+
+    async def observar(evento):
+        eventos.append(evento)
+
+    async def run():
+        provider = MockProvider("mock", latency=0, seed=3)
+        config = ConfigPartida("mock", "mock", "mock", "mock", turnos=1)
+        return await Partida(config, provider, provider, observadores=[observar], streaming=True).jugar()
+
+    partida = asyncio.run(run())
+    fragmentos = "".join(e["texto"] for e in eventos if e["tipo"] == "fragmento" and e["fase"] == "misterio")
+    assert fragmentos == partida.enigma
+    assert partida.solucion_secreta not in fragmentos
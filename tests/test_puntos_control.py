@@ -0,0 +1,89 @@
+import asyncio
+import json
+import os
+from dataclasses import asdict
+
+from ai_providers.mock_provider import MockProvider
+from game_engine import ConfigPartida, Partida
+from historial import PuntosControl
+import main
+
+CONFIG = ConfigPartida("mock", "mock", "mock", "mock", turnos=4)
+
+
+class Corte(BaseException):
+    """Simula que el proceso muere a mitad de partida."""
+
+
+def cortar_en_turno(n: int):
+    async def observador(evento):
+        if evento["tipo"] == "turno" and evento["turno"] == n:
+            raise Corte()
+    return observador
+
+
+def partida_interrumpida(puntos: PuntosControl, turno: int) -> Partida:
+    provider = MockProvider("mock", latency=0, seed=7)
+    partida = Partida(CONFIG, provider, provider, observadores=[cortar_en_turno(turno)], puntos_control=puntos)
+    try:
+        asyncio.run(partida.jugar())
+    except Corte:
+        pass
+    return partida
+
+
+def de_otro_proceso(puntos: PuntosControl, id_partida: str):
+    """Hace que el punto de control parezca de un proceso ya muerto en otra máquina."""
+    ruta = os.path.join(puntos.directorio, f"{id_partida}.json")
+    with open(ruta, encoding="utf-8") as f:
+        estado = json.load(f)
+    estado["equipo"] = "otro-equipo"
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(estado, f)
+
+
+def test_reanudar_continua_desde_el_ultimo_turno(tmp_path):
+    puntos = PuntosControl(str(tmp_path))
+    cortada = partida_interrumpida(puntos, turno=3)
+    estado = puntos.cargar(cortada.id)
+    assert estado["fase"] == "investigacion"
+    assert estado["turnos_jugados"] == 2
+
+    provider = MockProvider("mock", latency=0, seed=8)
+    reanudada = asyncio.run(Partida.reanudar(estado, provider, provider, puntos_control=puntos).jugar())
+    assert reanudada.id == cortada.id
+    assert reanudada.enigma == cortada.enigma
+    assert reanudada.turnos_jugados == CONFIG.turnos
+    assert reanudada.historial_chat[:len(estado["historial_chat"])] == estado["historial_chat"]
+    assert reanudada.veredicto
+    assert puntos.cargar(cortada.id) is None
+
+
+def test_pendientes_filtra_y_aparta_los_danados(tmp_path):
+    puntos = PuntosControl(str(tmp_path))
+    cortada = partida_interrumpida(puntos, turno=2)
+    # Los de este mismo proceso siguen vivos: no se reanudan.
+    assert puntos.pendientes() == []
+    de_otro_proceso(puntos, cortada.id)
+    (tmp_path / "roto.json").write_text("{no es json", encoding="utf-8")
+    (tmp_path / "incompleto.json").write_text(json.dumps({"id": "incompleto"}), encoding="utf-8")
+
+    assert [estado["id"] for estado in puntos.pendientes(asdict(CONFIG))] == [cortada.id]
+    assert puntos.pendientes({**asdict(CONFIG), "turnos": 99}) == []
+    assert sorted(os.listdir(tmp_path)) == [f"{cortada.id}.json", "incompleto.json.danado", "roto.json.danado"]
+
+
+def test_un_lote_sustituye_el_punto_de_control_que_no_se_puede_reanudar(tmp_path):
+    puntos = PuntosControl(str(tmp_path))
+    buena = partida_interrumpida(puntos, turno=2)
+    mala = partida_interrumpida(puntos, turno=2)
+    for partida in (buena, mala):
+        de_otro_proceso(puntos, partida.id)
+    ruta_mala = tmp_path / f"{mala.id}.json"
+    estado = json.loads(ruta_mala.read_text(encoding="utf-8"))
+    del estado["enigma"]
+    ruta_mala.write_text(json.dumps(estado), encoding="utf-8")
+
+    provider = MockProvider("mock", latency=0, seed=9)
+    asyncio.run(main.jugar_lote(CONFIG, provider, provider, partidas=3, concurrencia=2, puntos_control=puntos))
+    assert os.listdir(tmp_path) == [f"{mala.id}.json.danado"]
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from ai_providers import RateLimitedProvider, RateLimiter
+from ai_providers.metrics import record_usage
+from ai_providers.mock_provider import MockError, MockProvider
+from ai_providers.ratelimit import PRIORITY_CHOICE, PRIORITY_DEFAULT, TokenBucket
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=60, burst=2)
+    assert bucket.capacity == 2
+    assert bucket.wait_time(1, now=0.0) == 0
+    bucket.take(2, now=0.0)
+    assert bucket.wait_time(1, now=0.0) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=0.5) == pytest.approx(0.5)
+    # Amounts above the capacity only wait for a full bucket.
+    assert bucket.wait_time(10, now=0.5) == pytest.approx(1.5)
+
+
+async def dispatch_order(requests):
+    """Queues `requests` ((name, tokens, priority, flow)) behind a short pause and returns the order they ran in."""
+    limiter = RateLimiter(requests_per_minute=6000)
+    limiter._paused_until = asyncio.get_running_loop().time() + 0.05
+    order = []
+
+    async def call(name, tokens, priority, flow):
+        await limiter.acquire(tokens, priority, flow)
+        order.append(name)
+
+    await asyncio.gather(*(call(*request) for request in requests))
+    return order
+
+
+def test_games_share_the_queue_fairly():
+    order = asyncio.run(dispatch_order([
+        ("a1", 100, PRIORITY_DEFAULT, "a"),
+        ("a2", 100, PRIORITY_DEFAULT, "a"),
+        ("a3", 100, PRIORITY_DEFAULT, "a"),
+        ("b1", 100, PRIORITY_DEFAULT, "b"),
+    ]))
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_choices_go_first():
+    order = asyncio.run(dispatch_order([
+        ("text", 10, PRIORITY_DEFAULT, "a"),
+        ("choice", 10, PRIORITY_CHOICE, "b"),
+    ]))
+    assert order == ["choice", "text"]
+
+
+def test_cancelled_wait_gives_back_the_finish_tag():
+    async def run():
+        limiter = RateLimiter(requests_per_minute=6000)
+        await limiter.acquire(10, flow="a")
+        limiter._paused_until = asyncio.get_running_loop().time() + 10
+        queued = asyncio.create_task(limiter.acquire(50, flow="a"))
+        await asyncio.sleep(0.01)
+        assert limiter._finish_tags["a"] == 60
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert limiter._finish_tags["a"] == 10
+    assert not limiter._queue
+
+
+class SlowProvider(MockProvider):
+    async def generate_text(self, system_prompt, user_prompt, **kwargs):
+        record_usage(100, 0)
+        await asyncio.sleep(10)
+
+
+def test_cancelled_call_is_settled_with_its_real_usage():
+    async def run():
+        limiter = RateLimiter(tokens_per_minute=60000)
+        provider = RateLimitedProvider(SlowProvider("mock", latency=0), limiter)
+        full = limiter.tokens.level
+        call = asyncio.create_task(provider.generate_text("s" * 400, "u", max_tokens=1000))
+        await asyncio.sleep(0.01)
+        assert full - limiter.tokens.level > 1000
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        return full - limiter.tokens.level
+
+    assert asyncio.run(run()) == pytest.approx(100)
+
+
+def test_rate_limit_errors_pause_the_queue():
+    async def run():
+        limiter = RateLimiter(requests_per_minute=6000)
+        provider = RateLimitedProvider(MockProvider("mock", latency=0, seed=0, failure_rate=1.0, failure_status=429), limiter)
+        with pytest.raises(MockError):
+            await provider.generate_text("system", "user")
+        return limiter, asyncio.get_running_loop().time()
+
+    limiter, now = asyncio.run(run())
+    assert limiter.stats["throttled"] == 1
+    assert limiter._paused_until > now
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+import types
+from contextlib import asynccontextmanager
+
+from ai_providers import MetricsRecorder
+from historial import IndicePartidas, PuntosControl, RegistroPartidas
+import main
+from servidor import ServidorPartidas, SesionPartida
+
+
+@asynccontextmanager
+async def servidor_de_prueba(directorio, *opciones: str, max_partidas: int = 8):
+    args = main.crear_parser().parse_args(["-pn", "mock", "-pi", "mock", "--turnos", "3", "--mock-semilla", "1", "--historial", str(directorio), *opciones])
+    args.max_partidas, args.max_clientes, args.cola_eventos, args.partidas_retenidas = max_partidas, 4, 64, 10
+    indice = IndicePartidas(os.path.join(args.historial, "indice.sqlite"))
+    metricas = MetricsRecorder()
+    registro = RegistroPartidas(args.historial, indice, metricas)
+    puntos_control = PuntosControl(os.path.join(args.historial, "en_curso"))
+    servidor = ServidorPartidas(args, main.ProviderPool(), metricas, None, registro, puntos_control)
+    servidor_http = await asyncio.start_server(servidor.atender, "127.0.0.1", 0)
+    try:
+        yield servidor, servidor_http.sockets[0].getsockname()[1]
+    finally:
+        servidor_http.close()
+        await servidor.cerrar()
+        registro.cerrar()
+        await servidor.pool.aclose()
+        indice.cerrar()
+
+
+async def peticion(puerto: int, metodo: str, ruta: str, cuerpo=None, cabeceras: dict = None):
+    """Estado y cuerpo de una petición; el servidor cierra la conexión al terminar cada respuesta."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", puerto)
+    datos = json.dumps(cuerpo).encode() if cuerpo is not None else b""
+    lineas = [f"{metodo} {ruta} HTTP/1.1", "Host: localhost", f"Content-Length: {len(datos)}"]
+    lineas += [f"{nombre}: {valor}" for nombre, valor in (cabeceras or {}).items()]
+    writer.write(("\r\n".join(lineas) + "\r\n\r\n").encode() + datos)
+    respuesta = await asyncio.wait_for(reader.read(), 10)
+    writer.close()
+    cabecera, _, cuerpo_respuesta = respuesta.partition(b"\r\n\r\n")
+    return int(cabecera.split(b" ")[1]), cuerpo_respuesta.decode("utf-8")
+
+
+def eventos_sse(texto: str) -> list:
+    eventos = []
+    for bloque in texto.split("\n\n"):
+        campos = dict(linea.split(": ", 1) for linea in bloque.splitlines() if ": " in linea and not linea.startswith(":"))
+        if "data" in campos:
+            eventos.append((int(campos["id"]), json.loads(campos["data"])))
+    return eventos
+
+
+def test_los_eventos_llegan_hasta_el_fin_y_se_repiten_desde_last_event_id(tmp_path):
+    async def escenario():
+        async with servidor_de_prueba(tmp_path) as (servidor, puerto):
+            estado, cuerpo = await peticion(puerto, "POST", "/partidas", {"turnos": 2})
+            assert estado == 201
+            creada = json.loads(cuerpo)
+            estado, cuerpo = await peticion(puerto, "GET", creada["eventos_url"])
+            assert estado == 200
+            eventos = eventos_sse(cuerpo)
+            tipos = [evento["tipo"] for _, evento in eventos]
+            assert tipos[0] == "inicio" and tipos[-1] == "fin" and "veredicto" in tipos
+            misterio = next(evento for _, evento in eventos if evento["tipo"] == "misterio")
+            assert "solucion" not in misterio
+
+            _, cuerpo = await peticion(puerto, "GET", creada["eventos_url"], cabeceras={"Last-Event-ID": str(eventos[-3][0])})
+            assert eventos_sse(cuerpo) == eventos[-2:]
+            _, cuerpo = await peticion(puerto, "GET", f"/partidas/{creada['id']}")
+            assert json.loads(cuerpo)["estado"] == "terminada"
+
+    asyncio.run(escenario())
+
+
+class EscritorLento:
+    def __init__(self):
+        self.datos = b""
+
+    def write(self, datos: bytes):
+        self.datos += datos
+
+    async def drain(self):
+        await asyncio.sleep(0.02)
+
+
+def test_un_cliente_lento_recibe_lo_emitido_mientras_repasa_los_eventos_anteriores():
+    async def escenario():
+        sesion = SesionPartida(types.SimpleNamespace(), max_suscriptores=4, tam_cola=16)
+        for turno in range(5):
+            await sesion({"tipo": "pregunta", "partida": "x", "turno": turno})
+        escritor = EscritorLento()
+        servidor = ServidorPartidas.__new__(ServidorPartidas)
+        transmision = asyncio.create_task(servidor._transmitir(sesion, 0, escritor))
+        await asyncio.sleep(0.03) # Todavía repasando los anteriores
+        await sesion({"tipo": "veredicto", "partida": "x"})
+        await sesion({"tipo": "fin", "partida": "x"})
+        sesion.terminar("terminada")
+        await asyncio.wait_for(transmision, 5)
+        assert [evento["tipo"] for _, evento in eventos_sse(escritor.datos.decode())][-2:] == ["veredicto", "fin"]
+
+        # Quien llega con la partida ya terminada recibe lo guardado y la conexión se cierra.
+        tardio = EscritorLento()
+        await asyncio.wait_for(servidor._transmitir(sesion, 5, tardio), 5)
+        assert [evento["tipo"] for _, evento in eventos_sse(tardio.datos.decode())] == ["veredicto", "fin"]
+
+    asyncio.run(escenario())
+
+
+def test_peticiones_no_validas_responden_4xx(tmp_path):
+    en_curso = tmp_path / "en_curso"
+    en_curso.mkdir()
+    (en_curso / "roto.json").write_text("{no es json", encoding="utf-8")
+    config = {"provider_narrador": "mock", "model_narrador": "mock", "provider_investigador": "mock", "model_investigador": "mock", "turnos": 3}
+    (en_curso / "viejo.json").write_text(json.dumps({"id": "viejo", "fecha": "2026-01-01T00:00:00", "config": config}), encoding="utf-8")
+
+    async def escenario():
+        async with servidor_de_prueba(tmp_path) as (servidor, puerto):
+            for id_partida, esperado in (("roto", 422), ("viejo", 422), ("no-existe", 404)):
+                estado, cuerpo = await peticion(puerto, "POST", "/partidas", {"reanudar": id_partida})
+                assert estado == esperado, cuerpo
+                assert "error" in json.loads(cuerpo)
+            assert (await peticion(puerto, "POST", "/partidas", {"turnos": "muchos"}))[0] == 400
+            assert servidor.en_curso == 0
+
+    asyncio.run(escenario())
+
+
+def test_por_encima_del_limite_de_partidas_responde_429(tmp_path):
+    async def escenario():
+        async with servidor_de_prueba(tmp_path, "--mock-latencia", "0.2", max_partidas=1) as (servidor, puerto):
+            assert (await peticion(puerto, "POST", "/partidas"))[0] == 201
+            estado, _ = await peticion(puerto, "POST", "/partidas")
+            assert estado == 429
+
+    asyncio.run(escenario())